@@ -0,0 +1,235 @@
+"""
+Benchmarks of CaptureSqlStatements overhead against in-memory sqlite.
+
+For every scenario and capture size it measures:
+
+  * per-statement overhead of the capture against an uninstrumented baseline
+  * peak memory of the capture (tracemalloc, separate run)
+  * finish(), get_stats(), get_slowest() and pp() latency
+
+Results are saved as JSON, so runs of different versions can be compared:
+
+    python benchmarks/bench_capture.py --output bench-new.json
+    python benchmarks/bench_capture.py --sizes 1000,10000,100000,1000000
+    python benchmarks/bench_capture.py --compare bench-old.json --output bench-new.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# setup path dynamically
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, BASE_DIR)
+
+import sqlalchemy
+from sqlalchemy import create_engine, text, insert, Column, Integer, String
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, SamplingPolicy, TimingMode
+
+Base = declarative_base()
+
+SIZES_DEFAULT = (1_000, 10_000, 100_000)
+REPEAT_DEFAULT = 3
+EXECUTEMANY_BATCH = 100
+NR_USERS = 100
+
+# ------------------------------------------------------------
+
+class User(Base):
+    __tablename__ = 'users'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+def create_db():
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [{"id": nr, "name": f"user-{nr}"} for nr in range(1, NR_USERS+1)])
+    return engine
+
+# ------------------------------------------------------------
+# Scenarios - setup(engine) returns function run(n) that executes n statements
+# ------------------------------------------------------------
+
+def scenario_raw_text(engine):
+    conn = engine.connect()
+    stmt = text("select name from users where id = :id")
+
+    def run(n):
+        for nr in range(n):
+            conn.execute(stmt, {"id": nr % NR_USERS + 1}).fetchall()
+    return run, conn.close
+
+
+def scenario_orm_query(engine):
+    session = sessionmaker(bind=engine)()
+
+    def run(n):
+        for nr in range(n):
+            session.query(User).filter(User.id == nr % NR_USERS + 1).first()
+    return run, session.close
+
+
+def scenario_executemany(engine):
+    conn = engine.connect()
+    stmt = insert(User.__table__)
+    rows = [{"name": f"bulk-{nr}"} for nr in range(EXECUTEMANY_BATCH)]
+
+    def run(n):
+        # one executemany call is one statement
+        with conn.begin() as trans:
+            for _ in range(n):
+                conn.execute(stmt, rows)
+            trans.rollback()
+    return run, conn.close
+
+
+SCENARIOS: Dict[str, Callable] = {
+        "raw_text"    : scenario_raw_text,
+        "orm_query"   : scenario_orm_query,
+        "executemany" : scenario_executemany,
+        }
+
+# capture kwargs per mode
+MODES: Dict[str, Callable[[], Dict[str, Any]]] = {
+        "default"  : lambda: {},
+        "server"   : lambda: {"timing": TimingMode.SERVER},
+        "sampling" : lambda: {"sampling": SamplingPolicy(every_nth=100)},
+        }
+
+# ------------------------------------------------------------
+
+def timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def run_once(scenario:str, mode:Optional[str], size:int, trace_memory:bool=False) -> Dict[str, Any]:
+    " mode None - baseline without capture "
+    random.seed(0)
+    engine = create_db()
+    run, cleanup = SCENARIOS[scenario](engine)
+    # warm-up - sqlalchemy compiled cache, sqlite statement cache
+    run(min(size, 100))
+    gc.collect()
+    result: Dict[str, Any] = {}
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        if mode is None:
+            result["run"] = timed(run, size)
+            return result
+
+        capture_stmts = CaptureSqlStatements(engine, **MODES[mode]())
+        result["run"] = timed(run, size)
+        result["finish"] = timed(capture_stmts.finish)
+        if trace_memory:
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            return result
+        result["count"] = capture_stmts.count()
+        result["get_stats"] = timed(lambda: [capture_stmts.get_stats(name)
+                                             for name in ("by_type", "by_table", "by_type_and_table")])
+        result["get_slowest"] = timed(capture_stmts.get_slowest)
+        result["pp"] = timed(capture_stmts.pp, False, lambda *args, **kwargs: None)
+        return result
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        cleanup()
+        engine.dispose()
+
+
+def run_case(scenario:str, mode:str, size:int, repeat:int) -> Dict[str, Any]:
+    " best of repeat for every timing "
+    baseline = min(run_once(scenario, None, size)["run"] for _ in range(repeat))
+    runs = [run_once(scenario, mode, size) for _ in range(repeat)]
+    best = {key: min(run[key] for run in runs) for key in ("run", "finish", "get_stats", "get_slowest", "pp")}
+    peak_memory = run_once(scenario, mode, size, trace_memory=True)["peak_memory"]
+    return {
+            "scenario"                : scenario,
+            "mode"                    : mode,
+            "size"                    : size,
+            "count"                   : runs[0]["count"],
+            "baseline_s"              : baseline,
+            "captured_s"              : best["run"],
+            "overhead_per_stmt_us"    : (best["run"] - baseline) * 1_000_000 / size,
+            "peak_memory_bytes"       : peak_memory,
+            "peak_memory_per_stmt_b"  : peak_memory / size,
+            "finish_s"                : best["finish"],
+            "get_stats_s"             : best["get_stats"],
+            "get_slowest_s"           : best["get_slowest"],
+            "pp_s"                    : best["pp"],
+            }
+
+# ------------------------------------------------------------
+
+def get_case_key(case:Dict[str, Any]) -> str:
+    return f"{case['scenario']}/{case['mode']}/{case['size']}"
+
+
+def compare(old:Dict[str, Any], new:Dict[str, Any], print_cmd:Callable=print):
+    " prints new/old ratio of main metrics per case, > 1.0 means slower / bigger "
+    metrics = ("overhead_per_stmt_us", "peak_memory_per_stmt_b", "finish_s", "get_stats_s", "pp_s")
+    old_cases = {get_case_key(case): case for case in old["cases"]}
+    print_cmd(f"{'case':40s} " + " ".join(f"{metric:>22s}" for metric in metrics))
+    for case in new["cases"]:
+        old_case = old_cases.get(get_case_key(case))
+        if old_case is None:
+            continue
+        ratios = [(case[metric] / old_case[metric]) if old_case[metric] else float("nan") for metric in metrics]
+        print_cmd(f"{get_case_key(case):40s} " + " ".join(f"{ratio:22.2f}" for ratio in ratios))
+
+
+def main(argv:Optional[List[str]]=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES_DEFAULT)),
+                        help="comma separated capture sizes (number of statements)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated scenarios")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated capture modes")
+    parser.add_argument("--repeat", type=int, default=REPEAT_DEFAULT, help="best of N runs")
+    parser.add_argument("--output", default=None, help="save results to JSON file")
+    parser.add_argument("--compare", default=None, help="JSON file of the previous run to compare with")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    cases = []
+    for scenario in args.scenarios.split(","):
+        for mode in args.modes.split(","):
+            for size in sizes:
+                case = run_case(scenario, mode, size, args.repeat)
+                cases.append(case)
+                print(f"{get_case_key(case):40s} overhead {case['overhead_per_stmt_us']:8.2f} us/stmt, "
+                      f"memory {case['peak_memory_per_stmt_b']:8.1f} B/stmt, finish {case['finish_s']:.4f} s, "
+                      f"get_stats {case['get_stats_s']:.4f} s, pp {case['pp_s']:.4f} s")
+
+    results = {
+            "created"    : datetime.now().isoformat(),
+            "python"     : platform.python_version(),
+            "sqlalchemy" : sqlalchemy.__version__,
+            "platform"   : platform.platform(),
+            "repeat"     : args.repeat,
+            "cases"      : cases,
+            }
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump(results, fout, indent=2)
+    if args.compare:
+        with open(args.compare) as fin:
+            compare(json.load(fin), results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
-from .base import CaptureSqlStatements, SqlStatement
-
-__all__ = [CaptureSqlStatements, SqlStatement]
+from .base import CaptureSqlStatements, SqlStatement, TimingMode
+from .sampling import SamplingPolicy
+from .parameters import ParamsPolicy
+from .budgets import QueryBudget
+from .rows import RowsMode
+from .collector import CaptureCollector
 
+__all__ = ["CaptureSqlStatements", "SqlStatement", "TimingMode", "SamplingPolicy", "ParamsPolicy", "QueryBudget", "RowsMode",
+           "CaptureCollector"]
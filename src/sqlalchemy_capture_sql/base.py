@@ -4,163 +4,471 @@ TODO: provide some better examples with plain old sql-s w/wo ORM
 """
 import logging
 import sqlite3
+import sys
+import threading
+import time
+from asyncio import current_task
+from contextvars import ContextVar
+from contextlib import contextmanager
+from bisect import bisect_left
+from heapq import merge, nlargest
 
 import enum
 from typing import List, Any, Dict, Optional, Callable, Tuple
-from datetime import datetime
+from datetime import datetime, timedelta
 from dataclasses import dataclass, field
-from collections import Counter
+from collections import Counter, deque
 
 try:
     from sqlalchemy import event
 except ImportError as ex:
     raise Exception(f"This package requires some SQLAlchemy preinstalled (pip install sqlalchemy?). Error: {ex}")
 
+from . import parsing
+from .parsing import StatementInfo
+from .stats import Stat, StatName, StatsAggregator, DURATION_FIELDS, ROWS_FIELDS
+from .call_sites import CallSite, get_call_site_resolver
+from .nplusone import NPlusOneReport, detect_n_plus_one, N_PLUS_ONE_THRESHOLD, N_PLUS_ONE_SQL_TYPES
+from .sampling import SamplingPolicy
+from .dispatcher import get_dispatcher
+from .spans import Span, get_span_name
+from .snapshot import CaptureSnapshot
+from .pool import PoolCollector, PoolStats
+from .orm import SessionCollector, SessionStats, TransactionInfo, FlushInfo, get_session_target
+from .explain import explain_statement
+from .collector import SpoolWriter
+from .store import CaptureStore, STORE_BATCH_SIZE_DEFAULT
+from .export import save_chrome_trace, save_otlp, OTLP_SERVICE_NAME_DEFAULT
+from .rows import RowsMode, get_rowcount, get_row_size, set_counting_fetch_strategy, CursorFetchStrategy
+from .parameters import (ParamsPolicy, retain_parameters, get_params_rows,
+                         PARAMS_MAX_ROWS_DEFAULT, PARAMS_MAX_REPR_DEFAULT)
+
 def timedelta_to_seconds(diff):
     return diff.days * 24 * 60 * 60 + diff.seconds + diff.microseconds / 1_000_000.0
 
+def ns_to_seconds(diff_ns):
+    return diff_ns / 1_000_000_000.0
+
+# wall clock <-> perf_counter_ns() pair, used to convert monotonic timestamps
+# to datetime objects only when someone asks for them
+_CLOCK_ANCHOR = (datetime.now(), time.perf_counter_ns())
+
+def ns_to_datetime(tst_ns):
+    anchor_dt, anchor_ns = _CLOCK_ANCHOR
+    return anchor_dt + timedelta(microseconds=(tst_ns - anchor_ns) / 1_000.0)
+
+# ------------------------------------------------------------
+
+class TimingMode(str, enum.Enum):
+    # duration = time between 2 captured statements, only before_cursor_execute
+    # is used (default, the original behaviour)
+    BETWEEN_STATEMENTS = "between_statements"
+    # additionally hooks after_cursor_execute and handle_error so duration is
+    # split to server_duration (actual DB execution) and client_duration (time
+    # spent in python until the next statement)
+    SERVER = "server"
+
+def get_current_owner():
+    " current asyncio task, or the current thread when no loop is running "
+    try:
+        task = current_task()
+    except RuntimeError:
+        task = None
+    return task if task is not None else threading.current_thread()
+
+
+def is_owner_done(owner) -> bool:
+    " asyncio task done / thread ended "
+    return owner.done() if hasattr(owner, "done") else not owner.is_alive()
+
 # ============================================================
 # ============================================================
 # ============================================================
 
-@dataclass
 class SqlStatement:
+    """
+    One captured statement. Plain class with __slots__ and no derived strings
+    - captures can hold hundreds of thousands of these.
+    """
+    __slots__ = ("idx", "statement", "tst_started_ns", "tst_next_ns", "tst_ended_ns",
+                 "duration", "server_duration", "client_duration", "error",
+                 "parameters", "executemany", "params_rows", "call_site", "sampled",
+                 "rowcount", "rows_fetched", "bytes_fetched", "plan", "span",
+                 "transaction", "flush")
+
     idx: int # unique id=1... (index0-1) in final list
-    statement: str = field(repr=False)
+    statement: str
     # context
-    tst_started : datetime = field(repr=False)
+    tst_started_ns : int # time.perf_counter_ns()
     # of the next statement
-    tst_next: Optional[datetime] = field(init=False, default=None, repr=False)
-    duration: Optional[float] = field(init=False, default=None)
-    stmt_repr: str = field(init=False) # representation
-    parameters: Any # List|Tuple|Dict[str, Any]
+    tst_next_ns: Optional[int]
+    # after_cursor_execute / handle_error - TimingMode.SERVER only
+    tst_ended_ns: Optional[int]
+    # time between this and the next statement (= server + client)
+    duration: Optional[float]
+    # TimingMode.SERVER only - DB execution time and python time after it
+    server_duration: Optional[float]
+    client_duration: Optional[float]
+    error: Optional[str]
+    parameters: Any # List|Tuple|Dict[str, Any], str or None - see ParamsPolicy
     executemany: bool
-    sql_type: str = field(init=False) # Enum?
-    first_table: str = field(init=False) # Enum?
+    # executemany only - number of rows (parameter sets) in the batch
+    params_rows: Optional[int]
+    # application frame that issued the statement - capture_call_sites=True only
+    call_site: Optional[CallSite]
+    # False - sampling candidate, retained only if slow (SamplingPolicy.keep_slower_than_ms)
+    sampled: bool
+    # capture_rows only - cursor.rowcount, rows fetched so far and their approx. size, see rows.py
+    rowcount: Optional[int]
+    rows_fetched: Optional[int]
+    bytes_fetched: Optional[int]
+    # explain_slowest() only - explain.ExplainPlan
+    plan: Optional[Any]
+    # name of the capture span the statement was issued in, see CaptureSqlStatements.span()
+    span: Optional[str]
+    # capture_session only - idx of orm.TransactionInfo / orm.FlushInfo
+    transaction: Optional[int]
+    flush: Optional[int]
 
-    def __post_init__(self):
-        # default
-        sql = self.statement
-        flds = [f.upper() for f in sql.split()[:20]]
-        self.sql_type = flds[0]
-
-        if self.sql_type in ("SELECT",):
-            from_idx = sql.upper().find("FROM ")
-            if from_idx>0:
-                self.first_table = sql[from_idx:].split()[1].upper()
-                sql = self.sql_type + " " + sql[from_idx:]
-            else:
-                # give me something, first column
-                self.first_table = flds[1]
-        elif flds[:2]==["INSERT", "INTO"]:
-            self.first_table = flds[2]
-        elif flds[:2]==["DELETE", "FROM"]:
-            self.first_table = flds[2]
-        elif flds[:1]==["UPDATE",]:
-            self.first_table = flds[1]
-        else:
-            self.first_table = "<unknown>"
+    def __init__(self, idx:int, statement:str, tst_started_ns:int, parameters:Any, executemany:bool,
+                 call_site:Optional[CallSite]=None, sampled:bool=True, params_rows:Optional[int]=None,
+                 span:Optional[str]=None, transaction:Optional[int]=None, flush:Optional[int]=None):
+        self.idx = idx
+        self.statement = statement
+        self.tst_started_ns = tst_started_ns
+        self.tst_next_ns = None
+        self.tst_ended_ns = None
+        self.duration = None
+        self.server_duration = None
+        self.client_duration = None
+        self.error = None
+        self.parameters = parameters
+        self.executemany = executemany
+        self.params_rows = params_rows
+        self.call_site = call_site
+        self.sampled = sampled
+        self.rowcount = None
+        self.rows_fetched = None
+        self.bytes_fetched = None
+        self.plan = None
+        self.span = span
+        self.transaction = transaction
+        self.flush = flush
+
+    # parsed lazily, see parsing.parse_statement() - cached per statement string
+
+    @property
+    def info(self) -> StatementInfo:
+        return parsing.parse_statement(self.statement)
+
+    @property
+    def stmt_repr(self) -> str: # representation
+        return self.info.stmt_repr
+
+    @property
+    def sql_type(self) -> str: # Enum?
+        return self.info.sql_type
+
+    @property
+    def first_table(self) -> str: # Enum?
+        return self.info.first_table
+
+    @property
+    def tables(self) -> Tuple[str, ...]:
+        return self.info.tables
 
-        self.stmt_repr = sql
+    @property
+    def fingerprint(self) -> str:
+        return self.info.fingerprint
 
-    def set_tst_next(self, tst):
-        self.tst_next = tst
-        diff = (self.tst_next - self.tst_started)
-        self.duration = timedelta_to_seconds(diff)
+    @property
+    def target_table(self) -> Optional[str]:
+        return self.info.target_table
+
+    def __repr__(self):
+        return (f"SqlStatement(idx={self.idx}, duration={self.duration}, "
+                + (f"server_duration={self.server_duration}, client_duration={self.client_duration}, "
+                   if self.server_duration is not None else "")
+                + (f"error={self.error}, " if self.error else "")
+                + f"stmt_repr={self.stmt_repr!r}, parameters={self.parameters!r}, executemany={self.executemany}, "
+                f"sql_type={self.sql_type!r}, first_table={self.first_table!r}"
+                + (f", call_site='{self.call_site}'" if self.call_site else "")
+                + (f", span={self.span!r}" if self.span is not None else "")
+                + (f", transaction={self.transaction}" if self.transaction is not None else "")
+                + (f", flush={self.flush}" if self.flush is not None else "")
+                + ")")
+
+    @property
+    def tst_started(self) -> datetime:
+        return ns_to_datetime(self.tst_started_ns)
+
+    @property
+    def tst_next(self) -> Optional[datetime]:
+        return ns_to_datetime(self.tst_next_ns) if self.tst_next_ns is not None else None
+
+    def set_tst_ended(self, tst_ns:int, error:Optional[str]=None):
+        self.tst_ended_ns = tst_ns
+        self.server_duration = ns_to_seconds(tst_ns - self.tst_started_ns)
+        self.error = error
+
+    def set_tst_next(self, tst_ns:int):
+        self.tst_next_ns = tst_ns
+        self.duration = ns_to_seconds(tst_ns - self.tst_started_ns)
+        if self.tst_ended_ns is not None:
+            self.client_duration = ns_to_seconds(tst_ns - self.tst_ended_ns)
 
     def report_short(self):
         # do 80 znakova
         out = []
-        out.append("%.4f" % (self.duration))
+        # duration of the last statement is not known before finish()
+        out.append("%.4f" % (self.duration) if self.duration is not None else "     ...")
+        if self.server_duration is not None:
+            out.append("(db %.4f)" % (self.server_duration))
         sql = "%s" % (self.stmt_repr[:70].replace("\n", " "),)
         out.append(sql)
 
-        if isinstance(self.parameters, dict):
-            params = self.parameters.values()
-        elif isinstance(self.parameters, (list, tuple)):
-            params = self.parameters
+        parameters = self.parameters
+        rows_info = ""
+        if self.executemany and isinstance(parameters, (list, tuple)) and parameters:
+            # show only the first row of the batch
+            parameters = parameters[0]
+        if self.params_rows is not None:
+            rows_info = f" ({self.params_rows} rows)"
+
+        if parameters is None:
+            params = []
+        elif isinstance(parameters, str):
+            # ParamsPolicy.REPR / HASH
+            params = [parameters]
+        elif isinstance(parameters, dict):
+            params = parameters.values()
+        elif isinstance(parameters, (list, tuple)):
+            params = parameters
         else:
-            params = [self.parameters.values]
-        if params:
-            params = "\n     <- " + repr("+".join([str(p) for p in params]))[:70]
+            params = [parameters]
+        if params or rows_info:
+            params = "\n     <- " + repr("+".join([str(p) for p in params]))[:70] + rows_info
             out.append(params)
         return " ".join(out)
 
 # ------------------------------------------------------------
 
-@dataclass
-class Stat:
-    key: str
-    cnt: int
-    duration: float
-    statement: Optional[SqlStatement] = None
+TOP_DEFAULT = 20
+TOP_DEFAULT_SLOWEST = 5
+# number of slowest statements kept per measure for get_slowest()
+KEEP_SLOWEST_DEFAULT = 100
+TAB = " " * 4
 
 # ------------------------------------------------------------
 
-class StatName(str, enum.Enum):
-    BY_TYPE           = "by_type"
-    BY_TABLE          = "by_table"
-    BY_TYPE_AND_TABLE = "by_type_and_table"
+class _Buffer:
+    """
+    Statements captured in one thread / asyncio task - the last one in the
+    buffer gets its duration when the next one in the same buffer arrives,
+    i.e. durations are chained per thread / task, not per connection.
+    owner - asyncio task or thread, see get_current_owner().
+    statements - own list, in ring-buffer mode the capture deque shared by all buffers.
+    last - the last statement in the chain, with sampling it may be not in statements
+    """
+    __slots__ = ("owner", "statements", "last")
 
-# ------------------------------------------------------------
-
-TOP_DEFAULT = 20
-TOP_DEFAULT_SLOWEST = 5
-TAB = " " * 4
+    def __init__(self, owner, statements):
+        self.owner = owner
+        self.statements = statements
+        self.last = None
 
 # ------------------------------------------------------------
 
 @dataclass
 class CaptureSqlStatements:
 
-    engine: Any # TODO: typing - sqlalchemy engine
+    engine: Any # TODO: typing - sqlalchemy engine, AsyncEngine is supported too
     statements: List[SqlStatement] = field(default_factory=list)
+    timing: TimingMode = TimingMode.BETWEEN_STATEMENTS
+    # ring-buffer mode - keep only last N statements, stats still cover all
+    max_statements: Optional[int] = None
+    keep_slowest: int = KEEP_SLOWEST_DEFAULT
+    # find application frame which issued the statement (see call_sites.py)
+    capture_call_sites: bool = False
+    # additional path prefixes treated as library code, e.g. own db helpers
+    call_site_skip_prefixes: Tuple[str, ...] = ()
+    # low-overhead mode - not every statement is retained, see sampling.py
+    sampling: Optional[SamplingPolicy] = None
+    # what is kept in SqlStatement.parameters, see parameters.py
+    params_policy: ParamsPolicy = ParamsPolicy.KEEP
+    params_max_rows: int = PARAMS_MAX_ROWS_DEFAULT
+    params_max_repr: int = PARAMS_MAX_REPR_DEFAULT
+    # connection pool events - checkout wait, connect time etc., see pool.py
+    capture_pool: bool = False
+    # rowcount / rows fetched / bytes fetched per statement, see rows.py
+    capture_rows: RowsMode = RowsMode.NONE
+    # ORM Session transactions and flushes - True for all sessions, or Session
+    # instance / sessionmaker / scoped_session, see orm.py
+    capture_session: Any = False
+    # multi-process mode - aggregates are written to own file in spool_dir,
+    # every spool_interval seconds and on finish(), see collector.py
+    spool_dir: Optional[str] = None
+    spool_interval: Optional[float] = None
+    # added to process label (hostname:pid) in collector reports
+    spool_name: Optional[str] = None
+    # sqlite3 file retained statements are written to during the capture, see store.py
+    store_path: Optional[str] = None
+    store_batch_size: int = STORE_BATCH_SIZE_DEFAULT
     started : datetime = field(init=False, default_factory=datetime.now)
+    started_ns : int = field(init=False, default_factory=time.perf_counter_ns)
     finished : Optional[datetime] = field(init=False, default=None)
     decorated_fn : Callable = field(init=False)
-    connection : sqlite3.Connection = field(init=False)
 
     AGG_FIELDS = (
             "cnt", 
             "duration",
             )
+    AGG_FIELDS_SERVER = (
+            "cnt", 
+            "duration",
+            "server_duration",
+            "client_duration",
+            )
+    # latency distribution per group - of server_duration when timing=server
+    LATENCY_FIELDS = (
+            "cnt", 
+            "mean",
+            "p50",
+            "p90",
+            "p99",
+            "max_latency",
+            )
     FMT_MAP = {
             "cnt": "%3d", 
+            "cnt_measured": "%3d", 
             "duration" : "%7.3f s",
+            "server_duration" : "%7.3f s",
+            "client_duration" : "%7.3f s",
+            "min_duration" : "%7.4f s",
+            "max_duration" : "%7.4f s",
+            "mean" : "%7.4f s",
+            "p50" : "%7.4f s",
+            "p90" : "%7.4f s",
+            "p99" : "%7.4f s",
+            "max_latency" : "%7.4f s",
+            "rowcount" : "%9d",
+            "rows_fetched" : "%9d",
+            "bytes_fetched" : "%11d",
             }
 
     STATS_NAME_MAP = {
             StatName.BY_TYPE           : "sql_type",
             StatName.BY_TABLE          : "first_table",
             StatName.BY_TYPE_AND_TABLE : "sql_type, first_table",
+            StatName.BY_FINGERPRINT    : "fingerprint",
+            StatName.BY_SPAN           : "span",
+            StatName.BY_TOUCHED_TABLE          : "tables",
+            StatName.BY_TYPE_AND_TOUCHED_TABLE : "sql_type, tables",
             }
 
 
     def __post_init__(self):
         # https://docs.sqlalchemy.org/en/13/orm/session_events.html - nema listano, već ovdje (našao u source-u da se zovu)
         # https://docs.sqlalchemy.org/en/13/core/events.html?highlight=before_cursor_execute#sqlalchemy.events.ConnectionEvents.before_cursor_execute
-        self.decorated_fn = event.listens_for(self.engine, 'before_cursor_execute')\
-                                             (self.capture_sa_statement_listener)
-        self.connection = sqlite3.connect(":memory:")
-        self._cur = self.connection.cursor()
-        self._cur.execute("create table sql_statement(id int primary key, duration float, first_table varchar, sql_type varchar)")
-        self.connection.commit()
+        self.timing = TimingMode(self.timing)
+        self.params_policy = ParamsPolicy(self.params_policy)
+        self.capture_rows = RowsMode(self.capture_rows)
+        self._count_fetched = self.capture_rows in (RowsMode.FETCHED, RowsMode.FETCHED_BYTES)
+        if self._count_fetched and CursorFetchStrategy is None:
+            raise Exception(f"capture_rows={self.capture_rows.value} is not supported by this SQLAlchemy version")
+        if self.keep_slowest < 1:
+            raise Exception(f"keep_slowest should be positive integer, got: {self.keep_slowest}")
+        if self.max_statements is not None:
+            if self.max_statements < 1:
+                raise Exception(f"max_statements should be positive integer, got: {self.max_statements}")
+            self.statements = deque(self.statements, maxlen=self.max_statements)
+        if self.spool_interval is not None and (not self.spool_dir or self.spool_interval <= 0):
+            raise Exception(f"spool_interval should be positive number of seconds and requires spool_dir, "
+                            f"got: {self.spool_interval}")
+        # number of statements seen - in ring-buffer mode more than retained
+        self._nr_seen = len(self.statements)
+        # guards aggregates and row ids - listeners can be called from many threads
+        self._lock = threading.Lock()
+        # per thread / asyncio task buffers, merged to self.statements on finish()
+        self._buffer_var: ContextVar = ContextVar(f"capture_sql_buffer_{id(self)}")
+        self._buffers: List[_Buffer] = [_Buffer(get_current_owner(), self.statements)]
+        # statement lists of buffers of ended threads / tasks, see _retire_buffers()
+        self._retired: List[List[SqlStatement]] = []
+        # ring-buffer mode - statements of many buffers in the shared deque, not ordered by idx
+        self._unordered = False
+        self._buffer_var.set(self._buffers[0])
+        self._stats = StatsAggregator(
+                keep_slowest=self.keep_slowest,
+                measures=DURATION_FIELDS if self.timing == TimingMode.SERVER else ("duration",),
+                latency_measure="server_duration" if self.timing == TimingMode.SERVER else "duration")
+        self._store = (CaptureStore(self.store_path, started=self.started, started_ns=self.started_ns,
+                                    batch_size=self.store_batch_size, params_max_repr=self.params_max_repr)
+                       if self.store_path else None)
+        self._call_site_resolver = (get_call_site_resolver(tuple(self.call_site_skip_prefixes))
+                                    if self.capture_call_sites else None)
+        # time spent in listeners - measured in sampling mode only
+        self._overhead_ns = 0
+        # AsyncEngine - events are available on sync engine only
+        self._event_target = getattr(self.engine, "sync_engine", self.engine)
+        # current span, see span()
+        self._span_var: ContextVar = ContextVar(f"capture_sql_span_{id(self)}", default=None)
+        self.spans: List[Span] = []
+        # listeners are registered once per engine and shared by all captures, see dispatcher.py
+        self._dispatcher = get_dispatcher(self._event_target)
+        self.decorated_fn = self.capture_sa_statement_listener
+        self._listeners = [("before_cursor_execute", self.decorated_fn)]
+        # execution context id -> statement waiting for after_cursor_execute
+        self._pending: Dict[int, SqlStatement] = {}
+        # statements are paired with after_cursor_execute
+        self._track_after_execute = self.timing == TimingMode.SERVER or self.capture_rows != RowsMode.NONE
+        if self._track_after_execute:
+            # https://docs.sqlalchemy.org/en/20/core/events.html#sqlalchemy.events.ConnectionEvents.after_cursor_execute
+            # https://docs.sqlalchemy.org/en/20/core/events.html#sqlalchemy.events.DialectEvents.handle_error
+            self._listeners.extend((("after_cursor_execute", self.capture_sa_after_execute_listener),
+                                    ("handle_error", self.capture_sa_error_listener)))
+        for name, fn in self._listeners:
+            self._dispatcher.subscribe(name, fn)
+        self._pool_collector = PoolCollector(self._event_target) if self.capture_pool else None
+        self._session_collector = (SessionCollector(get_session_target(self.capture_session), self._event_target)
+                                   if self.capture_session else None)
+        # the last explain_slowest() result
+        self._explained: List[Stat] = []
+        self._spool_writer = (SpoolWriter(self, self.spool_dir, interval=self.spool_interval, name=self.spool_name)
+                              if self.spool_dir else None)
 
 
     def __del__(self):
-        if hasattr(self, "_cur"):
+        if getattr(self, "_store", None) is not None:
             try:
-                self._cur.close()
+                self._store.close()
             except:
                 pass
 
-        if hasattr(self, "_con"):
-            try:
-                self.connection.close()
-            except:
-                pass
+    def get_store(self) -> CaptureStore:
+        """
+        queryable statements, see store.py. With store_path the file being
+        written, otherwise sqlite3 in memory database filled with retained
+        statements - created on first access, not needed for stats. During
+        capture statements are added when their duration is known, like to
+        the file.
+        """
+        if self._store is None:
+            store = CaptureStore(started=self.started, started_ns=self.started_ns,
+                                 params_max_repr=self.params_max_repr)
+            with self._lock:
+                if self._store is not None:
+                    return self._store
+                # the last ones in chains are added by _close_chain()
+                open_ids = {id(buffer.last) for buffer in self._buffers if buffer.last is not None}
+                statements = [stmt for stmt in self._get_statements() if id(stmt) not in open_ids]
+                self._store = store
+            store.add_many(statements)
+        return self._store
 
-        return self
+    @property
+    def connection(self) -> sqlite3.Connection:
+        " sqlite3 database of get_store() - sql_statement, statement_text and statement_table tables "
+        return self.get_store().connection
 
     # ------------------------------------------------------------
     # Capture logic implemenntation 
@@ -173,144 +481,690 @@ class CaptureSqlStatements:
         self.finish()
 
     def __iter__(self):
-        for stmt in self.statements:
+        for stmt in self._get_statements():
             yield stmt
 
+    def _get_buffer(self) -> _Buffer:
+        owner = get_current_owner()
+        buffer = self._buffer_var.get(None)
+        if buffer is None or buffer.owner is not owner:
+            # new thread or asyncio task - tasks inherit context of the parent.
+            # Ring-buffer mode - one deque for all, so max_statements bounds the total
+            buffer = _Buffer(owner, self.statements if self.max_statements else [])
+            with self._lock:
+                self._retire_buffers(time.perf_counter_ns())
+                self._buffers.append(buffer)
+                self._unordered = self.max_statements is not None
+            self._buffer_var.set(buffer)
+        return buffer
+
+    def _retire_buffers(self, tst_ns: int):
+        """
+        drops buffers of ended threads / tasks so many short-lived ones don't
+        accumulate - chains are closed, statements kept. Call with lock acquired.
+        """
+        buffers = [self._buffers[0]]
+        for buffer in self._buffers[1:]:
+            if not is_owner_done(buffer.owner):
+                buffers.append(buffer)
+                continue
+            self._close_chain(buffer, tst_ns)
+            if buffer.statements is not self.statements and buffer.statements:
+                self._retired.append(buffer.statements)
+            buffer.statements = None
+        self._buffers = buffers
+
+    def _get_statements(self):
+        " statements from all buffers ordered by idx - after finish() it is just self.statements "
+        if self.max_statements:
+            return sorted(self.statements, key=lambda stmt: stmt.idx) if self._unordered else self.statements
+        if len(self._buffers) == 1 and not self._retired:
+            return self.statements
+        return list(merge(*[buffer.statements for buffer in self._buffers], *self._retired,
+                          key=lambda stmt: stmt.idx))
+
+    def _close_chain(self, buffer: _Buffer, tst_ns: int):
+        " sets duration of the last statement in the buffer, call with lock acquired "
+        prev = buffer.last
+        if prev is None:
+            return
+        buffer.last = None
+        prev.set_tst_next(tst_ns)
+        if prev.transaction is not None:
+            self._session_collector.add_timed(prev)
+        if prev.sampled:
+            self._stats.add_timed(prev)
+        else:
+            # sampling candidate - measured, but retained only if slow
+            keep = self.sampling.is_slow(prev.server_duration if self.timing == TimingMode.SERVER else prev.duration)
+            if keep:
+                prev.sampled = True
+                buffer.statements.append(prev)
+            self._stats.add_timed(prev, track_slowest=keep)
+        if prev.sampled and self._store is not None:
+            self._store.add(prev)
+
     def capture_sa_statement_listener(self, conn, cursor, statement, parameters, context, executemany):
         if self.finished:
             raise Exception("finish() already done, capture not possible any more")
-        now = datetime.now()
-        if self.statements:
-            self.statements[-1].set_tst_next(now)
+        now_ns = time.perf_counter_ns()
+        if self._pool_collector is not None:
+            self._pool_collector.add_statement(conn)
+        transaction, flush = (self._session_collector.add_statement(conn)
+                              if self._session_collector is not None else (None, None))
+        buffer = self._get_buffer()
+        span = self._span_var.get()
+        sampling = self.sampling
+        sampled = sampling is None or sampling.should_sample(statement)
+
+        if not sampled and not sampling.times_all:
+            # only counters
+            with self._lock:
+                self._close_chain(buffer, now_ns)
+                self._stats.add_count(statement, span)
+                self._nr_seen += 1
+                self._overhead_ns += time.perf_counter_ns() - now_ns
+            return
+
+        call_site = self._call_site_resolver.resolve() if self._call_site_resolver else None
+        # the same sql string object shared by all statements
+        statement = sys.intern(statement)
+        with self._lock:
+            self._close_chain(buffer, now_ns)
+            self._stats.add_count(statement, span)
+            self._nr_seen += 1
+            idx = self._nr_seen
 
+        params_rows = get_params_rows(parameters, executemany) if executemany else None
+        if self.params_policy != ParamsPolicy.KEEP:
+            parameters = retain_parameters(parameters, executemany, self.params_policy,
+                                           max_rows=self.params_max_rows, max_repr=self.params_max_repr)
         stmt = SqlStatement(
-                idx = len(self.statements)+1,
+                idx = idx,
                 statement = statement,
                 parameters = parameters,
-                tst_started = now,
+                tst_started_ns = now_ns,
                 executemany=executemany,
+                params_rows=params_rows,
+                call_site=call_site,
+                sampled=sampled,
+                span=span,
+                transaction=transaction,
+                flush=flush,
                 # context
             )
 
-        self.statements.append(stmt)
+        if sampled:
+            buffer.statements.append(stmt)
+        buffer.last = stmt
+        if self._track_after_execute:
+            # before/after events are always paired within one execution
+            # context (insertmanyvalues batches come one after another)
+            self._pending[id(context if context is not None else cursor)] = stmt
+        if sampling is not None:
+            overhead_ns = time.perf_counter_ns() - now_ns
+            with self._lock:
+                self._overhead_ns += overhead_ns
+
+    def capture_sa_after_execute_listener(self, conn, cursor, statement, parameters, context, executemany):
+        now_ns = time.perf_counter_ns()
+        stmt = self._pending.pop(id(context if context is not None else cursor), None)
+        if stmt is None:
+            return
+        if self.timing == TimingMode.SERVER:
+            stmt.set_tst_ended(now_ns)
+        if self.capture_rows != RowsMode.NONE:
+            stmt.rowcount = get_rowcount(cursor)
+            counted = self._count_fetched and set_counting_fetch_strategy(context, stmt, self._add_fetched)
+            if counted:
+                stmt.rows_fetched = 0
+                if self.capture_rows == RowsMode.FETCHED_BYTES:
+                    stmt.bytes_fetched = 0
+            with self._lock:
+                self._stats.add_rows(stmt.statement, stmt.span, rowcount=stmt.rowcount,
+                                     rows_fetched=stmt.rows_fetched, bytes_fetched=stmt.bytes_fetched)
+        if self.sampling is not None:
+            overhead_ns = time.perf_counter_ns() - now_ns
+            with self._lock:
+                self._overhead_ns += overhead_ns
+
+    def _add_fetched(self, stmt: SqlStatement, rows):
+        " called by rows.CountingFetchStrategy on every fetch "
+        nr_rows = len(rows)
+        size = sum(get_row_size(row) for row in rows) if self.capture_rows == RowsMode.FETCHED_BYTES else None
+        with self._lock:
+            stmt.rows_fetched += nr_rows
+            if size is not None:
+                stmt.bytes_fetched += size
+            self._stats.add_rows(stmt.statement, stmt.span, rows_fetched=nr_rows, bytes_fetched=size)
+
+    def capture_sa_error_listener(self, exception_context):
+        now_ns = time.perf_counter_ns()
+        context = exception_context.execution_context
+        # not available in every SQLAlchemy version
+        cursor = getattr(exception_context, "cursor", None)
+        if context is None and cursor is None:
+            # e.g. connect failed - nothing captured
+            return
+        stmt = self._pending.pop(id(context if context is not None else cursor), None)
+        if stmt is not None:
+            stmt.set_tst_ended(now_ns, error=repr(exception_context.original_exception))
 
     def finish(self):
         if self.finished:
             raise Exception("finish() already called.")
 
-        event.remove(self.engine, 'before_cursor_execute', self.decorated_fn)
-        self.finished = datetime.now()
-        diff = self.finished - self.started
-        self.duration = timedelta_to_seconds(diff)
+        finished_ns = time.perf_counter_ns()
+        for name, fn in self._listeners:
+            self._dispatcher.unsubscribe(name, fn)
+        if self._pool_collector is not None:
+            self._pool_collector.finish()
+        if self._session_collector is not None:
+            self._session_collector.finish()
+        self._pending.clear()
+        self.finished = ns_to_datetime(finished_ns)
+        self.duration = ns_to_seconds(finished_ns - self.started_ns)
 
-        if self.statements:
-            self.statements[-1].set_tst_next(self.finished)
-            # When I have all durations set
-            for stmt in self.statements:
-                self._cur.execute("insert into sql_statement values (?, ?, ?, ?)",
-                                  (stmt.idx, stmt.duration, stmt.first_table, stmt.sql_type))
-            self.connection.commit()
+        with self._lock:
+            for buffer in self._buffers:
+                self._close_chain(buffer, finished_ns)
+            for span in self.spans:
+                if span.ended_ns is None:
+                    span.ended_ns = finished_ns
+
+            if len(self._buffers) > 1 or self._retired or self._unordered:
+                statements = self._get_statements()
+                self.statements.clear()
+                self.statements.extend(statements)
+                self._retired = []
+                self._unordered = False
+            # contexts of other threads / tasks may outlive this object
+            for buffer in self._buffers[1:]:
+                buffer.statements = buffer.last = None
+            del self._buffers[1:]
+
+        if self._store is not None:
+            self._store.finish(self.finished, self.duration)
+        if self._spool_writer is not None:
+            self._spool_writer.finish()
+
+    @contextmanager
+    def span(self, name:str):
+        """
+        statements issued inside belong to this span - see StatName.BY_SPAN
+        and get_stats(span=...). Spans can be nested, nested span is named by
+        its path, e.g. "load users/authors". Yields spans.Span.
+        """
+        if self.finished:
+            raise Exception("finish() already done, span not possible any more")
+        span = Span(get_span_name(self._span_var.get(), name), time.perf_counter_ns())
+        with self._lock:
+            self.spans.append(span)
+        token = self._span_var.set(span.name)
+        try:
+            yield span
+        finally:
+            self._span_var.reset(token)
+            if span.ended_ns is None:
+                span.ended_ns = time.perf_counter_ns()
 
     # ---------------------------------------------------------------------
     # Stats methods - returning aggregated or top records as list or dict
     # ---------------------------------------------------------------------
 
     def count(self) -> int:
-        return len(self.statements)
+        " all captured statements - in ring-buffer mode not all are retained "
+        return self._nr_seen
 
-    def _get_max_key_len(self, stat_list:List[Stat], min_length=15) -> int:
+    @staticmethod
+    def _get_max_key_len(stat_list:List[Stat], min_length=15) -> int:
         return max([min_length, *[len(st.key) for st in stat_list]])
 
-    def get_slowest(self, top:int=TOP_DEFAULT_SLOWEST) -> List[Stat]:
-        " this one fills Stat.statement with original SqlStatement object "
-        if not self.finished:
-            raise Exception("Call finish() first.")
+    def _check_order_by(self, order_by:str, rows:bool=False):
+        " rows - ROWS_FIELDS are valid too "
+        if rows and order_by in ROWS_FIELDS:
+            self._check_rows_field(order_by)
+            return
+        if order_by not in DURATION_FIELDS:
+            raise Exception(f"Order by {order_by} is not valid, valid are: "
+                            f"{DURATION_FIELDS + ROWS_FIELDS if rows else DURATION_FIELDS}")
+        if order_by != "duration" and self.timing != TimingMode.SERVER:
+            raise Exception(f"Order by {order_by} requires timing={TimingMode.SERVER.value}")
 
-        self._cur.execute(f"select id, sql_type, first_table, duration from sql_statement order by duration desc limit {top}")
-        stat_list = []
-        for row in self._cur.fetchall():
-            row_id, sql_type, first_table, duration = row
-            key = f"{sql_type} {first_table}"
-            stmt = self.get_statement_by_row_id(row_id)
-            stat_list.append(Stat(key, 1, duration, stmt))
-        return stat_list
+    def _check_rows_field(self, order_by:str):
+        if self.capture_rows == RowsMode.NONE:
+            raise Exception(f"Order by {order_by} requires capture_rows argument")
+        if order_by != "rowcount" and not self._count_fetched:
+            raise Exception(f"Order by {order_by} requires capture_rows={RowsMode.FETCHED.value} "
+                            f"or {RowsMode.FETCHED_BYTES.value}")
+        if order_by == "bytes_fetched" and self.capture_rows != RowsMode.FETCHED_BYTES:
+            raise Exception(f"Order by {order_by} requires capture_rows={RowsMode.FETCHED_BYTES.value}")
 
-    def get_statement_by_row_id(self, row_id:int) -> SqlStatement:
-        if row_id <1 or row_id > len(self.statements):
-            raise Exception(f"Row id {row_id} out of range, valid range is: [1, {len(self.statements)}]")
-        return self.statements[row_id-1]
+    def get_slowest(self, top:int=TOP_DEFAULT_SLOWEST, order_by:str="duration") -> List[Stat]:
+        """
+        this one fills Stat.statement with original SqlStatement object.
+        Can be called during capture - not finished statements are not included.
+        """
+        self._check_order_by(order_by)
+        if top > self.keep_slowest:
+            raise Exception(f"Only {self.keep_slowest} slowest statements are kept, "
+                            f"see keep_slowest argument, got top={top}")
+
+        return [self._stmt_to_stat(stmt) for stmt in self._stats.get_slowest(top, order_by=order_by)]
 
-    def get_counts(self, name:StatName) -> Dict[str, int]:
-        return {st.key: st.cnt for st in self.get_stats(name)}
+    def _stmt_to_stat(self, stmt: SqlStatement) -> Stat:
+        return Stat(f"{stmt.sql_type} {stmt.first_table}", 1, stmt.duration, stmt,
+                    server_duration=stmt.server_duration, client_duration=stmt.client_duration,
+                    rowcount=stmt.rowcount, rows_fetched=stmt.rows_fetched, bytes_fetched=stmt.bytes_fetched,
+                    plan=stmt.plan)
 
+    def explain_slowest(self, connection, top:int=TOP_DEFAULT_SLOWEST, order_by:str="duration",
+                        sql_types:Tuple[str, ...]=("SELECT",), use_cache:bool=True) -> List[Stat]:
+        """
+        Runs EXPLAIN (EXPLAIN QUERY PLAN for sqlite) for the slowest statement
+        of top slowest distinct fingerprints and stores plans to SqlStatement.plan
+        and Stat.plan, see explain.py. connection - SQLAlchemy Connection or
+        Engine; use it after finish() or on another engine, otherwise EXPLAIN
+        statements are captured too.
+        """
+        self._check_order_by(order_by)
+        if not hasattr(connection, "exec_driver_sql"):
+            # Engine
+            with connection.connect() as conn:
+                return self.explain_slowest(conn, top=top, order_by=order_by, sql_types=sql_types,
+                                            use_cache=use_cache)
+        explained = []
+        fingerprints = set()
+        for stmt in self._stats.get_slowest(self.keep_slowest, order_by=order_by):
+            if len(explained) >= top:
+                break
+            if stmt.sql_type not in sql_types or stmt.fingerprint in fingerprints:
+                continue
+            fingerprints.add(stmt.fingerprint)
+            stmt.plan = explain_statement(connection, stmt, use_cache=use_cache)
+            explained.append(self._stmt_to_stat(stmt))
+        self._explained = explained
+        return explained
 
-    def get_stats(self, name: StatName, top:int=TOP_DEFAULT) -> Tuple[int, List[Stat]]:
-        if not self.finished:
-            # duration is not calculated
-            raise Exception("Call finish() first.")
+    def get_largest(self, top:int=TOP_DEFAULT_SLOWEST, order_by:Optional[str]=None) -> List[Stat]:
+        """
+        largest result sets - statements with the most rows, capture_rows only.
+        order_by - rows_fetched by default when fetched rows are counted,
+        rowcount otherwise. Only retained statements are checked (see
+        max_statements, sampling).
+        """
+        if order_by is None:
+            order_by = "rows_fetched" if self._count_fetched else "rowcount"
+        if order_by not in ROWS_FIELDS:
+            raise Exception(f"Order by {order_by} is not valid, valid are: {ROWS_FIELDS}")
+        self._check_rows_field(order_by)
+        largest = nlargest(top, [stmt for stmt in self._get_statements() if getattr(stmt, order_by)],
+                           key=lambda stmt: getattr(stmt, order_by))
+        return [self._stmt_to_stat(stmt) for stmt in largest]
 
+    def is_retained(self, row_id:int) -> bool:
+        " in ring-buffer mode (max_statements) older statements are dropped "
+        return self._find_statement(row_id) is not None
+
+    def _find_statement(self, row_id:int) -> Optional[SqlStatement]:
+        statements = self._get_statements()
+        if not statements:
+            return None
+        first_row_id = statements[0].idx
+        if len(statements) == statements[-1].idx - first_row_id + 1:
+            # no gaps in row ids
+            if first_row_id <= row_id < first_row_id + len(statements):
+                return statements[row_id - first_row_id]
+            return None
+        # sampling or ring-buffers of many threads / tasks merged
+        if isinstance(statements, deque):
+            statements = list(statements)
+        pos = bisect_left([stmt.idx for stmt in statements], row_id)
+        if pos < len(statements) and statements[pos].idx == row_id:
+            return statements[pos]
+        return None
+
+    def get_statement_by_row_id(self, row_id:int) -> SqlStatement:
+        stmt = self._find_statement(row_id)
+        if stmt is None:
+            statements = self._get_statements()
+            valid_range = f"[{statements[0].idx}, {statements[-1].idx}]" if statements else "[]"
+            raise Exception(f"Row id {row_id} out of range or not retained, valid range is: {valid_range}")
+        return stmt
+
+    def get_counts(self, name:StatName, top:Optional[int]=TOP_DEFAULT) -> Dict[str, int]:
+        " top - None for all groups "
+        return {st.key: st.cnt for st in self.get_stats(name, top=top)}
+
+
+    def get_stats(self, name: StatName, top:Optional[int]=TOP_DEFAULT, order_by:str="duration",
+                  span:Optional[str]=None) -> List[Stat]:
+        """
+        top - None for all groups.
+        span - only statements issued in this span (not in its nested spans),
+        spans.NO_SPAN for statements outside of spans.
+        Aggregates are maintained while capturing, so this can be called
+        before finish() too - durations of not finished statements are not
+        included then (cnt includes them).
+        """
         if name not in self.STATS_NAME_MAP:
-            raise Exception(f"Name {name} is not valid, valid are: {name_map.keys()}")
+            raise Exception(f"Name {name} is not valid, valid are: {list(self.STATS_NAME_MAP.keys())}")
+        self._check_order_by(order_by, rows=True)
+
+        return self._stats.get_stats(StatName(name), top=top, order_by=order_by,
+                                     scale=self.sampling is not None, span=span)
 
-        group_by = self.STATS_NAME_MAP[name]
+    def get_spans(self) -> List[Span]:
+        " spans in order of start, see span() "
+        with self._lock:
+            return list(self.spans)
 
-        self._cur.execute(f"select count(*) cnt, sum(duration) dur, {group_by} from sql_statement group by {group_by} order by sum(duration) desc, count(*) desc limit {top}")
+    def get_overhead(self) -> Tuple[float, float]:
+        """
+        sampling mode only - time spent in capture listeners:
+        (total seconds, average microseconds per statement)
+        """
+        if self.sampling is None:
+            raise Exception("Overhead is measured only when sampling is used")
+        total = ns_to_seconds(self._overhead_ns)
+        return total, (total * 1_000_000.0 / self._nr_seen if self._nr_seen else 0.0)
 
-        stat_list = []
-        for row in self._cur.fetchall():
-            cnt, duration, *keys = row
-            key = " ".join(map(str, keys))
-            stat_list.append(Stat(key, cnt, duration))
-        return stat_list
+    def get_n_plus_one(self, threshold:int=N_PLUS_ONE_THRESHOLD,
+                       sql_types:Optional[Tuple[str, ...]]=N_PLUS_ONE_SQL_TYPES,
+                       by_span:bool=True) -> NPlusOneReport:
+        """
+        statements with the same fingerprint issued from the same call-site
+        (capture_call_sites=True) more than threshold times. Only retained
+        statements are checked (see max_statements). by_span - statements of
+        different spans are counted separately.
+        """
+        return detect_n_plus_one(self._get_statements(), threshold=threshold, sql_types=sql_types,
+                                 by_span=by_span)
+
+    def get_pool_stats(self) -> PoolStats:
+        " capture_pool=True only "
+        if self._pool_collector is None:
+            raise Exception("Pool stats are collected only when capture_pool=True is used")
+        return self._pool_collector.get_stats()
+
+    def _check_session_collector(self):
+        if self._session_collector is None:
+            raise Exception("Transactions and flushes are collected only when capture_session argument is used")
+
+    def get_transactions(self, top:Optional[int]=None, order_by:str="idx") -> List[TransactionInfo]:
+        """
+        capture_session only - ORM Session transactions on the engine.
+        order_by - idx (start order), duration (wall time, long transactions
+        hold locks), statements_duration, cnt or commit_duration.
+        """
+        self._check_session_collector()
+        return self._get_ordered(self._session_collector.get_transactions(), top, order_by,
+                                 ("idx", "duration", "statements_duration", "cnt", "commit_duration"))
+
+    def get_flushes(self, top:Optional[int]=None, order_by:str="idx") -> List[FlushInfo]:
+        " capture_session only - flushes which issued statements, order_by as in get_transactions() "
+        self._check_session_collector()
+        return self._get_ordered(self._session_collector.get_flushes(), top, order_by,
+                                 ("idx", "duration", "statements_duration", "cnt"))
+
+    def _get_ordered(self, items:List[Any], top:Optional[int], order_by:str, valid:Tuple[str, ...]) -> List[Any]:
+        if order_by not in valid:
+            raise Exception(f"Order by {order_by} is not valid, valid are: {valid}")
+        if order_by != "idx":
+            items.sort(key=lambda item: getattr(item, order_by) or 0.0, reverse=True)
+        return items[:top]
+
+    def get_session_stats(self) -> SessionStats:
+        " capture_session only "
+        self._check_session_collector()
+        return self._session_collector.get_stats()
+
+    def to_snapshot(self) -> CaptureSnapshot:
+        " aggregates per fingerprint with sample statements, see snapshot.py and diff.py "
+        return CaptureSnapshot.from_capture(self)
+
+    def save(self, path:str):
+        " saves snapshot - JSON, gzipped when path ends with .gz "
+        self.to_snapshot().save(path)
+
+    def save_chrome_trace(self, path:str, wall_clock:bool=False) -> int:
+        " statements and spans as Chrome trace-event JSON timeline, see export.py - returns number of events "
+        return save_chrome_trace(self, path, wall_clock=wall_clock)
+
+    def save_otlp(self, path:str, service_name:str=OTLP_SERVICE_NAME_DEFAULT) -> int:
+        " statements and spans as OTLP/JSON trace, see export.py - returns number of spans "
+        return save_otlp(self, path, service_name=service_name)
 
     # ----------------------------------------------------------------------
     # Report methods - using stats method produce report as single string
     # ----------------------------------------------------------------------
 
-    def report_slowest(self, verbose=False) -> str:
-        slowest_stat_list = self.get_slowest(top=5)
+    def _get_agg_fields(self) -> Tuple[str, ...]:
+        return self.AGG_FIELDS_SERVER if self.timing == TimingMode.SERVER else self.AGG_FIELDS
+
+    def _get_top_slowest(self) -> int:
+        " number of slowest statements in reports - TOP_DEFAULT_SLOWEST or less when keep_slowest is lower "
+        return min(TOP_DEFAULT_SLOWEST, self.keep_slowest)
+
+    def report_slowest(self, verbose=False, order_by:str="duration") -> str:
+        slowest_stat_list = self.get_slowest(top=self._get_top_slowest(), order_by=order_by)
         max_key_len = self._get_max_key_len(slowest_stat_list)
         fmt = "%%3d. %%-%ds %s %s %%s" % (max_key_len, self.FMT_MAP["cnt"], self.FMT_MAP["duration"])
         out = []
         for nr, stat in enumerate(slowest_stat_list,1):
-            out.append(fmt % (nr, stat.key, stat.cnt, stat.duration, stat.statement.stmt_repr if not verbose else stat.statement))
+            stmt_info = ("<not retained>" if stat.statement is None
+                         else stat.statement.stmt_repr if not verbose else stat.statement)
+            out.append(fmt % (nr, stat.key, stat.cnt, stat.duration, stmt_info))
+        return f"\n{TAB}".join(out)
+
+    def _get_rows_fields(self) -> Tuple[str, ...]:
+        if self.capture_rows == RowsMode.FETCHED_BYTES:
+            return ROWS_FIELDS
+        if self.capture_rows == RowsMode.FETCHED:
+            return ("rowcount", "rows_fetched")
+        return ("rowcount",)
+
+    def report_largest(self, verbose=False, order_by:Optional[str]=None) -> str:
+        largest_stat_list = self.get_largest(top=TOP_DEFAULT_SLOWEST, order_by=order_by)
+        max_key_len = self._get_max_key_len(largest_stat_list)
+        out = []
+        for nr, stat in enumerate(largest_stat_list, 1):
+            stmt_info = stat.statement.stmt_repr if not verbose else stat.statement
+            out.append("%3d. " % nr + ("%%-%ds " % (max_key_len,) % stat.key)
+                       + " ".join([self._format_field(stat, fld) for fld in self._get_rows_fields()])
+                       + f" {stmt_info}")
+        return f"\n{TAB}".join(out)
+
+    def report_rows(self, name: StatName, top:int=TOP_DEFAULT, order_by:Optional[str]=None) -> str:
+        " rows per group, capture_rows only "
+        fields = self._get_rows_fields()
+        return self.report_stats(name, top=top, fields=["cnt", *fields], order_by=order_by or fields[-1])
+
+    def report_plans(self) -> str:
+        " plans from the last explain_slowest() call "
+        out = []
+        for nr, stat in enumerate(self._explained, 1):
+            out.append("%3d. %s %s" % (nr, self._format_field(stat, "duration"), stat.statement.stmt_repr))
+            out.append(stat.plan.report(indent=TAB + " " * 5))
         return f"\n{TAB}".join(out)
 
     def report_counter(self, name: StatName, top:int=TOP_DEFAULT) -> str:
         return self.report_stats(name, fields=["cnt"], top=top)
 
-    def report_stats(self, name: StatName, top:int=TOP_DEFAULT, fields:List[str]=AGG_FIELDS) -> str:
-        stat_list = self.get_stats(name)
-        max_key_len = self._get_max_key_len(stat_list)
-        fmt = "%%-%ds " % (max_key_len,) + " ".join([self.FMT_MAP[fld] for fld in fields])
-        return f"\n{TAB}".join([fmt % (st.key, *[getattr(st, fld) for fld in fields]) for st in stat_list])
+    def report_stats(self, name: StatName, top:int=TOP_DEFAULT, fields:Optional[List[str]]=None,
+                     order_by:str="duration") -> str:
+        " fields - default AGG_FIELDS or AGG_FIELDS_SERVER when timing=server "
+        if fields is None:
+            fields = self._get_agg_fields()
+        return self._report_stat_list(self.get_stats(name, top=top, order_by=order_by), fields)
+
+    @classmethod
+    def _report_stat_list(cls, stat_list:List[Stat], fields:List[str]) -> str:
+        " one line per stat - key and formatted fields, used by collector.CaptureCollector too "
+        max_key_len = cls._get_max_key_len(stat_list)
+        return f"\n{TAB}".join([("%%-%ds " % (max_key_len,) % st.key)
+                                + " ".join([cls._format_field(st, fld) for fld in fields])
+                                for st in stat_list])
+
+    @classmethod
+    def _format_field(cls, stat: Stat, fld: str) -> str:
+        fmt = cls.FMT_MAP[fld]
+        value = getattr(stat, fld)
+        if value is None:
+            # e.g. percentiles when nothing is measured - keep the column width
+            return "-".rjust(len(fmt % 0))
+        return fmt % value
+
+    def report_latency(self, name: StatName, top:int=TOP_DEFAULT, order_by:str="duration") -> str:
+        " mean and percentiles per group, see LATENCY_FIELDS "
+        return self.report_stats(name, top=top, fields=self.LATENCY_FIELDS, order_by=order_by)
+
+    def report_histograms(self, name: StatName, top:int=TOP_DEFAULT_SLOWEST, order_by:str="duration") -> str:
+        out = []
+        for st in self.get_stats(name, top=top, order_by=order_by):
+            out.append(f"{st.key} ({st.cnt}x, p50 {self._format_field(st, 'p50').strip()}, "
+                       f"p99 {self._format_field(st, 'p99').strip()}):")
+            out.append(st.histogram.render(indent=TAB) if st.histogram else f"{TAB}<empty>")
+        return f"\n{TAB}".join(out)
+
+    def report_pool(self) -> str:
+        pool_stats = self.get_pool_stats()
+        out = [f"checkouts {pool_stats.checkouts} (max {pool_stats.max_checked_out} at once), "
+               f"checkins {pool_stats.checkins}, connections opened {pool_stats.connections_opened}, "
+               f"closed {pool_stats.connections_closed}, invalidated {pool_stats.invalidations}"]
+        max_key_len = self._get_max_key_len(pool_stats.timings)
+        out.extend([("%%-%ds " % (max_key_len,) % st.key)
+                    + " ".join([self._format_field(st, fld) for fld in self.LATENCY_FIELDS])
+                    for st in pool_stats.timings])
+        mean_statements = pool_stats.mean_statements_per_checkout
+        if mean_statements is not None:
+            out.append(f"statements per checkout - mean {mean_statements:.1f}, "
+                       f"max {max(pool_stats.statements_per_checkout)}")
+        return f"\n{TAB}".join(out)
+
+    def report_session(self, top:int=TOP_DEFAULT_SLOWEST) -> str:
+        session_stats = self.get_session_stats()
+        out = [f"transactions {session_stats.transactions} (committed {session_stats.committed}, "
+               f"rolled back {session_stats.rolled_back}), flushes {session_stats.flushes}"]
+        max_key_len = self._get_max_key_len(session_stats.timings)
+        out.extend([("%%-%ds " % (max_key_len,) % st.key)
+                    + " ".join([self._format_field(st, fld) for fld in self.LATENCY_FIELDS])
+                    for st in session_stats.timings])
+        out.append("statements by flush reason:")
+        max_key_len = self._get_max_key_len(session_stats.statements_by_flush)
+        out.extend([f"{TAB}" + ("%%-%ds " % (max_key_len,) % st.key)
+                    + " ".join([self._format_field(st, fld) for fld in self.AGG_FIELDS])
+                    for st in session_stats.statements_by_flush])
+        out.append(f"longest transactions (top {top}):")
+        for info in self.get_transactions(top=top, order_by="duration"):
+            commit = f", commit {info.commit_duration:.4f} s" if info.commit_duration is not None else ""
+            out.append(f"{TAB}#{info.idx:<3d} {info.duration:8.4f} s {info.outcome.value if info.outcome else 'open':8s} "
+                       f"{info.cnt} statement(s) {info.statements_duration:.4f} s, "
+                       f"{info.nr_flushes} flush(es){commit}")
+        return f"\n{TAB}".join(out)
 
     # ----------------------------------------------------------------------
     # Pretty-print method - full report to std. out or custom print function
     # ----------------------------------------------------------------------
 
-    def pp(self, verbose:bool=False, print_cmd:Callable=print):
-        if self.statements:
+    def report_spans(self, top:int=TOP_DEFAULT) -> str:
+        " stats by span with wall time of spans "
+        spans: Dict[str, List[Span]] = {}
+        for span in self.get_spans():
+            spans.setdefault(span.name, []).append(span)
+        stat_list = self.get_stats(StatName.BY_SPAN, top=top)
+        max_key_len = self._get_max_key_len(stat_list)
+        out = []
+        for st in stat_list:
+            line = (("%%-%ds " % (max_key_len,) % st.key)
+                    + " ".join([self._format_field(st, fld) for fld in self._get_agg_fields()]))
+            if st.key in spans:
+                line += " (%dx, wall %.3f s)" % (len(spans[st.key]), sum(span.duration for span in spans[st.key]))
+            out.append(line)
+        return f"\n{TAB}".join(out)
+
+    def report_n_plus_one(self, threshold:int=N_PLUS_ONE_THRESHOLD) -> str:
+        return self.get_n_plus_one(threshold=threshold).report(indent=TAB)
+
+    def pp(self, verbose:bool=False, print_cmd:Callable=print, order_by:str="duration",
+           n_plus_one:bool=False, histograms:bool=False):
+        statements = self._get_statements()
+        if self.count():
             separator_line = "=" * 60
             top = TOP_DEFAULT
             print_cmd(separator_line)
-            print_cmd(f"== NOTE: duration measures time between 2 captures, it is not actual DB execution time.")
-            total = f"== Totally captured {self.count()} statement(s) in {self.duration} s"
-            print_cmd(total+":")
-            for nr, stmt in enumerate(self.statements, 1):
-                print_cmd("%3d. %s" % (nr, stmt.report_short() if not verbose else stmt))
+            if self.timing == TimingMode.SERVER:
+                print_cmd(f"== NOTE: duration = server_duration (DB execution) + client_duration (time until next statement), ordered by {order_by}.")
+            else:
+                print_cmd(f"== NOTE: duration measures time between 2 captures, it is not actual DB execution time.")
+            duration = self.duration if self.finished else ns_to_seconds(time.perf_counter_ns() - self.started_ns)
+            total = f"== Totally captured {self.count()} statement(s) in {duration} s"
+            if self.sampling is not None:
+                overhead, overhead_per_stmt = self.get_overhead()
+                print_cmd(f"== Sampling: {len(statements)} statement(s) retained, durations in stats are scaled, "
+                          f"capture overhead {overhead:.6f} s ({overhead_per_stmt:.2f} us/statement)")
+            if len(statements) < self.count():
+                print_cmd(total+f", {len(statements)} retained:")
+            else:
+                print_cmd(total+":")
+            for stmt in statements:
+                print_cmd("%3d. %s" % (stmt.idx, stmt.report_short() if not verbose else stmt))
             print_cmd(separator_line)
-            print_cmd(f"== Slowest (top {TOP_DEFAULT_SLOWEST}):")
-            print_cmd(f"{TAB}{self.report_slowest(verbose=verbose)}")
+            print_cmd(f"== Slowest (top {self._get_top_slowest()}):")
+            print_cmd(f"{TAB}{self.report_slowest(verbose=verbose, order_by=order_by)}")
             print_cmd(separator_line)
             print_cmd(f"== By sql command (top {top}):")
-            print_cmd(f"{TAB}{self.report_stats('by_type')}")
+            print_cmd(f"{TAB}{self.report_stats('by_type', order_by=order_by)}")
             print_cmd(separator_line)
             print_cmd(f"== By table (top {top}):")
-            print_cmd(f"{TAB}{self.report_stats('by_table')}")
+            print_cmd(f"{TAB}{self.report_stats('by_table', order_by=order_by)}")
+            print_cmd(separator_line)
+            print_cmd(f"== By touched table (top {top}) - joins, subqueries and CTEs, "
+                      f"statement is counted for every table:")
+            print_cmd(f"{TAB}{self.report_stats('by_touched_table', order_by=order_by)}")
             print_cmd(separator_line)
             print_cmd(f"== By sql command + table (top {top}):")
-            print_cmd(f"{TAB}{self.report_stats('by_type_and_table')}")
+            print_cmd(f"{TAB}{self.report_stats('by_type_and_table', order_by=order_by)}")
+            if self.spans:
+                print_cmd(separator_line)
+                print_cmd(f"== By span (top {top}):")
+                print_cmd(f"{TAB}{self.report_spans()}")
+            if histograms:
+                latency_measure = "server_duration" if self.timing == TimingMode.SERVER else "duration"
+                print_cmd(separator_line)
+                print_cmd(f"== Latency of {latency_measure} by sql command + table (top {top}) - "
+                          f"{', '.join(fld.replace('_latency', '') for fld in self.LATENCY_FIELDS)}:")
+                print_cmd(f"{TAB}{self.report_latency('by_type_and_table', order_by=order_by)}")
+                print_cmd(separator_line)
+                print_cmd(f"== Histograms of {latency_measure} by sql command + table (top {TOP_DEFAULT_SLOWEST}):")
+                print_cmd(f"{TAB}{self.report_histograms('by_type_and_table', order_by=order_by)}")
+            if self.capture_rows != RowsMode.NONE:
+                rows_fields = ", ".join(self._get_rows_fields())
+                print_cmd(separator_line)
+                print_cmd(f"== Largest result sets (top {TOP_DEFAULT_SLOWEST}) - {rows_fields}:")
+                print_cmd(f"{TAB}{self.report_largest(verbose=verbose)}")
+                print_cmd(separator_line)
+                print_cmd(f"== Rows by table (top {top}) - cnt, {rows_fields}:")
+                print_cmd(f"{TAB}{self.report_rows('by_table')}")
+                print_cmd(separator_line)
+                print_cmd(f"== Rows by fingerprint (top {top}) - cnt, {rows_fields}:")
+                print_cmd(f"{TAB}{self.report_rows('by_fingerprint')}")
+            if self._explained:
+                print_cmd(separator_line)
+                print_cmd(f"== Plans of the slowest statements (explain_slowest()):")
+                print_cmd(f"{TAB}{self.report_plans()}")
+            if self.capture_session:
+                print_cmd(separator_line)
+                print_cmd(f"== ORM sessions - {', '.join(fld.replace('_latency', '') for fld in self.LATENCY_FIELDS)}:")
+                print_cmd(f"{TAB}{self.report_session()}")
+            if self.capture_pool:
+                print_cmd(separator_line)
+                print_cmd(f"== Connection pool - {', '.join(fld.replace('_latency', '') for fld in self.LATENCY_FIELDS)}:")
+                print_cmd(f"{TAB}{self.report_pool()}")
+            if n_plus_one:
+                print_cmd(separator_line)
+                print_cmd(f"== N+1 suspects - same statement from the same place more than {N_PLUS_ONE_THRESHOLD} times:")
+                print_cmd(self.report_n_plus_one())
             print_cmd(separator_line)
             print_cmd(total)
         else:
@@ -320,6 +1174,11 @@ class CaptureSqlStatements:
     # Utility functions
     # ------------------------------------------------------------
 
+    @staticmethod
+    def parse_cache_info():
+        " hits/misses of statement parsing cache, see parsing.parse_statement() "
+        return parsing.parse_cache_info()
+
     @staticmethod
     def sqlalchemy_log_statements_enable():
         " enable sqlalchemy sql commands logging. One can use SqlAlchemy.Engine(... echo=True) too "
@@ -0,0 +1,124 @@
+"""
+Query budgets and baselines - checks of a finished capture used by the pytest
+plugin (see pytest_plugin.py), usable without pytest too.
+
+Budget limits number of statements, number of statements per StatName group
+(e.g. by_type SELECT) and total duration. Baseline is per-test record of
+statement fingerprints and their counts - check fails when new fingerprints
+show up or counts grow beyond tolerance.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .base import TimingMode, TAB
+from .stats import StatName
+
+BASELINE_VERSION = 1
+
+# ------------------------------------------------------------
+
+@dataclass
+class QueryBudget:
+    max_statements: Optional[int] = None
+    # seconds - sum of durations, server_duration with TimingMode.SERVER
+    max_duration: Optional[float] = None
+    # StatName -> group key -> max count, e.g. {"by_type": {"SELECT": 10}},
+    # keys are case insensitive
+    max_counts: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.max_counts = {StatName(name): {key.upper(): max_cnt for key, max_cnt in limits.items()}
+                           for name, limits in self.max_counts.items()}
+
+    def check(self, capture) -> List[str]:
+        " returns list of violations, empty when capture is within the budget "
+        violations = []
+        if self.max_statements is not None and capture.count() > self.max_statements:
+            violations.append(f"{capture.count()} statement(s) captured, budget is {self.max_statements}")
+        if self.max_duration is not None:
+            duration = get_total_duration(capture)
+            if duration > self.max_duration:
+                violations.append(f"statements took {duration:.4f} s, budget is {self.max_duration:.4f} s")
+        for name, limits in self.max_counts.items():
+            counts = {key.upper(): cnt for key, cnt in capture.get_counts(name, top=None).items()}
+            for key, max_cnt in limits.items():
+                cnt = counts.get(key, 0)
+                if cnt > max_cnt:
+                    violations.append(f"{name.value} {key}: {cnt} statement(s), budget is {max_cnt}")
+        return violations
+
+
+def get_total_duration(capture) -> float:
+    measure = "server_duration" if capture.timing == TimingMode.SERVER else "duration"
+    return sum((getattr(stat, measure) or 0.0) for stat in capture.get_stats(StatName.BY_TYPE, top=None))
+
+# ------------------------------------------------------------
+# Baselines
+# ------------------------------------------------------------
+
+def make_baseline(capture) -> Dict[str, Any]:
+    return {
+            "version"      : BASELINE_VERSION,
+            "count"        : capture.count(),
+            "fingerprints" : dict(sorted(capture.get_counts(StatName.BY_FINGERPRINT, top=None).items())),
+            }
+
+
+def load_baseline(path:str) -> Optional[Dict[str, Any]]:
+    " None when file does not exist "
+    if not os.path.exists(path):
+        return None
+    with open(path) as fin:
+        baseline = json.load(fin)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise Exception(f"Baseline {path} has version {baseline.get('version')}, expected {BASELINE_VERSION}")
+    return baseline
+
+
+def save_baseline(path:str, baseline:Dict[str, Any]):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, "w") as fout:
+        json.dump(baseline, fout, indent=2)
+        fout.write("\n")
+
+
+def compare_baseline(baseline:Dict[str, Any], current:Dict[str, Any], tolerance:float=0.0) -> List[str]:
+    """
+    returns list of violations - new fingerprints and counts grown by more
+    than tolerance (0.1 = 10%). Removed fingerprints and lower counts are fine.
+    """
+    if tolerance < 0:
+        raise Exception(f"tolerance should not be negative, got: {tolerance}")
+    violations = []
+    if current["count"] > baseline["count"] * (1.0 + tolerance):
+        violations.append(f"{current['count']} statement(s) captured, baseline is {baseline['count']}")
+    base_fingerprints = baseline["fingerprints"]
+    for fingerprint, cnt in current["fingerprints"].items():
+        base_cnt = base_fingerprints.get(fingerprint)
+        if base_cnt is None:
+            violations.append(f"new statement ({cnt}x): {fingerprint}")
+        elif cnt > base_cnt * (1.0 + tolerance):
+            violations.append(f"statement count grown {base_cnt} -> {cnt}: {fingerprint}")
+    return violations
+
+# ------------------------------------------------------------
+
+def report_violations(capture, violations:List[str], title:str="SQL budget exceeded") -> str:
+    " violations with the slowest statements and grouped stats of the capture "
+    separator_line = "=" * 60
+    out = [f"{title}:"]
+    out.extend(f"{TAB}- {violation}" for violation in violations)
+    out.append(separator_line)
+    out.append("== Slowest:")
+    out.append(f"{TAB}{capture.report_slowest()}")
+    out.append(separator_line)
+    out.append("== By sql command:")
+    out.append(f"{TAB}{capture.report_stats(StatName.BY_TYPE)}")
+    out.append(separator_line)
+    out.append("== By sql command + table:")
+    out.append(f"{TAB}{capture.report_stats(StatName.BY_TYPE_AND_TABLE)}")
+    return "\n".join(out)
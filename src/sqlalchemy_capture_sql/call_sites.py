@@ -0,0 +1,86 @@
+"""
+Call-site attribution - finds application stack frame that issued the
+statement, skipping SQLAlchemy and library frames.
+
+Walking the stack is done with sys._getframe() and for every code object
+it is remembered whether it is a library one, so after warm-up the cost is a
+dict lookup per stack frame.
+"""
+import os
+import sys
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import sqlalchemy
+
+# ------------------------------------------------------------
+
+class CallSite(NamedTuple):
+    filename: str
+    lineno: int
+    function: str
+
+    def __str__(self):
+        return f"{self.filename}:{self.lineno} in {self.function}()"
+
+# ------------------------------------------------------------
+
+DEFAULT_SKIP_PREFIXES: Tuple[str, ...] = (
+        os.path.dirname(sqlalchemy.__file__) + os.sep,
+        os.path.dirname(__file__) + os.sep,
+        )
+
+
+class CallSiteResolver:
+
+    def __init__(self, skip_prefixes:Tuple[str, ...]):
+        self.skip_prefixes = skip_prefixes
+        # code object -> is library code
+        self._is_library: Dict[Any, bool] = {}
+        # (code object, line) -> CallSite
+        self._call_sites: Dict[Tuple[Any, int], CallSite] = {}
+
+    def _is_library_code(self, code) -> bool:
+        is_library = self._is_library.get(code)
+        if is_library is None:
+            filename = code.co_filename
+            is_library = self._is_library[code] = (
+                    filename.startswith(self.skip_prefixes)
+                    # <frozen ...>, <string> and similar
+                    or filename.startswith("<"))
+        return is_library
+
+    def resolve(self) -> Optional[CallSite]:
+        frame = sys._getframe(1)
+        glet = None
+        while True:
+            while frame is not None:
+                code = frame.f_code
+                if not self._is_library_code(code):
+                    key = (code, frame.f_lineno)
+                    call_site = self._call_sites.get(key)
+                    if call_site is None:
+                        call_site = self._call_sites[key] = CallSite(code.co_filename, frame.f_lineno, code.co_name)
+                    return call_site
+                frame = frame.f_back
+            # AsyncEngine runs sync code in a greenlet, application frames
+            # are in the parent greenlet
+            glet = _get_parent_greenlet(glet)
+            if glet is None:
+                return None
+            frame = glet.gr_frame
+
+
+def _get_parent_greenlet(glet):
+    if glet is None:
+        greenlet = sys.modules.get("greenlet")
+        if greenlet is None:
+            return None
+        glet = greenlet.getcurrent()
+    return glet.parent
+
+
+@lru_cache(maxsize=None)
+def get_call_site_resolver(extra_skip_prefixes:Tuple[str, ...]=()) -> CallSiteResolver:
+    " one resolver (and cache) per set of skipped prefixes "
+    return CallSiteResolver(DEFAULT_SKIP_PREFIXES + tuple(extra_skip_prefixes))
@@ -0,0 +1,340 @@
+"""
+Multi-process collection - worker processes (gunicorn, multiprocessing)
+spool their captures to a shared local directory, collector merges them.
+
+Worker side - capture writes its aggregates (snapshot, see snapshot.py) and
+the slowest statements to its own spool file, periodically and on finish():
+
+    CaptureSqlStatements(engine, spool_dir="/tmp/sql-spool", spool_interval=10.0)
+
+Files are replaced atomically, so the collector can read them at any time
+and sees the latest state of every worker:
+
+    collector = CaptureCollector("/tmp/sql-spool")
+    collector.get_stats("by_type")
+    collector.get_process_stats()
+    collector.pp()
+
+CLI:
+
+    python -m sqlalchemy_capture_sql.collector /tmp/sql-spool
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from heapq import nlargest
+from typing import Any, Callable, Dict, List, Optional
+
+from . import parsing
+from .parsing import StatementInfo
+from .parameters import get_params_repr
+from .snapshot import CaptureSnapshot
+from .stats import Stat, StatName, DURATION_FIELDS, merge_stats
+
+SPOOL_VERSION = 1
+# slowest statements written per capture
+SPOOL_SLOWEST_DEFAULT = 20
+SPOOL_SUFFIXES = (".json", ".json.gz")
+
+logger = logging.getLogger(__name__)
+
+_RE_UNSAFE = re.compile(r"[^\w.-]+")
+
+# ------------------------------------------------------------
+
+def get_process_label(name:Optional[str]=None) -> str:
+    " hostname:pid, with name if given - e.g. web-1@myhost:1234 "
+    label = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{name}@{label}" if name else label
+
+
+@dataclass
+class SpooledStatement:
+    " one of the slowest statements of a worker - has the same attributes as SqlStatement used in reports "
+    process: str
+    idx: int
+    statement: str
+    duration: Optional[float]
+    server_duration: Optional[float] = None
+    client_duration: Optional[float] = None
+    error: Optional[str] = None
+    # repr of parameters, None when not retained
+    parameters: Optional[str] = None
+
+    @property
+    def info(self) -> StatementInfo:
+        return parsing.parse_statement(self.statement)
+
+    @property
+    def stmt_repr(self) -> str:
+        return self.info.stmt_repr
+
+    @property
+    def sql_type(self) -> str:
+        return self.info.sql_type
+
+    @property
+    def first_table(self) -> str:
+        return self.info.first_table
+
+    @property
+    def fingerprint(self) -> str:
+        return self.info.fingerprint
+
+    @classmethod
+    def from_statement(cls, process:str, stmt) -> "SpooledStatement":
+        " stmt - SqlStatement "
+        return cls(process, stmt.idx, stmt.statement, stmt.duration, server_duration=stmt.server_duration,
+                   client_duration=stmt.client_duration, error=stmt.error,
+                   parameters=get_params_repr(stmt.parameters))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: value for name, value in self.__dict__.items() if name != "process" and value is not None}
+
+    @classmethod
+    def from_dict(cls, process:str, data:Dict[str, Any]) -> "SpooledStatement":
+        return cls(process=process, **data)
+
+# ------------------------------------------------------------
+# Worker side
+# ------------------------------------------------------------
+
+class SpoolWriter:
+    """
+    writes capture state to spool_dir/<process label>-<id>.json, see
+    CaptureSqlStatements(spool_dir=...). interval - seconds between writes
+    from a background thread, None - only on finish().
+    """
+
+    def __init__(self, capture, spool_dir:str, interval:Optional[float]=None, name:Optional[str]=None,
+                 top_slowest:int=SPOOL_SLOWEST_DEFAULT, compress:bool=False):
+        self.capture = capture
+        self.process = get_process_label(name)
+        self.top_slowest = min(top_slowest, capture.keep_slowest)
+        os.makedirs(spool_dir, exist_ok=True)
+        file_name = f"{_RE_UNSAFE.sub('_', self.process)}-{uuid.uuid4().hex[:12]}"
+        self.path = os.path.join(spool_dir, file_name + (".json.gz" if compress else ".json"))
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if interval is not None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True,
+                                            name="capture-sql-spool")
+            self._thread.start()
+
+    def _run(self, interval:float):
+        while not self._stop.wait(interval):
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Writing capture spool file %s failed", self.path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        capture = self.capture
+        # consistent state - listeners wait meanwhile, so only copy it,
+        # fingerprinting and serializing is done outside the lock
+        with capture._lock:
+            stat_list = capture._stats.get_statement_stats(sampling=capture.sampling is not None)
+            count = capture.count()
+            finished = capture.finished
+            duration = capture.duration if finished else None
+            slowest_stmts = capture._stats.get_slowest(self.top_slowest)
+        snapshot = CaptureSnapshot.from_statement_stats(capture.timing.value, count, duration,
+                                                        capture.started.isoformat(), stat_list)
+        slowest = [SpooledStatement.from_statement(self.process, stmt) for stmt in slowest_stmts]
+        return {
+                "version"  : SPOOL_VERSION,
+                "process"  : self.process,
+                "pid"      : os.getpid(),
+                "written"  : datetime.now().isoformat(),
+                "finished" : finished is not None,
+                "snapshot" : snapshot.to_dict(),
+                "slowest"  : [stmt.to_dict() for stmt in slowest],
+                }
+
+    def write(self):
+        data = self.to_dict()
+        with self._write_lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            opener = gzip.open if self.path.endswith(".gz") else open
+            with opener(tmp_path, "wt", encoding="utf-8") as fout:
+                json.dump(data, fout, separators=(",", ":"))
+            # atomic - collector never sees partial files
+            os.replace(tmp_path, self.path)
+
+    def finish(self):
+        " stops periodic writes and writes the final state "
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+# ------------------------------------------------------------
+# Collector side
+# ------------------------------------------------------------
+
+@dataclass
+class SpoolRecord:
+    " the latest state of one worker capture "
+    path: str
+    process: str
+    pid: int
+    written: str
+    finished: bool
+    snapshot: CaptureSnapshot
+    slowest: List[SpooledStatement]
+
+    @classmethod
+    def load(cls, path:str) -> "SpoolRecord":
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as fin:
+            data = json.load(fin)
+        if data.get("version") != SPOOL_VERSION:
+            raise Exception(f"Spool file {path} version {data.get('version')} is not supported, "
+                            f"expected {SPOOL_VERSION}")
+        process = data["process"]
+        return cls(path=path, process=process, pid=data["pid"], written=data["written"],
+                   finished=data["finished"], snapshot=CaptureSnapshot.from_dict(data["snapshot"]),
+                   slowest=[SpooledStatement.from_dict(process, stmt) for stmt in data["slowest"]])
+
+
+class CaptureCollector:
+    """
+    merged view of all spool files in spool_dir - get_stats(), get_slowest()
+    and pp() like CaptureSqlStatements, plus per-process breakdown.
+    Call refresh() to read the latest worker state.
+    """
+
+    def __init__(self, spool_dir:str):
+        self.spool_dir = spool_dir
+        self.records: List[SpoolRecord] = []
+        self.snapshot = CaptureSnapshot.merge([])
+        self.refresh()
+
+    def refresh(self):
+        records = []
+        if os.path.isdir(self.spool_dir):
+            for file_name in sorted(os.listdir(self.spool_dir)):
+                if file_name.endswith(SPOOL_SUFFIXES):
+                    records.append(SpoolRecord.load(os.path.join(self.spool_dir, file_name)))
+        self.records = records
+        self.snapshot = CaptureSnapshot.merge([record.snapshot for record in records])
+
+    def clear(self):
+        " removes spool files read so far "
+        for record in self.records:
+            if os.path.exists(record.path):
+                os.remove(record.path)
+        self.refresh()
+
+    # ------------------------------------------------------------
+
+    @property
+    def processes(self) -> List[str]:
+        return list(dict.fromkeys(record.process for record in self.records))
+
+    def count(self) -> int:
+        return self.snapshot.count
+
+    def _get_snapshot(self, process:Optional[str]) -> CaptureSnapshot:
+        if process is None:
+            return self.snapshot
+        if process not in self.processes:
+            raise Exception(f"Process {process} is not valid, valid are: {self.processes}")
+        return CaptureSnapshot.merge([record.snapshot for record in self.records if record.process == process])
+
+    def get_stats(self, name:StatName, top:Optional[int]=None, order_by:str="duration",
+                  process:Optional[str]=None) -> List[Stat]:
+        " top - None for all groups, process - one process only (see processes) "
+        return self._get_snapshot(process).get_stats(name, top=top, order_by=order_by)
+
+    def get_counts(self, name:StatName, top:Optional[int]=None, process:Optional[str]=None) -> Dict[str, int]:
+        return {stat.key: stat.cnt for stat in self.get_stats(name, top=top, process=process)}
+
+    def get_slowest(self, top:int=5, order_by:str="duration") -> List[Stat]:
+        " only the slowest statements spooled by workers are known, Stat.key is the process "
+        if order_by not in DURATION_FIELDS:
+            raise Exception(f"Order by {order_by} is not valid, valid are: {DURATION_FIELDS}")
+        statements = [stmt for record in self.records for stmt in record.slowest
+                      if getattr(stmt, order_by) is not None]
+        return [Stat(stmt.process, 1, stmt.duration, stmt,
+                     server_duration=stmt.server_duration, client_duration=stmt.client_duration)
+                for stmt in nlargest(top, statements, key=lambda stmt: getattr(stmt, order_by))]
+
+    def get_process_stats(self, order_by:str="duration") -> List[Stat]:
+        " one Stat per process - all its statements "
+        stats: Dict[str, Stat] = {}
+        for record in self.records:
+            stat = stats.get(record.process)
+            if stat is None:
+                stat = stats[record.process] = Stat(record.process, 0, 0.0)
+            for type_stat in record.snapshot.get_stats(StatName.BY_TYPE):
+                merge_stats(stat, type_stat)
+        for stat in stats.values():
+            stat.set_percentiles()
+        return sorted(stats.values(), key=lambda stat: (getattr(stat, order_by) or 0.0, stat.cnt), reverse=True)
+
+    def to_snapshot(self) -> CaptureSnapshot:
+        " merged snapshot, e.g. for diff_captures() "
+        return self.snapshot
+
+    # ------------------------------------------------------------
+
+    def pp(self, print_cmd:Callable=print, top:int=20, order_by:str="duration"):
+        # base imports this module
+        from .base import CaptureSqlStatements, TAB
+        if not self.count():
+            print_cmd(f"No sql statements collected in {self.spool_dir}")
+            return
+        fields = ["cnt", "duration"]
+        if self.snapshot.timing == "server":
+            fields += ["server_duration", "client_duration"]
+        unfinished = sum(1 for record in self.records if not record.finished)
+        separator_line = "=" * 60
+        total = (f"== Totally collected {self.count()} statement(s) from {len(self.processes)} process(es), "
+                 f"{len(self.records)} capture(s)" + (f", {unfinished} not finished" if unfinished else ""))
+        print_cmd(separator_line)
+        print_cmd(total + ":")
+        print_cmd(f"== By process:")
+        print_cmd(f"{TAB}{CaptureSqlStatements._report_stat_list(self.get_process_stats(order_by=order_by), fields)}")
+        print_cmd(separator_line)
+        print_cmd(f"== Slowest (top 5):")
+        for nr, stat in enumerate(self.get_slowest(order_by=order_by), 1):
+            print_cmd(f"{TAB}{nr:3d}. {stat.duration:7.4f} s {stat.key:20s} {stat.statement.stmt_repr[:70]}")
+        for name, title in ((StatName.BY_TYPE, "By sql command"),
+                            (StatName.BY_TOUCHED_TABLE, "By touched table"),
+                            (StatName.BY_FINGERPRINT, "By fingerprint")):
+            print_cmd(separator_line)
+            print_cmd(f"== {title} (top {top}):")
+            print_cmd(f"{TAB}{CaptureSqlStatements._report_stat_list(self.get_stats(name, top=top, order_by=order_by), fields)}")
+        print_cmd(separator_line)
+        print_cmd(total)
+
+# ------------------------------------------------------------
+
+def main(argv:Optional[List[str]]=None, print_cmd:Callable=print) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sqlalchemy_capture_sql.collector",
+                                     description="Merged report of captures spooled by worker processes.")
+    parser.add_argument("spool_dir", help="directory given as spool_dir to CaptureSqlStatements")
+    parser.add_argument("--top", type=int, default=20, help="number of groups shown")
+    parser.add_argument("--clear", action="store_true", help="remove spool files after the report")
+    args = parser.parse_args(argv)
+
+    collector = CaptureCollector(args.spool_dir)
+    collector.pp(print_cmd=print_cmd, top=args.top)
+    if args.clear:
+        collector.clear()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+"""
+Diff of two captures - e.g. two branches or two ORM loader strategies.
+
+Captures are compared per StatName group (by_fingerprint by default): new
+and removed groups, count and duration deltas, ranked by impact. Either side
+can be CaptureSqlStatements, CaptureSnapshot or a path to a saved snapshot.
+
+CLI:
+
+    python -m sqlalchemy_capture_sql.diff old.json new.json --by by_fingerprint by_table
+"""
+import argparse
+import enum
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Union
+
+from .base import CaptureSqlStatements, TAB, TOP_DEFAULT
+from .snapshot import CaptureSnapshot, SNAPSHOT_STAT_NAMES
+from .stats import Stat, StatName
+
+# ------------------------------------------------------------
+
+class DiffStatus(str, enum.Enum):
+    NEW       = "new"
+    REMOVED   = "removed"
+    # count changed
+    CHANGED   = "changed"
+    # the same count, duration may differ
+    UNCHANGED = "unchanged"
+
+
+@dataclass
+class StatDiff:
+    key: str
+    old: Optional[Stat]
+    new: Optional[Stat]
+
+    @property
+    def status(self) -> DiffStatus:
+        if self.old is None:
+            return DiffStatus.NEW
+        if self.new is None:
+            return DiffStatus.REMOVED
+        if self.old.cnt != self.new.cnt:
+            return DiffStatus.CHANGED
+        return DiffStatus.UNCHANGED
+
+    @property
+    def cnt_delta(self) -> int:
+        return (self.new.cnt if self.new else 0) - (self.old.cnt if self.old else 0)
+
+    @property
+    def duration_delta(self) -> float:
+        return (self.new.duration if self.new else 0.0) - (self.old.duration if self.old else 0.0)
+
+    def report_short(self) -> str:
+        old_cnt = self.old.cnt if self.old else 0
+        new_cnt = self.new.cnt if self.new else 0
+        return (f"{self.status.value.upper():9s} {self.cnt_delta:+5d} ({old_cnt:3d} -> {new_cnt:3d}) "
+                f"{self.duration_delta:+9.4f} s {self.key}")
+
+# ------------------------------------------------------------
+
+@dataclass
+class CaptureDiff:
+    name: StatName
+    old: CaptureSnapshot
+    new: CaptureSnapshot
+    # ranked by impact - see diff_captures()
+    items: List[StatDiff]
+
+    @property
+    def new_keys(self) -> List[str]:
+        return [item.key for item in self.items if item.status == DiffStatus.NEW]
+
+    @property
+    def removed_keys(self) -> List[str]:
+        return [item.key for item in self.items if item.status == DiffStatus.REMOVED]
+
+    @property
+    def changed(self) -> List[StatDiff]:
+        " new, removed and the ones with changed count "
+        return [item for item in self.items if item.status != DiffStatus.UNCHANGED]
+
+    def __bool__(self):
+        " True when statements or counts changed "
+        return bool(self.changed)
+
+    def report(self, top:Optional[int]=TOP_DEFAULT, indent:str=TAB) -> str:
+        old_duration = sum(stat.duration for stat in self.old.get_stats(StatName.BY_TYPE))
+        new_duration = sum(stat.duration for stat in self.new.get_stats(StatName.BY_TYPE))
+        out = [f"{self.name.value}: {self.old.count} -> {self.new.count} statement(s) "
+               f"({self.new.count - self.old.count:+d}), {old_duration:.4f} s -> {new_duration:.4f} s "
+               f"({new_duration - old_duration:+.4f} s)"]
+        # durations differ between runs anyway, so all groups are listed by impact
+        items = self.items
+        out.extend(f"{indent}{item.report_short()}" for item in items[:top])
+        if top is not None and len(items) > top:
+            out.append(f"{indent}... {len(items) - top} more")
+        return "\n".join(out)
+
+# ------------------------------------------------------------
+
+CaptureLike = Union[CaptureSqlStatements, CaptureSnapshot, str]
+
+
+def to_snapshot(capture:CaptureLike) -> CaptureSnapshot:
+    if isinstance(capture, CaptureSnapshot):
+        return capture
+    if isinstance(capture, CaptureSqlStatements):
+        return capture.to_snapshot()
+    return CaptureSnapshot.load(capture)
+
+
+def diff_captures(old:CaptureLike, new:CaptureLike, name:StatName=StatName.BY_FINGERPRINT,
+                  order_by:str="duration") -> CaptureDiff:
+    """
+    items are ranked by impact - absolute delta of order_by ("duration" or
+    "cnt"), then absolute delta of the other one
+    """
+    name = StatName(name)
+    if order_by not in ("duration", "cnt"):
+        raise Exception(f"Order by {order_by} is not valid, valid are: ['duration', 'cnt']")
+    old, new = to_snapshot(old), to_snapshot(new)
+    old_stats = {stat.key: stat for stat in old.get_stats(name)}
+    new_stats = {stat.key: stat for stat in new.get_stats(name)}
+    items = [StatDiff(key, old_stats.get(key), new_stats.get(key))
+             for key in list(old_stats) + [key for key in new_stats if key not in old_stats]]
+    if order_by == "duration":
+        items.sort(key=lambda item: (abs(item.duration_delta), abs(item.cnt_delta)), reverse=True)
+    else:
+        items.sort(key=lambda item: (abs(item.cnt_delta), abs(item.duration_delta)), reverse=True)
+    return CaptureDiff(name, old, new, items)
+
+# ------------------------------------------------------------
+
+def main(argv:Optional[List[str]]=None, print_cmd:Callable=print) -> int:
+    " returns exit code - with --check 1 when there are new statements or counts grew "
+    parser = argparse.ArgumentParser(prog="python -m sqlalchemy_capture_sql.diff",
+                                     description="Diff two saved captures (CaptureSqlStatements.save()).")
+    parser.add_argument("old", help="saved capture, .json or .json.gz")
+    parser.add_argument("new", help="saved capture, .json or .json.gz")
+    parser.add_argument("--by", nargs="+", default=[StatName.BY_FINGERPRINT.value], choices=SNAPSHOT_STAT_NAMES,
+                        help="one or more groupings")
+    parser.add_argument("--top", type=int, default=TOP_DEFAULT, help="number of changes shown per grouping")
+    parser.add_argument("--order-by", default="duration", choices=("duration", "cnt"), help="impact measure")
+    parser.add_argument("--check", action="store_true", help="exit with 1 when new statements appear or counts grow")
+    args = parser.parse_args(argv)
+
+    old, new = CaptureSnapshot.load(args.old), CaptureSnapshot.load(args.new)
+    regression = False
+    for name in args.by:
+        capture_diff = diff_captures(old, new, name=name, order_by=args.order_by)
+        print_cmd(capture_diff.report(top=args.top))
+        regression = regression or any(item.cnt_delta > 0 for item in capture_diff.items)
+    return 1 if args.check and regression else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
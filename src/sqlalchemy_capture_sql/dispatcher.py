@@ -0,0 +1,173 @@
+"""
+Shared statement listeners - one set of SQLAlchemy event listeners per engine
+fanning out to all active captures.
+
+Listeners are registered when the first capture of the engine subscribes to
+the event and stay registered afterwards, so nested captures or many short
+captures (e.g. one per request) don't pay for event.listen() / event.remove()
+each time. Subscribers are kept in tuples replaced on every change, so
+dispatching iterates a tuple without locking.
+
+Pool events (see pool.py) are dispatched the same way. "do_get" is not a
+SQLAlchemy event - there is no pool event fired before the checkout, so
+one wrapper of the pool's _do_get() (where QueuePool waits for a free
+connection or opens a new one) is installed per pool, subscribers get the
+checkout wait in seconds.
+"""
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    from sqlalchemy import event
+except ImportError as ex:
+    raise Exception(f"This package requires some SQLAlchemy preinstalled (pip install sqlalchemy?). Error: {ex}")
+
+STATEMENT_EVENTS = ("before_cursor_execute", "after_cursor_execute", "handle_error")
+POOL_EVENTS = ("do_connect", "connect", "checkout", "checkin", "invalidate", "close")
+# pseudo event - wrapper of pool._do_get()
+DO_GET = "do_get"
+EVENTS = STATEMENT_EVENTS + POOL_EVENTS + (DO_GET,)
+
+# ------------------------------------------------------------
+
+class EngineDispatcher:
+    " listeners of one engine (sync_engine of AsyncEngine), see get_dispatcher() "
+
+    def __init__(self, event_target):
+        # weak - dispatchers are values of weak-keyed registry
+        self._event_target_ref = weakref.ref(event_target)
+        self._lock = threading.Lock()
+        # event name -> subscribed functions
+        self._subscribers: Dict[str, Tuple[Callable, ...]] = {name: () for name in EVENTS}
+        # events with registered SQLAlchemy listener
+        self._registered: Dict[str, Callable] = {}
+        # DO_GET - pool with installed wrapper and its original _do_get
+        self._pool_ref: Optional[weakref.ref] = None
+        self._do_get: Optional[Callable] = None
+
+    def subscribe(self, name:str, fn:Callable):
+        if name not in EVENTS:
+            raise Exception(f"Event {name} is not valid, valid are: {list(EVENTS)}")
+        with self._lock:
+            self._subscribers[name] = self._subscribers[name] + (fn,)
+            if name == DO_GET:
+                self._install_do_get()
+            elif name not in self._registered:
+                listener = getattr(self, f"on_{name}")
+                event.listen(self._event_target_ref(), name, listener)
+                self._registered[name] = listener
+
+    def _install_do_get(self):
+        " call with lock acquired - engine.dispose() replaces the pool, the new one is wrapped then "
+        pool = getattr(self._event_target_ref(), "pool", None)
+        if pool is None or not hasattr(pool, "_do_get"):
+            return
+        if self._pool_ref is not None and self._pool_ref() is pool:
+            return
+        self._uninstall_do_get()
+        self._do_get = pool._do_get
+        pool._do_get = self._timed_do_get
+        self._pool_ref = weakref.ref(pool)
+
+    def _uninstall_do_get(self):
+        pool = self._pool_ref() if self._pool_ref is not None else None
+        if pool is not None and pool.__dict__.get("_do_get") == self._timed_do_get:
+            del pool._do_get
+        self._pool_ref = self._do_get = None
+
+    def unsubscribe(self, name:str, fn:Callable):
+        with self._lock:
+            self._subscribers[name] = tuple(subscriber for subscriber in self._subscribers[name]
+                                            if subscriber != fn)
+
+    def get_nr_subscribers(self, name:str="before_cursor_execute") -> int:
+        return len(self._subscribers[name])
+
+    def remove(self):
+        " removes SQLAlchemy listeners, subscribers are dropped "
+        with self._lock:
+            event_target = self._event_target_ref()
+            for name, listener in self._registered.items():
+                if event_target is not None:
+                    event.remove(event_target, name, listener)
+            self._registered.clear()
+            self._uninstall_do_get()
+            self._subscribers = {name: () for name in EVENTS}
+
+    # ------------------------------------------------------------
+
+    def on_before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        for fn in self._subscribers["before_cursor_execute"]:
+            fn(conn, cursor, statement, parameters, context, executemany)
+
+    def on_after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        for fn in self._subscribers["after_cursor_execute"]:
+            fn(conn, cursor, statement, parameters, context, executemany)
+
+    def on_handle_error(self, exception_context):
+        for fn in self._subscribers["handle_error"]:
+            fn(exception_context)
+
+    def on_do_connect(self, dialect, conn_rec, cargs, cparams):
+        for fn in self._subscribers["do_connect"]:
+            fn(dialect, conn_rec, cargs, cparams)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        for fn in self._subscribers["connect"]:
+            fn(dbapi_connection, connection_record)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        for fn in self._subscribers["checkout"]:
+            fn(dbapi_connection, connection_record, connection_proxy)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        for fn in self._subscribers["checkin"]:
+            fn(dbapi_connection, connection_record)
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        for fn in self._subscribers["invalidate"]:
+            fn(dbapi_connection, connection_record, exception)
+
+    def on_close(self, dbapi_connection, connection_record):
+        for fn in self._subscribers["close"]:
+            fn(dbapi_connection, connection_record)
+
+    def _timed_do_get(self):
+        subscribers = self._subscribers[DO_GET]
+        if not subscribers:
+            return self._do_get()
+        started_ns = time.perf_counter_ns()
+        try:
+            return self._do_get()
+        finally:
+            duration = (time.perf_counter_ns() - started_ns) / 1_000_000_000.0
+            for fn in subscribers:
+                fn(duration)
+
+# ------------------------------------------------------------
+
+_dispatchers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_dispatchers_lock = threading.Lock()
+
+
+def get_dispatcher(engine) -> EngineDispatcher:
+    " creates dispatcher on first call per engine, AsyncEngine is supported too "
+    event_target = getattr(engine, "sync_engine", engine)
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(event_target)
+        if dispatcher is None:
+            dispatcher = _dispatchers[event_target] = EngineDispatcher(event_target)
+        return dispatcher
+
+
+def remove_dispatcher(engine) -> bool:
+    " removes listeners registered on the engine, returns False when there were none "
+    event_target = getattr(engine, "sync_engine", engine)
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.pop(event_target, None)
+    if dispatcher is None:
+        return False
+    dispatcher.remove()
+    return True
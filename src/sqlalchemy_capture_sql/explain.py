@@ -0,0 +1,185 @@
+"""
+EXPLAIN of captured statements - plan lines with flagged full table scans and
+temporary sorts.
+
+Plan command depends on dialect: EXPLAIN QUERY PLAN for SQLite, EXPLAIN for
+PostgreSQL and MySQL / MariaDB. Statement is explained with its captured
+parameters, so parameters need to be retained (ParamsPolicy keep, copy or
+first_n). Plans are cached per dialect and fingerprint in a module level LRU
+cache - repeated captures don't explain the same statements again.
+"""
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import parsing
+
+PLAN_CACHE_SIZE = 256
+
+EXPLAIN_PREFIXES = {
+        "sqlite"     : "EXPLAIN QUERY PLAN ",
+        "postgresql" : "EXPLAIN ",
+        "mysql"      : "EXPLAIN ",
+        "mariadb"    : "EXPLAIN ",
+        }
+
+# ------------------------------------------------------------
+
+@dataclass
+class ExplainPlan:
+    fingerprint: str
+    statement: str
+    dialect: str
+    # plan as text lines
+    lines: List[str] = field(default_factory=list)
+    # tables read by full table scan
+    full_scans: List[str] = field(default_factory=list)
+    # plan steps sorting / grouping in temporary structures
+    temp_sorts: List[str] = field(default_factory=list)
+    # explain failed, e.g. parameters not retained
+    error: Optional[str] = None
+
+    @property
+    def flags(self) -> List[str]:
+        return ([f"FULL SCAN {table}" for table in self.full_scans]
+                + [f"TEMP SORT {step}" for step in self.temp_sorts])
+
+    def report(self, indent:str="") -> str:
+        if self.error:
+            return f"{indent}<explain failed: {self.error}>"
+        out = [f"{indent}{line}" for line in self.lines]
+        if self.flags:
+            out.append(f"{indent}!! {', '.join(self.flags)}")
+        return "\n".join(out)
+
+# ------------------------------------------------------------
+# Plan parsing per dialect
+# ------------------------------------------------------------
+
+_RE_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(?!SUBQUERY\b|CONSTANT ROW\b)(\S+)")
+_RE_SQLITE_TEMP = re.compile(r"^USE TEMP B-TREE\b")
+_RE_PG_SCAN = re.compile(r"\bSeq Scan on (\S+)")
+# plan node, not "Sort Key:" / "Sort Method:" detail lines
+_RE_PG_SORT = re.compile(r"^\s*(?:->\s*)?((?:Incremental )?Sort)(?:\s+\(|\s*$)")
+
+
+def _parse_sqlite(plan: ExplainPlan, rows:List[Tuple]):
+    # (id, parent, notused, detail) - indent by depth of the parent
+    depths: Dict[Any, int] = {}
+    for row in rows:
+        node_id, parent, detail = row[0], row[1], row[-1]
+        depth = depths[node_id] = depths.get(parent, -1) + 1
+        plan.lines.append("  " * depth + detail)
+        match = _RE_SQLITE_SCAN.match(detail)
+        if match:
+            plan.full_scans.append(match.group(1))
+        if _RE_SQLITE_TEMP.match(detail):
+            plan.temp_sorts.append(detail)
+
+
+def _parse_postgresql(plan: ExplainPlan, rows:List[Tuple]):
+    for (line,) in rows:
+        plan.lines.append(line)
+        match = _RE_PG_SCAN.search(line)
+        if match:
+            plan.full_scans.append(match.group(1))
+        match = _RE_PG_SORT.match(line)
+        if match:
+            plan.temp_sorts.append(match.group(1))
+
+
+def _parse_mysql(plan: ExplainPlan, rows:List[Dict[str, Any]]):
+    for row in rows:
+        plan.lines.append(" ".join(f"{key}={value}" for key, value in row.items() if value is not None))
+        if str(row.get("type", "")).upper() == "ALL":
+            plan.full_scans.append(str(row.get("table")))
+        extra = str(row.get("Extra") or "")
+        for step in ("Using temporary", "Using filesort"):
+            if step in extra:
+                plan.temp_sorts.append(step)
+
+# ------------------------------------------------------------
+# Cache
+# ------------------------------------------------------------
+
+_plan_cache: "OrderedDict[Tuple[str, str], ExplainPlan]" = OrderedDict()
+
+
+def plan_cache_clear():
+    _plan_cache.clear()
+
+
+def plan_cache_size() -> int:
+    return len(_plan_cache)
+
+
+def _cache_get(key:Tuple[str, str]) -> Optional[ExplainPlan]:
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        _plan_cache.move_to_end(key)
+    return plan
+
+
+def _cache_put(key:Tuple[str, str], plan:ExplainPlan):
+    _plan_cache[key] = plan
+    _plan_cache.move_to_end(key)
+    while len(_plan_cache) > PLAN_CACHE_SIZE:
+        _plan_cache.popitem(last=False)
+
+# ------------------------------------------------------------
+
+def get_explain_parameters(stmt) -> Tuple[bool, Any]:
+    " (ok, parameters) - parameters as captured, for executemany the first row "
+    parameters = stmt.parameters
+    if isinstance(parameters, str):
+        # ParamsPolicy.REPR / HASH
+        return False, None
+    if stmt.executemany and isinstance(parameters, (list, tuple)):
+        parameters = parameters[0] if parameters else None
+    # None - no parameters or ParamsPolicy.DROP (explain fails then)
+    return True, parameters if parameters is not None else ()
+
+
+def explain_statement(connection, stmt, use_cache:bool=True) -> ExplainPlan:
+    """
+    connection - SQLAlchemy Connection, stmt - SqlStatement. Errors are not
+    raised but stored in the plan (and not cached).
+    """
+    dialect = connection.dialect.name
+    fingerprint = parsing.parse_statement(stmt.statement).fingerprint
+    key = (dialect, fingerprint)
+    if use_cache:
+        plan = _cache_get(key)
+        if plan is not None:
+            return plan
+
+    plan = ExplainPlan(fingerprint, stmt.statement, dialect)
+    prefix = EXPLAIN_PREFIXES.get(dialect)
+    if prefix is None:
+        plan.error = f"dialect {dialect} is not supported, supported are: {list(EXPLAIN_PREFIXES)}"
+        return plan
+    ok, parameters = get_explain_parameters(stmt)
+    if not ok:
+        plan.error = "parameters are not retained, see params_policy"
+        return plan
+
+    in_transaction = connection.in_transaction()
+    try:
+        result = connection.exec_driver_sql(prefix + stmt.statement, parameters)
+        if dialect == "sqlite":
+            _parse_sqlite(plan, result.fetchall())
+        elif dialect == "postgresql":
+            _parse_postgresql(plan, result.fetchall())
+        else:
+            _parse_mysql(plan, [dict(row) for row in result.mappings()])
+    except Exception as ex:
+        plan.error = repr(ex)
+        return plan
+    finally:
+        # don't leave the autobegun transaction open
+        if not in_transaction and connection.in_transaction():
+            connection.rollback()
+    if use_cache:
+        _cache_put(key, plan)
+    return plan
@@ -0,0 +1,267 @@
+"""
+Timeline exporters of a finished capture - Chrome trace-event JSON (open in
+https://ui.perfetto.dev or chrome://tracing) and OTLP/JSON compatible span
+dicts, see CaptureSqlStatements.save_chrome_trace() / save_otlp().
+
+Every statement is one event / span starting at its start timestamp. Its
+length is server_duration with TimingMode.SERVER (DB execution only),
+otherwise duration (until the next statement). Fingerprint, tables,
+parameters (repr truncated to params_max_repr), span etc. are attributes.
+Capture spans (CaptureSqlStatements.span()) are exported too.
+
+Events are generated and written one by one, memory use doesn't depend on
+the number of statements. Files are gzip compressed when the name ends with
+".gz".
+
+Statements don't record their thread, so overlapping statements (threads,
+asyncio tasks) are put to separate timeline lanes (Chrome trace tid "sql 1",
+"sql 2", ...), the same for spans ("span 1", ...).
+Chrome trace timestamps are time.perf_counter_ns() based by default (the
+same clock as e.g. viztracer), wall_clock=True gives unix time instead.
+OTLP timestamps are always unix time.
+"""
+import gzip
+import json
+import os
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .parameters import get_params_repr
+from .spans import Span
+
+# OTLP Span.Kind and Status.Code values
+OTLP_SPAN_KIND_INTERNAL = 1
+OTLP_SPAN_KIND_CLIENT = 3
+OTLP_STATUS_CODE_ERROR = 2
+OTLP_SERVICE_NAME_DEFAULT = "sqlalchemy-capture-sql"
+OTLP_SCOPE_NAME = "sqlalchemy_capture_sql"
+
+CHROME_CATEGORY_SQL = "sql"
+CHROME_CATEGORY_SPAN = "span"
+# Chrome trace tid of statement lanes - span lanes are 1, 2, ...
+CHROME_SQL_TID_OFFSET = 1000
+
+# ------------------------------------------------------------
+
+class _Lanes:
+    """
+    assigns intervals ordered by start to the first lane where it doesn't
+    overlap, with nesting=True (spans) nested intervals can share the lane
+    with the parent
+    """
+
+    def __init__(self, nesting:bool):
+        self.nesting = nesting
+        # per lane - ends of open (nesting) intervals
+        self.lanes: List[List[int]] = []
+
+    def add(self, started_ns:int, ended_ns:int) -> int:
+        " returns lane number, 1... "
+        for nr, ends in enumerate(self.lanes, 1):
+            while ends and ends[-1] <= started_ns:
+                ends.pop()
+            if not ends or (self.nesting and ended_ns <= ends[-1]):
+                ends.append(ended_ns)
+                return nr
+        self.lanes.append([ended_ns])
+        return len(self.lanes)
+
+
+def _check_finished(capture):
+    if not capture.finished:
+        raise Exception("Export needs finished capture, call finish() first")
+
+
+def _get_ended_ns(stmt) -> Optional[int]:
+    if stmt.tst_ended_ns is not None:
+        return stmt.tst_ended_ns
+    return stmt.tst_next_ns
+
+
+def get_statement_attributes(capture, stmt) -> Dict[str, Any]:
+    " attributes of one exported statement, None values left out "
+    call_site = stmt.call_site
+    attributes = {
+            "idx"            : stmt.idx,
+            "sql_type"       : stmt.sql_type,
+            "first_table"    : stmt.first_table,
+            "tables"         : ", ".join(stmt.info.tables),
+            "fingerprint"    : stmt.fingerprint,
+            "statement"      : stmt.statement,
+            "parameters"     : get_params_repr(stmt.parameters, capture.params_max_repr),
+            "executemany"    : stmt.executemany,
+            "duration"       : stmt.duration,
+            "server_duration": stmt.server_duration,
+            "client_duration": stmt.client_duration,
+            "error"          : stmt.error,
+            "span"           : stmt.span,
+            "rowcount"       : stmt.rowcount,
+            "rows_fetched"   : stmt.rows_fetched,
+            "call_site"      : str(call_site) if call_site is not None else None,
+            }
+    return {name: value for name, value in attributes.items() if value is not None}
+
+# ------------------------------------------------------------
+# Chrome trace
+# ------------------------------------------------------------
+
+def iter_chrome_trace_events(capture, wall_clock:bool=False, pid:Optional[int]=None) -> Iterator[Dict[str, Any]]:
+    " trace events - complete events (ph X) of spans and statements, lane names at the end "
+    _check_finished(capture)
+    pid = pid if pid is not None else os.getpid()
+    offset_ns = (int(capture.started.timestamp() * 1_000_000_000) - capture.started_ns) if wall_clock else 0
+
+    def to_us(tst_ns:int) -> float:
+        return (tst_ns + offset_ns) / 1_000.0
+
+    span_lanes = _Lanes(nesting=True)
+    for span in sorted(capture.get_spans(), key=lambda span: span.started_ns):
+        lane = span_lanes.add(span.started_ns, span.ended_ns)
+        yield {"name": span.name, "cat": CHROME_CATEGORY_SPAN, "ph": "X", "ts": to_us(span.started_ns),
+               "dur": (span.ended_ns - span.started_ns) / 1_000.0, "pid": pid, "tid": lane}
+
+    sql_lanes = _Lanes(nesting=False)
+    for stmt in capture:
+        ended_ns = _get_ended_ns(stmt)
+        if ended_ns is None:
+            continue
+        lane = sql_lanes.add(stmt.tst_started_ns, ended_ns)
+        yield {"name": f"{stmt.sql_type} {stmt.first_table}", "cat": CHROME_CATEGORY_SQL, "ph": "X",
+               "ts": to_us(stmt.tst_started_ns), "dur": (ended_ns - stmt.tst_started_ns) / 1_000.0,
+               "pid": pid, "tid": CHROME_SQL_TID_OFFSET + lane, "args": get_statement_attributes(capture, stmt)}
+
+    yield {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"sql capture {pid}"}}
+    for prefix, tid_offset, lanes in (("span", 0, span_lanes), ("sql", CHROME_SQL_TID_OFFSET, sql_lanes)):
+        for nr in range(1, len(lanes.lanes) + 1):
+            yield {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid_offset + nr,
+                   "args": {"name": f"{prefix} {nr}"}}
+
+
+def _open(path:str):
+    opener = gzip.open if path.endswith(".gz") else open
+    return opener(path, "wt", encoding="utf-8")
+
+
+def save_chrome_trace(capture, path:str, wall_clock:bool=False) -> int:
+    " writes {'traceEvents': [...]} JSON event by event, returns number of events "
+    nr_events = 0
+    with _open(path) as fout:
+        fout.write('{"displayTimeUnit":"ms","traceEvents":[')
+        for event in iter_chrome_trace_events(capture, wall_clock=wall_clock):
+            if nr_events:
+                fout.write(",\n")
+            fout.write(json.dumps(event, separators=(",", ":"), default=str))
+            nr_events += 1
+        fout.write("]}\n")
+    return nr_events
+
+# ------------------------------------------------------------
+# OpenTelemetry
+# ------------------------------------------------------------
+
+def to_otlp_value(value:Any) -> Dict[str, Any]:
+    " OTLP/JSON AnyValue - int64 as string "
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_attributes(attributes:Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": to_otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _get_span_id(nr:int) -> str:
+    return f"{nr:016x}"
+
+
+def iter_otlp_spans(capture, trace_id:Optional[str]=None) -> Iterator[Dict[str, Any]]:
+    """
+    OTLP/JSON Span dicts - root span of the whole capture, capture spans and
+    one client span per statement. Statement attributes use db.* semantic
+    conventions where available, the rest is prefixed with "db.capture.".
+    """
+    _check_finished(capture)
+    trace_id = trace_id or uuid.uuid4().hex
+    offset_ns = int(capture.started.timestamp() * 1_000_000_000) - capture.started_ns
+    db_system = capture._event_target.dialect.name
+
+    def to_unix_nano(tst_ns:int) -> str:
+        return str(tst_ns + offset_ns)
+
+    # statements get ids 1..N (idx), spans and root are above
+    next_id = [1 << 62]
+
+    def new_id() -> str:
+        next_id[0] += 1
+        return _get_span_id(next_id[0])
+
+    root_id = new_id()
+    finished_ns = capture.started_ns + int(capture.duration * 1_000_000_000)
+    yield {"traceId": trace_id, "spanId": root_id, "name": "sql capture", "kind": OTLP_SPAN_KIND_INTERNAL,
+           "startTimeUnixNano": to_unix_nano(capture.started_ns), "endTimeUnixNano": to_unix_nano(finished_ns),
+           "attributes": to_otlp_attributes({"db.system": db_system, "db.capture.count": capture.count()})}
+
+    # capture span name -> id of the latest one started, spans with the same
+    # name may repeat - statement belongs to the latest one started before it
+    span_ids: Dict[str, str] = {}
+    spans: List[Tuple[Span, str]] = [(span, new_id())
+                                     for span in sorted(capture.get_spans(), key=lambda span: span.started_ns)]
+    pos = 0
+
+    def advance_spans(tst_ns:int) -> Iterator[Dict[str, Any]]:
+        nonlocal pos
+        while pos < len(spans) and spans[pos][0].started_ns <= tst_ns:
+            span, span_id = spans[pos]
+            pos += 1
+            parent_id = span_ids.get(span.parent, root_id) if span.parent is not None else root_id
+            span_ids[span.name] = span_id
+            yield {"traceId": trace_id, "spanId": span_id, "parentSpanId": parent_id, "name": span.name,
+                   "kind": OTLP_SPAN_KIND_INTERNAL, "startTimeUnixNano": to_unix_nano(span.started_ns),
+                   "endTimeUnixNano": to_unix_nano(span.ended_ns), "attributes": []}
+
+    for stmt in capture:
+        ended_ns = _get_ended_ns(stmt)
+        if ended_ns is None:
+            continue
+        yield from advance_spans(stmt.tst_started_ns)
+        attributes = get_statement_attributes(capture, stmt)
+        otlp_attributes = {
+                "db.system"    : db_system,
+                "db.statement" : attributes.pop("statement"),
+                "db.operation" : attributes.pop("sql_type"),
+                "db.sql.table" : attributes.pop("first_table"),
+                }
+        otlp_attributes.update((f"db.capture.{name}", value) for name, value in attributes.items())
+        otlp_span = {"traceId": trace_id, "spanId": _get_span_id(stmt.idx),
+                     "parentSpanId": span_ids.get(stmt.span, root_id) if stmt.span is not None else root_id,
+                     "name": f"{stmt.sql_type} {stmt.first_table}", "kind": OTLP_SPAN_KIND_CLIENT,
+                     "startTimeUnixNano": to_unix_nano(stmt.tst_started_ns),
+                     "endTimeUnixNano": to_unix_nano(ended_ns),
+                     "attributes": to_otlp_attributes(otlp_attributes)}
+        if stmt.error is not None:
+            otlp_span["status"] = {"code": OTLP_STATUS_CODE_ERROR, "message": stmt.error}
+        yield otlp_span
+    yield from advance_spans(finished_ns)
+
+
+def save_otlp(capture, path:str, service_name:str=OTLP_SERVICE_NAME_DEFAULT, trace_id:Optional[str]=None) -> int:
+    """
+    writes OTLP/JSON ExportTraceServiceRequest ({"resourceSpans": [...]}),
+    span by span, returns number of spans
+    """
+    nr_spans = 0
+    resource = {"attributes": to_otlp_attributes({"service.name": service_name})}
+    with _open(path) as fout:
+        fout.write('{"resourceSpans":[{"resource":%s,"scopeSpans":[{"scope":{"name":"%s"},"spans":['
+                   % (json.dumps(resource, separators=(",", ":")), OTLP_SCOPE_NAME))
+        for span in iter_otlp_spans(capture, trace_id=trace_id):
+            if nr_spans:
+                fout.write(",\n")
+            fout.write(json.dumps(span, separators=(",", ":")))
+            nr_spans += 1
+        fout.write("]}]}]}\n")
+    return nr_spans
@@ -0,0 +1,126 @@
+"""
+Streaming, mergeable latency histogram with log-sized buckets.
+
+Bucket boundaries grow by 2**(1/8) (~9%) starting from 1 microsecond, so any
+quantile is reported with ~9% relative error and the number of buckets is
+bounded (up to ~1 hour durations), regardless of number of values added.
+"""
+import math
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+MIN_VALUE = 0.000_001 # 1 us
+BUCKETS_PER_OCTAVE = 8
+# 2**(MAX_BUCKET/8) us ~= 1.2 hour, the last bucket holds everything longer
+MAX_BUCKET = 8 * 32
+
+_LOG_FACTOR = BUCKETS_PER_OCTAVE / math.log(2)
+
+# ------------------------------------------------------------
+
+def get_bucket(value:float) -> int:
+    if value <= MIN_VALUE:
+        return 0
+    return min(MAX_BUCKET, 1 + int(math.log(value / MIN_VALUE) * _LOG_FACTOR))
+
+
+def get_bucket_bounds(bucket:int) -> Tuple[float, float]:
+    if bucket == 0:
+        return 0.0, MIN_VALUE
+    return (MIN_VALUE * 2 ** ((bucket - 1) / BUCKETS_PER_OCTAVE),
+            MIN_VALUE * 2 ** (bucket / BUCKETS_PER_OCTAVE))
+
+# ------------------------------------------------------------
+
+class Histogram:
+    __slots__ = ("counts", "cnt", "total", "max")
+
+    def __init__(self):
+        # sparse - bucket -> count, at most MAX_BUCKET+1 items
+        self.counts: Dict[int, int] = {}
+        self.cnt = 0
+        self.total = 0.0
+        self.max: Optional[float] = None
+
+    def add(self, value:float):
+        bucket = get_bucket(value)
+        counts = self.counts
+        counts[bucket] = counts.get(bucket, 0) + 1
+        self.cnt += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other:"Histogram"):
+        counts = self.counts
+        for bucket, cnt in other.counts.items():
+            counts[bucket] = counts.get(bucket, 0) + cnt
+        self.cnt += other.cnt
+        self.total += other.total
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def copy(self) -> "Histogram":
+        hist = Histogram()
+        hist.merge(self)
+        return hist
+
+    def to_dict(self) -> Dict[str, Any]:
+        " JSON serializable "
+        return {"counts": {str(bucket): cnt for bucket, cnt in sorted(self.counts.items())},
+                "cnt": self.cnt, "total": self.total, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any]) -> "Histogram":
+        hist = cls()
+        hist.counts = {int(bucket): cnt for bucket, cnt in data["counts"].items()}
+        hist.cnt = data["cnt"]
+        hist.total = data["total"]
+        hist.max = data["max"]
+        return hist
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.cnt if self.cnt else None
+
+    def quantile(self, q:float) -> Optional[float]:
+        " upper bound of the bucket where q-th value is, never above max "
+        if not self.cnt:
+            return None
+        rank = q * self.cnt
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(get_bucket_bounds(bucket)[1], self.max)
+        return self.max
+
+    def iter_buckets(self) -> Iterator[Tuple[float, float, int]]:
+        " (low, high, count) for non-empty buckets "
+        for bucket in sorted(self.counts):
+            low, high = get_bucket_bounds(bucket)
+            yield low, high, self.counts[bucket]
+
+    def render(self, width:int=40, indent:str="") -> str:
+        " ascii histogram, buckets merged by decade (1us, 10us, ... 1s, 10s) "
+        decades: Dict[int, int] = {}
+        for low, high, cnt in self.iter_buckets():
+            decade = math.floor(math.log10(max(low, MIN_VALUE)) + 1e-9)
+            decades[decade] = decades.get(decade, 0) + cnt
+        if not decades:
+            return f"{indent}<empty>"
+        max_cnt = max(decades.values())
+        lines = []
+        for decade in range(min(decades), max(decades) + 1):
+            cnt = decades.get(decade, 0)
+            bar = "#" * max(1 if cnt else 0, round(cnt * width / max_cnt))
+            lines.append(f"{indent}{_format_seconds(10 ** decade):>7s} - {_format_seconds(10 ** (decade + 1)):<7s} "
+                         f"{cnt:6d} {bar}")
+        return "\n".join(lines)
+
+
+def _format_seconds(value:float) -> str:
+    if value < 0.001:
+        return f"{value * 1_000_000:g}us"
+    if value < 1:
+        return f"{value * 1_000:g}ms"
+    return f"{value:g}s"
@@ -0,0 +1,90 @@
+"""
+N+1 query detector - finds statements with the same fingerprint (literals and
+parameters stripped) issued from the same application call-site more than
+threshold times. Total number of such statements in the capture is counted,
+not consecutive runs - repeats may be interleaved with other statements
+(e.g. loading two relations per parent row), first_idx / last_idx show the
+range.
+
+Call-sites are available only when capture is created with
+capture_call_sites=True, otherwise statements are grouped by fingerprint only.
+Statements of different capture spans are counted separately by default.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .call_sites import CallSite
+
+N_PLUS_ONE_THRESHOLD = 5
+N_PLUS_ONE_SQL_TYPES = ("SELECT",)
+
+# ------------------------------------------------------------
+
+@dataclass
+class NPlusOneFinding:
+    fingerprint: str
+    call_site: Optional[CallSite]
+    cnt: int
+    duration: float
+    first_idx: int
+    last_idx: int
+    # the first one issued
+    statement: Any = field(repr=False) # SqlStatement
+    # by_span only - CaptureSqlStatements.span() name
+    span: Optional[str] = None
+
+    def report_short(self) -> str:
+        span = f"  [{self.span}]" if self.span is not None else ""
+        stmt_repr = self.statement.stmt_repr[:70].replace("\n", " ")
+        return (f"{self.cnt:4d}x {self.duration:7.3f} s  rows {self.first_idx}-{self.last_idx}  "
+                f"{self.call_site or '<unknown call-site>'}{span}\n"
+                f"         {stmt_repr}")
+
+# ------------------------------------------------------------
+
+@dataclass
+class NPlusOneReport:
+    threshold: int
+    # ordered by duration, most expensive first
+    findings: List[NPlusOneFinding]
+
+    def __bool__(self):
+        return bool(self.findings)
+
+    def __iter__(self):
+        return iter(self.findings)
+
+    def report(self, indent:str="") -> str:
+        if not self.findings:
+            return f"{indent}No statements repeated more than {self.threshold} times"
+        return "\n".join(f"{indent}{nr:3d}. {finding.report_short()}"
+                         for nr, finding in enumerate(self.findings, 1))
+
+# ------------------------------------------------------------
+
+def detect_n_plus_one(statements:Iterable[Any], threshold:int=N_PLUS_ONE_THRESHOLD,
+                      sql_types:Optional[Tuple[str, ...]]=N_PLUS_ONE_SQL_TYPES,
+                      by_span:bool=True) -> NPlusOneReport:
+    """
+    statements - SqlStatement objects, usually the capture itself
+    sql_types - None for all types
+    by_span - group by span too, finding per span
+    """
+    groups: Dict[Tuple[str, Optional[CallSite], Optional[str]], NPlusOneFinding] = {}
+    for stmt in statements:
+        if sql_types is not None and stmt.sql_type not in sql_types:
+            continue
+        key = (stmt.fingerprint, stmt.call_site, stmt.span if by_span else None)
+        finding = groups.get(key)
+        if finding is None:
+            groups[key] = NPlusOneFinding(
+                    fingerprint=key[0], call_site=key[1], cnt=1, duration=stmt.duration or 0.0,
+                    first_idx=stmt.idx, last_idx=stmt.idx, statement=stmt, span=key[2])
+        else:
+            finding.cnt += 1
+            finding.duration += stmt.duration or 0.0
+            finding.last_idx = stmt.idx
+
+    findings = [finding for finding in groups.values() if finding.cnt > threshold]
+    findings.sort(key=lambda finding: (finding.duration, finding.cnt), reverse=True)
+    return NPlusOneReport(threshold=threshold, findings=findings)
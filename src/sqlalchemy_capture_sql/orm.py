@@ -0,0 +1,343 @@
+"""
+ORM unit of work attribution - statements are tagged with the Session
+transaction and flush that issued them, see CaptureSqlStatements(capture_session=...).
+
+Session events after_begin, before_flush, after_flush, after_commit,
+after_rollback and after_transaction_end are used. Statements are matched to
+sessions by the connection (after_begin gives the connection of the
+transaction). Commit latency is measured from the engine commit event (just
+before DBAPI commit) to after_commit. Flush reason (autoflush, commit or
+explicit flush()) is found by looking at the caller frames of the flush.
+"""
+import enum
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+except ImportError as ex:
+    raise Exception(f"This package requires some SQLAlchemy preinstalled (pip install sqlalchemy?). Error: {ex}")
+
+from .pool import _Timing
+from .stats import Stat
+
+# key of statements issued in a transaction but outside of any flush
+NO_FLUSH = "<no flush>"
+# how many caller frames are checked to find the flush reason
+FLUSH_REASON_MAX_DEPTH = 12
+
+# ------------------------------------------------------------
+
+class FlushReason(str, enum.Enum):
+    # Query / Session.execute() invoked autoflush
+    AUTOFLUSH = "autoflush"
+    # flush on Session.commit()
+    COMMIT    = "commit"
+    # Session.flush() called
+    EXPLICIT  = "explicit"
+
+
+class TransactionOutcome(str, enum.Enum):
+    COMMIT   = "commit"
+    ROLLBACK = "rollback"
+    # Session.close() without commit or rollback
+    CLOSED   = "closed"
+
+# ------------------------------------------------------------
+
+def _ns_to_seconds(diff_ns:int) -> float:
+    return diff_ns / 1_000_000_000.0
+
+
+@dataclass
+class TransactionInfo:
+    " Session (root) transaction on the captured engine "
+    idx: int
+    session_id: int
+    # when the transaction began on the connection (after_begin)
+    started_ns: int
+    ended_ns: Optional[int] = None
+    # None - still open
+    outcome: Optional[TransactionOutcome] = None
+    # engine commit event -> after_commit
+    commit_duration: Optional[float] = None
+    # statements issued in the transaction and sum of their (measured) durations
+    cnt: int = 0
+    statements_duration: float = 0.0
+    nr_flushes: int = 0
+    _commit_started_ns: Optional[int] = field(default=None, repr=False)
+    _rolled_back: bool = field(default=False, repr=False)
+
+    @property
+    def duration(self) -> float:
+        " wall time of the transaction in seconds, until now for open ones "
+        ended_ns = self.ended_ns if self.ended_ns is not None else time.perf_counter_ns()
+        return _ns_to_seconds(ended_ns - self.started_ns)
+
+
+@dataclass
+class FlushInfo:
+    " flush which issued at least one statement on the captured engine "
+    idx: int
+    reason: FlushReason
+    session_id: int
+    started_ns: int
+    ended_ns: Optional[int] = None
+    transaction: Optional[int] = None
+    # new + dirty + deleted objects on before_flush
+    nr_objects: int = 0
+    cnt: int = 0
+    statements_duration: float = 0.0
+
+    @property
+    def duration(self) -> float:
+        ended_ns = self.ended_ns if self.ended_ns is not None else time.perf_counter_ns()
+        return _ns_to_seconds(ended_ns - self.started_ns)
+
+
+@dataclass
+class SessionStats:
+    transactions: int
+    committed: int
+    rolled_back: int
+    flushes: int
+    # timings - cnt, duration (total), min/max, mean and percentiles, ended transactions only
+    transaction_duration: Stat
+    commit_duration: Stat
+    flush_duration: Stat
+    # statements (cnt and duration) per FlushReason value + NO_FLUSH
+    statements_by_flush: List[Stat] = field(default_factory=list)
+
+    @property
+    def timings(self) -> List[Stat]:
+        return [self.transaction_duration, self.commit_duration, self.flush_duration]
+
+# ------------------------------------------------------------
+
+class _SessionState:
+    " current transaction and flush of one session "
+    __slots__ = ("transaction", "flush", "connections")
+
+    def __init__(self):
+        self.transaction: Optional[TransactionInfo] = None
+        # FlushInfo with idx 0 - not registered until it issues a statement
+        self.flush: Optional[FlushInfo] = None
+        self.connections: List[int] = []
+
+
+def get_flush_reason() -> FlushReason:
+    frame = sys._getframe(2)
+    for _ in range(FLUSH_REASON_MAX_DEPTH):
+        if frame is None:
+            break
+        name = frame.f_code.co_name
+        if name == "_autoflush":
+            return FlushReason.AUTOFLUSH
+        if name == "_prepare_impl":
+            return FlushReason.COMMIT
+        frame = frame.f_back
+    return FlushReason.EXPLICIT
+
+
+class SessionCollector:
+    """
+    listens Session events, see CaptureSqlStatements(capture_session=...).
+    session_target - Session class (all sessions), sessionmaker,
+    scoped_session or Session instance
+    """
+
+    EVENTS = ("after_begin", "before_flush", "after_flush", "after_commit", "after_rollback",
+              "after_transaction_end")
+
+    def __init__(self, session_target, engine):
+        # AsyncSession - events are available on sync session only
+        self._session_target = getattr(session_target, "sync_session", session_target)
+        self._engine = engine
+        self._lock = threading.Lock()
+        self.transactions: List[TransactionInfo] = []
+        self.flushes: List[FlushInfo] = []
+        self.transaction_duration = _Timing()
+        self.commit_duration = _Timing()
+        self.flush_duration = _Timing()
+        # id(session) -> state
+        self._sessions: Dict[int, _SessionState] = {}
+        # id(connection) -> state of the session using it
+        self._connections: Dict[int, _SessionState] = {}
+
+        self._listeners: List[Tuple[Any, str, Callable]] = []
+        for name in self.EVENTS:
+            self._listeners.append((self._session_target, name, getattr(self, f"on_{name}")))
+        self._listeners.append((engine, "commit", self.on_commit))
+        for target, name, fn in self._listeners:
+            event.listen(target, name, fn)
+
+    def finish(self):
+        for target, name, fn in self._listeners:
+            event.remove(target, name, fn)
+        self._listeners = []
+
+    # ------------------------------------------------------------
+
+    def _get_state(self, session) -> _SessionState:
+        state = self._sessions.get(id(session))
+        if state is None:
+            state = self._sessions[id(session)] = _SessionState()
+        return state
+
+    def _end_flush(self, state:_SessionState, now_ns:int):
+        flush = state.flush
+        state.flush = None
+        if flush is not None and flush.idx:
+            flush.ended_ns = now_ns
+            self.flush_duration.add(flush.duration)
+
+    def on_after_begin(self, session, transaction, connection):
+        if connection.engine is not self._engine:
+            return
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            state = self._get_state(session)
+            if state.transaction is None:
+                state.transaction = TransactionInfo(len(self.transactions) + 1, id(session), now_ns)
+                self.transactions.append(state.transaction)
+            state.connections.append(id(connection))
+            self._connections[id(connection)] = state
+
+    def on_before_flush(self, session, flush_context, instances):
+        now_ns = time.perf_counter_ns()
+        reason = get_flush_reason()
+        nr_objects = len(session.new) + len(session.dirty) + len(session.deleted)
+        with self._lock:
+            state = self._get_state(session)
+            # previous one ended without after_flush, e.g. nothing to flush or error
+            self._end_flush(state, now_ns)
+            state.flush = FlushInfo(0, reason, id(session), now_ns, nr_objects=nr_objects)
+
+    def on_after_flush(self, session, flush_context):
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            state = self._sessions.get(id(session))
+            if state is not None:
+                self._end_flush(state, now_ns)
+
+    def on_commit(self, conn):
+        " engine event - before DBAPI commit "
+        state = self._connections.get(id(conn))
+        if state is not None and state.transaction is not None and state.transaction._commit_started_ns is None:
+            state.transaction._commit_started_ns = time.perf_counter_ns()
+
+    def on_after_commit(self, session):
+        if session.in_nested_transaction():
+            # savepoint released
+            return
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            state = self._sessions.get(id(session))
+            if state is None or state.transaction is None:
+                return
+            transaction = state.transaction
+            transaction.outcome = TransactionOutcome.COMMIT
+            if transaction._commit_started_ns is not None:
+                transaction.commit_duration = _ns_to_seconds(now_ns - transaction._commit_started_ns)
+                self.commit_duration.add(transaction.commit_duration)
+
+    def on_after_rollback(self, session):
+        with self._lock:
+            state = self._sessions.get(id(session))
+            if state is not None and state.transaction is not None:
+                state.transaction._rolled_back = True
+
+    def on_after_transaction_end(self, session, transaction):
+        if transaction.parent is not None:
+            # subtransaction or savepoint
+            return
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            state = self._sessions.pop(id(session), None)
+            if state is None:
+                return
+            self._end_flush(state, now_ns)
+            for connection_id in state.connections:
+                if self._connections.get(connection_id) is state:
+                    del self._connections[connection_id]
+            info = state.transaction
+            if info is None:
+                return
+            info.ended_ns = now_ns
+            if info.outcome is None:
+                info.outcome = TransactionOutcome.ROLLBACK if info._rolled_back else TransactionOutcome.CLOSED
+            self.transaction_duration.add(info.duration)
+
+    # ------------------------------------------------------------
+
+    def add_statement(self, conn) -> Tuple[Optional[int], Optional[int]]:
+        " called from before_cursor_execute - returns (transaction idx, flush idx) "
+        state = self._connections.get(id(conn))
+        if state is None or state.transaction is None:
+            return None, None
+        with self._lock:
+            transaction = state.transaction
+            transaction.cnt += 1
+            flush = state.flush
+            if flush is None:
+                return transaction.idx, None
+            if not flush.idx:
+                flush.idx = len(self.flushes) + 1
+                flush.transaction = transaction.idx
+                transaction.nr_flushes += 1
+                self.flushes.append(flush)
+            flush.cnt += 1
+            return transaction.idx, flush.idx
+
+    def add_timed(self, stmt):
+        " called when duration of the statement is known "
+        if stmt.transaction is None or stmt.duration is None:
+            return
+        with self._lock:
+            self.transactions[stmt.transaction - 1].statements_duration += stmt.duration
+            if stmt.flush is not None:
+                self.flushes[stmt.flush - 1].statements_duration += stmt.duration
+
+    # ------------------------------------------------------------
+
+    def get_transactions(self) -> List[TransactionInfo]:
+        with self._lock:
+            return list(self.transactions)
+
+    def get_flushes(self) -> List[FlushInfo]:
+        with self._lock:
+            return list(self.flushes)
+
+    def get_stats(self) -> SessionStats:
+        with self._lock:
+            by_flush: Dict[str, Stat] = {}
+            for flush in self.flushes:
+                stat = by_flush.get(flush.reason.value)
+                if stat is None:
+                    stat = by_flush[flush.reason.value] = Stat(flush.reason.value, 0, 0.0)
+                stat.cnt += flush.cnt
+                stat.duration += flush.statements_duration
+            no_flush = Stat(NO_FLUSH,
+                            sum(info.cnt for info in self.transactions) - sum(flush.cnt for flush in self.flushes),
+                            sum(info.statements_duration for info in self.transactions)
+                            - sum(flush.statements_duration for flush in self.flushes))
+            return SessionStats(
+                    transactions=len(self.transactions),
+                    committed=sum(1 for info in self.transactions if info.outcome == TransactionOutcome.COMMIT),
+                    rolled_back=sum(1 for info in self.transactions if info.outcome == TransactionOutcome.ROLLBACK),
+                    flushes=len(self.flushes),
+                    transaction_duration=self.transaction_duration.to_stat("transaction_duration"),
+                    commit_duration=self.commit_duration.to_stat("commit_duration"),
+                    flush_duration=self.flush_duration.to_stat("flush_duration"),
+                    statements_by_flush=sorted(list(by_flush.values()) + [no_flush],
+                                               key=lambda stat: (stat.duration, stat.cnt), reverse=True),
+                    )
+
+
+def get_session_target(capture_session) -> Any:
+    " True - all sessions (Session class) "
+    return Session if capture_session is True else capture_session
@@ -0,0 +1,86 @@
+"""
+Parameter retention policies - what is kept in SqlStatement.parameters.
+
+SQLAlchemy passes a reference to the parameters, for executemany it is the
+whole list of row dicts/tuples, so keeping it (ParamsPolicy.KEEP - the default)
+keeps the whole batch alive until the capture object dies. Other policies keep
+memory bounded regardless of the batch size.
+"""
+import enum
+import hashlib
+import reprlib
+from typing import Any, Optional
+
+PARAMS_MAX_ROWS_DEFAULT = 10
+PARAMS_MAX_REPR_DEFAULT = 200
+
+# ------------------------------------------------------------
+
+class ParamsPolicy(str, enum.Enum):
+    # reference to the object SQLAlchemy passed (original behaviour)
+    KEEP    = "keep"
+    # parameters are not retained, None
+    DROP    = "drop"
+    # executemany - first params_max_rows rows (list), single row kept as is
+    FIRST_N = "first_n"
+    # bounded repr() string
+    REPR    = "repr"
+    # stable hash (hex string) of the parameters
+    HASH    = "hash"
+    # copy of the parameters (each row copied) - not changed later by caller
+    COPY    = "copy"
+
+# ------------------------------------------------------------
+
+def get_params_rows(parameters:Any, executemany:bool) -> Optional[int]:
+    " number of rows for executemany, None otherwise "
+    if executemany and isinstance(parameters, (list, tuple)):
+        return len(parameters)
+    return None
+
+
+def _copy_row(row:Any) -> Any:
+    if isinstance(row, dict):
+        return dict(row)
+    if isinstance(row, list):
+        return list(row)
+    return row
+
+
+def _make_repr(max_rows:int, max_repr:int) -> reprlib.Repr:
+    params_repr = reprlib.Repr()
+    params_repr.maxlist = params_repr.maxtuple = params_repr.maxdict = max_rows
+    params_repr.maxstring = params_repr.maxother = max_repr
+    params_repr.maxlevel = 3
+    return params_repr
+
+
+def get_params_repr(parameters:Any, max_repr:int=PARAMS_MAX_REPR_DEFAULT) -> Optional[str]:
+    " bounded repr of retained parameters, cost doesn't depend on the batch size, strings are truncated "
+    if parameters is None:
+        return None
+    if isinstance(parameters, str):
+        return parameters[:max_repr]
+    return _make_repr(PARAMS_MAX_ROWS_DEFAULT, max_repr).repr(parameters)[:max_repr]
+
+
+def retain_parameters(parameters:Any, executemany:bool, policy:ParamsPolicy,
+                      max_rows:int=PARAMS_MAX_ROWS_DEFAULT, max_repr:int=PARAMS_MAX_REPR_DEFAULT) -> Any:
+    if policy == ParamsPolicy.KEEP:
+        return parameters
+    if policy == ParamsPolicy.DROP:
+        return None
+    if policy == ParamsPolicy.FIRST_N:
+        if executemany and isinstance(parameters, (list, tuple)):
+            return [_copy_row(row) for row in parameters[:max_rows]]
+        return _copy_row(parameters)
+    if policy == ParamsPolicy.REPR:
+        return _make_repr(max_rows, max_repr).repr(parameters)[:max_repr]
+    if policy == ParamsPolicy.HASH:
+        # repr of builtin types is stable between runs, hash() of str is not
+        return hashlib.blake2b(repr(parameters).encode("utf-8", "replace"), digest_size=8).hexdigest()
+    if policy == ParamsPolicy.COPY:
+        if executemany and isinstance(parameters, (list, tuple)):
+            return [_copy_row(row) for row in parameters]
+        return _copy_row(parameters)
+    raise Exception(f"Params policy {policy} is not valid, valid are: {[pol.value for pol in ParamsPolicy]}")
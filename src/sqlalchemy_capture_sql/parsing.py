@@ -0,0 +1,108 @@
+"""
+Statement parsing - sql type, tables, fingerprint and repr of the statement.
+
+ORM sends the same few hundred statement strings over and over again, so
+parsed metadata is kept in bounded LRU cache keyed by the statement string.
+Parsing is lazy - SqlStatement calls it only when some stat or report needs it.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from .tables import extract_tables
+
+PARSE_CACHE_SIZE = 1024
+
+# ------------------------------------------------------------
+
+@dataclass(frozen=True)
+class StatementInfo:
+    sql_type: str
+    # the first word after FROM / INTO / UPDATE - kept for by_table grouping
+    first_table: str
+    # all tables touched, CTE names excluded - see tables.py
+    tables: Tuple[str, ...]
+    # statement with literals and parameters stripped, whitespace collapsed
+    fingerprint: str
+    # representation - dropped list of columns from SELECT
+    stmt_repr: str
+    # INSERT / UPDATE / DELETE / MERGE - table being changed
+    target_table: Optional[str] = None
+    ctes: Tuple[str, ...] = ()
+
+# ------------------------------------------------------------
+
+_FINGERPRINT_SUBS = (
+        # string literals, incl. escaped quotes
+        (re.compile(r"'(?:[^']|'')*'"), "?"),
+        # parameters: %(name)s, %s, :name, $1
+        (re.compile(r"%\(\w+\)s|%s|(?<![:\w]):\w+|\$\d+"), "?"),
+        # numbers not part of identifiers
+        (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:e[-+]?\d+)?\b", re.IGNORECASE), "?"),
+        (re.compile(r"\s+"), " "),
+        # IN (?, ?, ?) / VALUES (?, ?), (?, ?) - number of items is irrelevant
+        (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?+)"),
+        (re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+"), "(?+)+"),
+        )
+
+
+def fingerprint_statement(statement:str) -> str:
+    " literals and parameters replaced with ?, whitespace collapsed, upper cased "
+    fingerprint = statement
+    for regex, repl in _FINGERPRINT_SUBS:
+        fingerprint = regex.sub(repl, fingerprint)
+    return fingerprint.strip().upper()
+
+
+def _parse_statement(statement:str) -> StatementInfo:
+    sql = statement
+    flds = [f.upper() for f in sql.split()[:20]] or ["<EMPTY>"]
+    sql_type = flds[0]
+
+    if sql_type in ("SELECT",):
+        from_idx = sql.upper().find("FROM ")
+        if from_idx>0:
+            first_table = sql[from_idx:].split()[1].upper()
+            sql = sql_type + " " + sql[from_idx:]
+        else:
+            # give me something, first column
+            first_table = flds[1] if len(flds) > 1 else "<unknown>"
+    elif flds[:2]==["INSERT", "INTO"] and len(flds) > 2:
+        first_table = flds[2]
+    elif flds[:2]==["DELETE", "FROM"] and len(flds) > 2:
+        first_table = flds[2]
+    elif flds[:1]==["UPDATE",] and len(flds) > 1:
+        first_table = flds[1]
+    else:
+        first_table = "<unknown>"
+
+    tables_info = extract_tables(statement)
+
+    return StatementInfo(
+            sql_type=sql_type,
+            first_table=first_table,
+            tables=tables_info.tables,
+            fingerprint=fingerprint_statement(statement),
+            stmt_repr=sql,
+            target_table=tables_info.target_table,
+            ctes=tables_info.ctes,
+            )
+
+
+parse_statement = lru_cache(maxsize=PARSE_CACHE_SIZE)(_parse_statement)
+
+
+def set_parse_cache_size(maxsize:int):
+    " replaces the cache - hits/misses counters are reset "
+    global parse_statement
+    parse_statement = lru_cache(maxsize=maxsize)(_parse_statement)
+
+
+def parse_cache_info():
+    " functools CacheInfo(hits, misses, maxsize, currsize) "
+    return parse_statement.cache_info()
+
+
+def parse_cache_clear():
+    parse_statement.cache_clear()
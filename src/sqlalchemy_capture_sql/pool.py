@@ -0,0 +1,183 @@
+"""
+Connection pool instrumentation - checkout wait, connect latency, checkout
+duration, connection lifetime and statements per checkout.
+
+Pool events (connect, checkout, checkin, invalidate, close) and dialect
+do_connect event are used, through the shared per-engine dispatcher (see
+dispatcher.py) - so are checkout waits, measured by its pool._do_get()
+wrapper.
+"""
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .dispatcher import POOL_EVENTS, DO_GET, get_dispatcher
+from .histogram import Histogram
+from .stats import Stat
+
+# ------------------------------------------------------------
+
+class _Timing:
+    " histogram + min of durations in seconds "
+    __slots__ = ("histogram", "min")
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.min: Optional[float] = None
+
+    def add(self, value:float):
+        self.histogram.add(value)
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def to_stat(self, key:str) -> Stat:
+        hist = self.histogram.copy()
+        stat = Stat(key, hist.cnt, hist.total, min_duration=self.min, max_duration=hist.max, histogram=hist)
+        stat.set_percentiles()
+        return stat
+
+
+@dataclass
+class PoolStats:
+    checkouts: int
+    checkins: int
+    connections_opened: int
+    connections_closed: int
+    invalidations: int
+    # the most connections checked out at once during the capture
+    max_checked_out: int
+    # timings - cnt, duration (total), min/max, mean and percentiles
+    checkout_wait: Stat
+    connect_time: Stat
+    # time from checkout to checkin
+    checkout_duration: Stat
+    # connections opened and closed during the capture
+    connection_lifetime: Stat
+    # number of statements -> number of checkouts, finished checkouts only
+    statements_per_checkout: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def timings(self) -> List[Stat]:
+        return [self.checkout_wait, self.connect_time, self.checkout_duration, self.connection_lifetime]
+
+    @property
+    def mean_statements_per_checkout(self) -> Optional[float]:
+        nr_checkouts = sum(self.statements_per_checkout.values())
+        if not nr_checkouts:
+            return None
+        return sum(nr * cnt for nr, cnt in self.statements_per_checkout.items()) / nr_checkouts
+
+# ------------------------------------------------------------
+
+class PoolCollector:
+    " listens pool events of one engine, see CaptureSqlStatements(capture_pool=True) "
+
+    def __init__(self, event_target):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.invalidations = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkout_wait = _Timing()
+        self.connect_time = _Timing()
+        self.checkout_duration = _Timing()
+        self.connection_lifetime = _Timing()
+        self.statements_per_checkout: Counter = Counter()
+        # id(connection record) -> do_connect started
+        self._connecting: Dict[int, int] = {}
+        # id(dbapi connection) -> connected
+        self._connected: Dict[int, int] = {}
+        # id(dbapi connection) -> [checked out, nr. statements]
+        self._checked_out: Dict[int, List[int]] = {}
+
+        self._dispatcher = get_dispatcher(event_target)
+        self._listeners: List[Tuple[str, Callable]] = [(name, getattr(self, f"on_{name}")) for name in POOL_EVENTS]
+        self._listeners.append((DO_GET, self.on_do_get))
+        for name, fn in self._listeners:
+            self._dispatcher.subscribe(name, fn)
+
+    def finish(self):
+        for name, fn in self._listeners:
+            self._dispatcher.unsubscribe(name, fn)
+        self._listeners = []
+
+    # ------------------------------------------------------------
+
+    def on_do_get(self, duration:float):
+        " checkout wait, see dispatcher.DO_GET "
+        with self._lock:
+            self.checkout_wait.add(duration)
+
+    def on_do_connect(self, dialect, conn_rec, cargs, cparams):
+        self._connecting[id(conn_rec)] = time.perf_counter_ns()
+
+    def on_connect(self, dbapi_connection, connection_record):
+        now_ns = time.perf_counter_ns()
+        started_ns = self._connecting.pop(id(connection_record), None)
+        with self._lock:
+            self.connections_opened += 1
+            self._connected[id(dbapi_connection)] = now_ns
+            if started_ns is not None:
+                self.connect_time.add((now_ns - started_ns) / 1_000_000_000.0)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self._checked_out[id(dbapi_connection)] = [now_ns, 0]
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            self.checkins += 1
+            checkout = self._checked_out.pop(id(dbapi_connection), None)
+            if checkout is None:
+                # checked out before the capture started or invalidated
+                return
+            self.checked_out -= 1
+            self.checkout_duration.add((now_ns - checkout[0]) / 1_000_000_000.0)
+            self.statements_per_checkout[checkout[1]] += 1
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def on_close(self, dbapi_connection, connection_record):
+        now_ns = time.perf_counter_ns()
+        with self._lock:
+            self.connections_closed += 1
+            connected_ns = self._connected.pop(id(dbapi_connection), None)
+            if connected_ns is not None:
+                self.connection_lifetime.add((now_ns - connected_ns) / 1_000_000_000.0)
+
+    def add_statement(self, conn):
+        " called from before_cursor_execute - conn is sqlalchemy Connection "
+        dbapi_connection = getattr(conn.connection, "dbapi_connection", None)
+        checkout = self._checked_out.get(id(dbapi_connection))
+        if checkout is not None:
+            checkout[1] += 1
+
+    # ------------------------------------------------------------
+
+    def get_stats(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                    checkouts=self.checkouts,
+                    checkins=self.checkins,
+                    connections_opened=self.connections_opened,
+                    connections_closed=self.connections_closed,
+                    invalidations=self.invalidations,
+                    max_checked_out=self.max_checked_out,
+                    checkout_wait=self.checkout_wait.to_stat("checkout_wait"),
+                    connect_time=self.connect_time.to_stat("connect_time"),
+                    checkout_duration=self.checkout_duration.to_stat("checkout_duration"),
+                    connection_lifetime=self.connection_lifetime.to_stat("connection_lifetime"),
+                    statements_per_checkout=dict(sorted(self.statements_per_checkout.items())),
+                    )
@@ -0,0 +1,171 @@
+"""
+pytest plugin - query count / duration budgets and baselines per test.
+
+Registered through pytest11 entry point, or explicitly with
+"-p sqlalchemy_capture_sql.pytest_plugin". Engine is configured with ini
+option sql_capture_engine = "package.module:engine" or by overriding
+sql_capture_engine fixture in conftest.py.
+
+    @pytest.mark.sql_budget(max_statements=10, max_duration=0.5, by_type={"SELECT": 5})
+    def test_list_users(client): ...
+
+    @pytest.mark.sql_baseline(tolerance=0.1)
+    def test_list_orders(client): ...
+
+    def test_details(client, capture_sql):
+        ...
+        assert capture_sql.get_counts("by_type")["SELECT"] == 2
+
+Capture is started when capture_sql fixture is set up - for marked tests
+after all other fixtures - and finished at the end of the test call, so
+fixtures teardown is not captured.
+
+The plugin is loaded in every pytest run where the package is installed, so
+it sticks to APIs of old pytest / pluggy versions too (no item.stash, old
+style hookwrapper).
+"""
+import importlib
+import os
+import re
+from typing import Any, Dict, Optional
+
+import pytest
+
+from .base import CaptureSqlStatements
+from .budgets import QueryBudget, make_baseline, load_baseline, save_baseline, compare_baseline, report_violations
+from .stats import StatName
+
+BASELINE_DIR_DEFAULT = ".sql_baselines"
+MARKERS = ("sql_budget", "sql_baseline")
+
+# item attribute with the capture of the test
+CAPTURE_ATTR = "_sql_capture"
+
+# ------------------------------------------------------------
+
+def pytest_addoption(parser):
+    group = parser.getgroup("sql_capture", "SQL capture budgets and baselines")
+    group.addoption("--sql-baseline-record", action="store_true", default=False,
+                    help="record (overwrite) sql baselines instead of checking them")
+    group.addoption("--sql-baseline-dir", default=None,
+                    help=f"directory of sql baseline files (default: {BASELINE_DIR_DEFAULT})")
+    group.addoption("--sql-baseline-tolerance", type=float, default=None,
+                    help="allowed relative growth of statement counts, e.g. 0.1 for 10%% (default: 0)")
+    parser.addini("sql_capture_engine", "engine used by capture_sql fixture - 'package.module:attribute'")
+    parser.addini("sql_baseline_dir", f"directory of sql baseline files (default: {BASELINE_DIR_DEFAULT})")
+    parser.addini("sql_baseline_tolerance", "allowed relative growth of statement counts (default: 0)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers",
+            "sql_budget(max_statements=None, max_duration=None, by_type=None, by_table=None, "
+            "by_type_and_table=None, by_fingerprint=None): fail when captured sql statements exceed the budget")
+    config.addinivalue_line("markers",
+            "sql_baseline(tolerance=None): fail when sql statement fingerprints or counts grow "
+            "over the recorded baseline")
+
+
+def pytest_collection_modifyitems(items):
+    # marked tests get capture_sql as the last fixture
+    for item in items:
+        if any(item.get_closest_marker(name) for name in MARKERS) and "capture_sql" not in item.fixturenames:
+            item.fixturenames.append("capture_sql")
+
+# ------------------------------------------------------------
+# Fixtures
+# ------------------------------------------------------------
+
+def _import_engine(path:str):
+    module_name, _, attr_name = path.partition(":")
+    if not attr_name:
+        raise pytest.UsageError(f"sql_capture_engine should be 'package.module:attribute', got: {path}")
+    engine = getattr(importlib.import_module(module_name), attr_name)
+    return engine() if callable(engine) else engine
+
+
+@pytest.fixture
+def sql_capture_engine(request):
+    " engine (or AsyncEngine) to capture - override in conftest.py or set sql_capture_engine ini option "
+    path = request.config.getini("sql_capture_engine")
+    if not path:
+        raise pytest.UsageError("Set sql_capture_engine ini option or override sql_capture_engine fixture")
+    return _import_engine(path)
+
+
+@pytest.fixture
+def sql_capture_options() -> Dict[str, Any]:
+    " CaptureSqlStatements arguments, e.g. {'timing': 'server'} - override in conftest.py "
+    return {}
+
+
+@pytest.fixture
+def capture_sql(request, sql_capture_engine, sql_capture_options):
+    capture = CaptureSqlStatements(sql_capture_engine, **sql_capture_options)
+    setattr(request.node, CAPTURE_ATTR, capture)
+    yield capture
+    if not capture.finished:
+        capture.finish()
+
+# ------------------------------------------------------------
+# Checks
+# ------------------------------------------------------------
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    outcome = yield
+    capture = getattr(item, CAPTURE_ATTR, None)
+    if capture is not None and outcome.excinfo is None:
+        if not capture.finished:
+            capture.finish()
+        _check_budget(item, capture)
+        _check_baseline(item, capture)
+
+
+def _check_budget(item, capture: CaptureSqlStatements):
+    marker = item.get_closest_marker("sql_budget")
+    if marker is None:
+        return
+    kwargs = dict(marker.kwargs)
+    max_counts = {name.value: kwargs.pop(name.value) for name in StatName if name.value in kwargs}
+    budget = QueryBudget(max_counts=max_counts, **kwargs)
+    violations = budget.check(capture)
+    if violations:
+        pytest.fail(report_violations(capture, violations), pytrace=False)
+
+
+def get_baseline_path(config, nodeid:str) -> str:
+    baseline_dir = (config.getoption("sql_baseline_dir") or config.getini("sql_baseline_dir")
+                    or BASELINE_DIR_DEFAULT)
+    path, _, name = nodeid.partition("::")
+    path = os.path.splitext(path)[0]
+    name = re.sub(r"[^\w.-]+", "_", name).strip("_")
+    return os.path.join(str(config.rootpath), baseline_dir, path, f"{name}.json")
+
+
+def _get_tolerance(config, marker) -> float:
+    tolerance: Optional[Any] = marker.kwargs.get("tolerance")
+    if tolerance is None:
+        tolerance = config.getoption("sql_baseline_tolerance")
+    if tolerance is None:
+        tolerance = config.getini("sql_baseline_tolerance") or 0.0
+    return float(tolerance)
+
+
+def _check_baseline(item, capture: CaptureSqlStatements):
+    marker = item.get_closest_marker("sql_baseline")
+    if marker is None:
+        return
+    config = item.config
+    path = get_baseline_path(config, item.nodeid)
+    current = make_baseline(capture)
+    baseline = None if config.getoption("sql_baseline_record") else load_baseline(path)
+    if baseline is None:
+        # first run or --sql-baseline-record
+        save_baseline(path, current)
+        return
+    violations = compare_baseline(baseline, current, tolerance=_get_tolerance(config, marker))
+    if violations:
+        pytest.fail(report_violations(capture, violations,
+                                      title=f"SQL baseline {os.path.relpath(path)} exceeded "
+                                            f"(--sql-baseline-record to update)"),
+                    pytrace=False)
@@ -0,0 +1,95 @@
+"""
+Row volume of captured statements - cursor.rowcount and rows actually
+fetched with approximate size in bytes.
+
+Fetched rows are counted by replacing execution context's cursor fetch
+strategy (on after_cursor_execute) with a counting one. Server side cursors
+(stream_results / yield_per) and buffered results (e.g. insertmanyvalues
+INSERT .. RETURNING) use other strategies and are not counted.
+"""
+import enum
+from typing import Any, Callable, Optional
+
+try:
+    from sqlalchemy.engine.cursor import CursorFetchStrategy, _DEFAULT_FETCH
+except ImportError: # pragma: no cover - very old SQLAlchemy
+    CursorFetchStrategy = _DEFAULT_FETCH = None
+
+# ------------------------------------------------------------
+
+class RowsMode(str, enum.Enum):
+    NONE          = "none"
+    # cursor.rowcount on after_cursor_execute - DML, for SELECT it depends on DBAPI
+    ROWCOUNT      = "rowcount"
+    # + number of rows fetched
+    FETCHED       = "fetched"
+    # + approximate size of fetched rows in bytes
+    FETCHED_BYTES = "fetched_bytes"
+
+# ------------------------------------------------------------
+
+# approximate size of non str/bytes values
+SCALAR_SIZE = 8
+
+
+def get_row_size(row:Any) -> int:
+    " approximate size of data in the row - length of strings and bytes, SCALAR_SIZE for other values "
+    size = 0
+    for value in row:
+        if value is None:
+            continue
+        if isinstance(value, (str, bytes, bytearray, memoryview)):
+            size += len(value)
+        else:
+            size += SCALAR_SIZE
+    return size
+
+# ------------------------------------------------------------
+
+if CursorFetchStrategy is not None:
+
+    class CountingFetchStrategy(CursorFetchStrategy):
+        " default fetch strategy that reports fetched rows to the callback "
+        __slots__ = ("stmt", "on_fetch")
+
+        def __init__(self, stmt, on_fetch:Callable):
+            self.stmt = stmt
+            self.on_fetch = on_fetch
+
+        def fetchone(self, result, dbapi_cursor, hard_close=False):
+            row = super().fetchone(result, dbapi_cursor, hard_close=hard_close)
+            if row is not None:
+                self.on_fetch(self.stmt, (row,))
+            return row
+
+        def fetchmany(self, result, dbapi_cursor, size=None):
+            rows = super().fetchmany(result, dbapi_cursor, size=size)
+            if rows:
+                self.on_fetch(self.stmt, rows)
+            return rows
+
+        def fetchall(self, result, dbapi_cursor):
+            rows = super().fetchall(result, dbapi_cursor)
+            if rows:
+                self.on_fetch(self.stmt, rows)
+            return rows
+
+
+def set_counting_fetch_strategy(context, stmt, on_fetch:Callable) -> bool:
+    " returns False when result of this execution can not be counted "
+    if CursorFetchStrategy is None or context is None:
+        return False
+    if (context.cursor_fetch_strategy is not _DEFAULT_FETCH
+            or getattr(context, "_is_server_side", False)
+            or context.execution_options.get("stream_results", False)
+            # insertmanyvalues batches - RETURNING rows are buffered by SQLAlchemy
+            or getattr(getattr(context, "execute_style", None), "name", None) == "INSERTMANYVALUES"):
+        return False
+    context.cursor_fetch_strategy = CountingFetchStrategy(stmt, on_fetch)
+    return True
+
+
+def get_rowcount(cursor) -> Optional[int]:
+    " None when DBAPI does not know (-1) "
+    rowcount = getattr(cursor, "rowcount", -1)
+    return rowcount if rowcount is not None and rowcount >= 0 else None
@@ -0,0 +1,75 @@
+"""
+Sampling policies for low-overhead (always-on) capture.
+
+Statement is sampled (SqlStatement object created and retained) when it passes
+all configured filters: every_nth, probability and per_fingerprint_limit.
+Unsampled statements only bump counters, so counts stay exact while durations
+in get_stats() are scaled by cnt / cnt_measured per statement.
+
+With keep_slower_than_ms every statement is timed and the slow ones are
+retained regardless of other filters - durations are then exact too.
+"""
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from . import parsing
+
+# ------------------------------------------------------------
+
+@dataclass
+class SamplingPolicy:
+    # 1-in-N
+    every_nth: Optional[int] = None
+    # probabilistic 0.0 - 1.0
+    probability: Optional[float] = None
+    # at most N statements per fingerprint in per_fingerprint_interval seconds
+    per_fingerprint_limit: Optional[int] = None
+    per_fingerprint_interval: float = 1.0
+    # always keep statements slower than X ms - duration or server_duration
+    # when TimingMode.SERVER is used
+    keep_slower_than_ms: Optional[float] = None
+
+    _counter: itertools.count = field(init=False, repr=False, default_factory=lambda: itertools.count(1))
+    # fingerprint -> [window started ns, nr. sampled in window]
+    _windows: Dict[str, List[int]] = field(init=False, repr=False, default_factory=dict)
+
+    def __post_init__(self):
+        if self.every_nth is not None and self.every_nth < 1:
+            raise Exception(f"every_nth should be positive integer, got: {self.every_nth}")
+        if self.probability is not None and not (0.0 <= self.probability <= 1.0):
+            raise Exception(f"probability should be in range [0, 1], got: {self.probability}")
+        if self.per_fingerprint_limit is not None and self.per_fingerprint_limit < 0:
+            raise Exception(f"per_fingerprint_limit should not be negative, got: {self.per_fingerprint_limit}")
+        self._keep_slower_than = (self.keep_slower_than_ms / 1000.0
+                                  if self.keep_slower_than_ms is not None else None)
+
+    def should_sample(self, statement:str) -> bool:
+        if self.every_nth is not None and next(self._counter) % self.every_nth:
+            return False
+        if self.probability is not None and random.random() >= self.probability:
+            return False
+        if self.per_fingerprint_limit is not None:
+            return self._check_rate_limit(parsing.parse_statement(statement).fingerprint)
+        return True
+
+    def _check_rate_limit(self, fingerprint:str) -> bool:
+        now_ns = time.perf_counter_ns()
+        window = self._windows.get(fingerprint)
+        if window is None or now_ns - window[0] > self.per_fingerprint_interval * 1_000_000_000:
+            window = self._windows[fingerprint] = [now_ns, 0]
+        if window[1] >= self.per_fingerprint_limit:
+            return False
+        window[1] += 1
+        return True
+
+    @property
+    def times_all(self) -> bool:
+        " every statement needs to be timed to decide if it is slow "
+        return self._keep_slower_than is not None
+
+    def is_slow(self, duration:Optional[float]) -> bool:
+        return (self._keep_slower_than is not None and duration is not None
+                and duration >= self._keep_slower_than)
@@ -0,0 +1,200 @@
+"""
+Compact on-disk format of a capture - aggregates per statement fingerprint
+with one sample statement each, no individual statements. Used for diffing
+captures of different runs (see diff.py).
+
+Format is JSON, gzip compressed when file name ends with ".gz".
+"""
+import gzip
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import parsing
+from .histogram import Histogram
+from .stats import Stat, StatName, STAT_KEY_FUNCTIONS, STAT_KEYS_FUNCTIONS, ROWS_FIELDS, get_stat_keys, merge_stats, scale_stat
+
+SNAPSHOT_VERSION = 1
+# groupings available for snapshots - no spans
+SNAPSHOT_STAT_NAMES = tuple(name.value for name in StatName
+                            if name in STAT_KEY_FUNCTIONS or name in STAT_KEYS_FUNCTIONS)
+
+# ------------------------------------------------------------
+
+@dataclass
+class SnapshotEntry:
+    " aggregates of all statements with the same fingerprint "
+    fingerprint: str
+    sql_type: str
+    first_table: str
+    # the most frequent statement with this fingerprint
+    statement: str
+    stat: Stat
+
+    @property
+    def tables(self) -> Tuple[str, ...]:
+        " all tables touched - parsed from the sample statement "
+        return parsing.parse_statement(self.statement).tables
+
+    def to_dict(self) -> Dict[str, Any]:
+        stat = self.stat
+        data = {
+                "fingerprint" : self.fingerprint,
+                "sql_type"    : self.sql_type,
+                "first_table" : self.first_table,
+                "statement"   : self.statement,
+                }
+        for name in ("cnt", "duration", "server_duration", "client_duration",
+                     "min_duration", "max_duration", "cnt_measured") + ROWS_FIELDS:
+            value = getattr(stat, name)
+            if value is not None:
+                data[name] = value
+        if stat.histogram is not None:
+            data["histogram"] = stat.histogram.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any]) -> "SnapshotEntry":
+        stat = Stat(data["fingerprint"], data["cnt"], data["duration"],
+                    server_duration=data.get("server_duration"),
+                    client_duration=data.get("client_duration"),
+                    min_duration=data.get("min_duration"),
+                    max_duration=data.get("max_duration"),
+                    cnt_measured=data.get("cnt_measured"),
+                    rowcount=data.get("rowcount"),
+                    rows_fetched=data.get("rows_fetched"),
+                    bytes_fetched=data.get("bytes_fetched"),
+                    histogram=Histogram.from_dict(data["histogram"]) if "histogram" in data else None)
+        return cls(data["fingerprint"], data["sql_type"], data["first_table"], data["statement"], stat)
+
+# ------------------------------------------------------------
+
+@dataclass
+class CaptureSnapshot:
+    timing: str
+    # all statements seen
+    count: int
+    # capture duration in seconds
+    duration: Optional[float]
+    entries: Dict[str, SnapshotEntry] = field(default_factory=dict)
+    # when the capture started, ISO format
+    started: Optional[str] = None
+
+    @classmethod
+    def from_capture(cls, capture) -> "CaptureSnapshot":
+        " capture - CaptureSqlStatements, can be called before finish() too "
+        return cls.from_statement_stats(
+                capture.timing.value, capture.count(), capture.duration if capture.finished else None,
+                capture.started.isoformat(), capture._stats.get_statement_stats(sampling=capture.sampling is not None))
+
+    @classmethod
+    def from_statement_stats(cls, timing:str, count:int, duration:Optional[float], started:Optional[str],
+                             stat_list:List[Stat]) -> "CaptureSnapshot":
+        """
+        stat_list - one Stat per distinct statement (key), stats are changed.
+        Sampling mode (cnt_measured set) - durations are scaled per fingerprint.
+        """
+        snapshot = cls(timing=timing, count=count, duration=duration, started=started)
+        # fingerprint -> cnt of the current sample statement
+        sample_cnt: Dict[str, int] = {}
+        for stat in stat_list:
+            statement = stat.key
+            info = parsing.parse_statement(statement)
+            entry = snapshot.entries.get(info.fingerprint)
+            if entry is None:
+                stat.key = info.fingerprint
+                snapshot.entries[info.fingerprint] = SnapshotEntry(
+                        info.fingerprint, info.sql_type, info.first_table, statement, stat)
+                sample_cnt[info.fingerprint] = stat.cnt
+                continue
+            if stat.cnt > sample_cnt[info.fingerprint]:
+                entry.statement = statement
+                sample_cnt[info.fingerprint] = stat.cnt
+            merge_stats(entry.stat, stat)
+        for entry in snapshot.entries.values():
+            if entry.stat.cnt_measured is not None:
+                scale_stat(entry.stat)
+        return snapshot
+
+    @classmethod
+    def merge(cls, snapshots:List["CaptureSnapshot"]) -> "CaptureSnapshot":
+        """
+        sum of snapshots, e.g. of many processes. Duration is the longest one,
+        timing is kept only if all snapshots have the same.
+        """
+        timings = {snapshot.timing for snapshot in snapshots}
+        durations = [snapshot.duration for snapshot in snapshots if snapshot.duration is not None]
+        started = [snapshot.started for snapshot in snapshots if snapshot.started]
+        merged = cls(timing=timings.pop() if len(timings) == 1 else "between_statements",
+                     count=sum(snapshot.count for snapshot in snapshots),
+                     duration=max(durations) if durations else None,
+                     started=min(started) if started else None)
+        # fingerprint -> cnt of the current sample statement
+        sample_cnt: Dict[str, int] = {}
+        for snapshot in snapshots:
+            for fingerprint, entry in snapshot.entries.items():
+                current = merged.entries.get(fingerprint)
+                if current is None:
+                    stat = Stat(fingerprint, 0, 0.0)
+                    merge_stats(stat, entry.stat)
+                    merged.entries[fingerprint] = SnapshotEntry(
+                            entry.fingerprint, entry.sql_type, entry.first_table, entry.statement, stat)
+                    sample_cnt[fingerprint] = entry.stat.cnt
+                    continue
+                if entry.stat.cnt > sample_cnt[fingerprint]:
+                    current.statement = entry.statement
+                    sample_cnt[fingerprint] = entry.stat.cnt
+                merge_stats(current.stat, entry.stat)
+        return merged
+
+    def get_stats(self, name:StatName, top:Optional[int]=None, order_by:str="duration") -> List[Stat]:
+        " the same as CaptureSqlStatements.get_stats(), top - None for all groups "
+        name = StatName(name)
+        if name.value not in SNAPSHOT_STAT_NAMES:
+            raise Exception(f"Name {name.value} is not available for snapshots, valid are: {list(SNAPSHOT_STAT_NAMES)}")
+        groups: Dict[str, Stat] = {}
+        for entry in self.entries.values():
+            # SnapshotEntry has the same attributes as StatementInfo
+            for key in get_stat_keys(name, entry):
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = Stat(key, 0, 0.0)
+                merge_stats(group, entry.stat)
+        for stat in groups.values():
+            stat.set_percentiles()
+        ordered = sorted(groups.values(),
+                         key=lambda stat: (getattr(stat, order_by) or 0.0, stat.cnt),
+                         reverse=True)
+        return ordered[:top]
+
+    # ------------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+                "version"  : SNAPSHOT_VERSION,
+                "started"  : self.started,
+                "timing"   : self.timing,
+                "count"    : self.count,
+                "duration" : self.duration,
+                "entries"  : [entry.to_dict() for entry in sorted(self.entries.values(),
+                                                                   key=lambda entry: entry.fingerprint)],
+                }
+
+    @classmethod
+    def from_dict(cls, data:Dict[str, Any]) -> "CaptureSnapshot":
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise Exception(f"Snapshot version {data.get('version')} is not supported, expected {SNAPSHOT_VERSION}")
+        entries = [SnapshotEntry.from_dict(entry) for entry in data["entries"]]
+        return cls(timing=data["timing"], count=data["count"], duration=data["duration"],
+                   entries={entry.fingerprint: entry for entry in entries}, started=data.get("started"))
+
+    def save(self, path:str):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as fout:
+            json.dump(self.to_dict(), fout, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path:str) -> "CaptureSnapshot":
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as fin:
+            return cls.from_dict(json.load(fin))
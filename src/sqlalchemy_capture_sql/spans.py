@@ -0,0 +1,40 @@
+"""
+Named phases of one capture - see CaptureSqlStatements.span().
+
+Current span is kept in a context variable of the capture, so spans of
+different threads and asyncio tasks don't mix. Nested spans are named by
+their path, e.g. "load users/authors".
+"""
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+SPAN_SEPARATOR = "/"
+# StatName.BY_SPAN key of statements issued outside of any span
+NO_SPAN = "<no span>"
+
+# ------------------------------------------------------------
+
+@dataclass
+class Span:
+    # path of the span, e.g. "load users/authors"
+    name: str
+    started_ns: int
+    ended_ns: Optional[int] = None
+
+    @property
+    def duration(self) -> float:
+        " wall time in seconds, until now for not ended spans "
+        ended_ns = self.ended_ns if self.ended_ns is not None else time.perf_counter_ns()
+        return (ended_ns - self.started_ns) / 1_000_000_000.0
+
+    @property
+    def parent(self) -> Optional[str]:
+        pos = self.name.rfind(SPAN_SEPARATOR)
+        return self.name[:pos] if pos >= 0 else None
+
+
+def get_span_name(parent:Optional[str], name:str) -> str:
+    if SPAN_SEPARATOR in name:
+        raise Exception(f"Span name should not contain '{SPAN_SEPARATOR}', got: {name!r}")
+    return f"{parent}{SPAN_SEPARATOR}{name}" if parent is not None else name
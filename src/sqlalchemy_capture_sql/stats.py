@@ -0,0 +1,335 @@
+"""
+Streaming (online) aggregation of captured statements.
+
+Aggregates are kept per span and statement string while capturing - it costs
+two dict lookups per statement and no parsing. Grouping by StatName is done on request by
+folding per-statement aggregates (parsed through the parsing LRU cache), so
+get_stats() is O(distinct statements) and can be called in the middle of the
+capture.
+
+Statements with inlined literals make every statement string distinct, so
+after STATS_MAX_STATEMENTS distinct strings new ones are aggregated by
+fingerprint (one sample statement kept) - memory stays bounded in long
+captures. Fingerprint of a fingerprint is the same, so such keys are grouped
+like statement strings.
+"""
+import enum
+import heapq
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import parsing
+from .parsing import StatementInfo
+from .histogram import Histogram
+from .spans import NO_SPAN
+
+# ------------------------------------------------------------
+
+@dataclass
+class Stat:
+    key: str
+    cnt: int
+    duration: float
+    statement: Optional[Any] = None # SqlStatement
+    # TimingMode.SERVER only
+    server_duration: Optional[float] = None
+    client_duration: Optional[float] = None
+    min_duration: Optional[float] = None
+    max_duration: Optional[float] = None
+    # sampling mode only - number of statements with measured duration,
+    # durations are scaled by cnt / cnt_measured
+    cnt_measured: Optional[int] = None
+    # latency distribution - of duration, or server_duration with TimingMode.SERVER
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+    # max of the latency measure - max_duration is always of duration
+    max_latency: Optional[float] = None
+    histogram: Optional[Histogram] = field(default=None, repr=False)
+    # capture_rows only - sums, see rows.py
+    rowcount: Optional[int] = None
+    rows_fetched: Optional[int] = None
+    bytes_fetched: Optional[int] = None
+    # explain_slowest() only - explain.ExplainPlan
+    plan: Optional[Any] = field(default=None, repr=False)
+
+    def set_percentiles(self):
+        hist = self.histogram
+        if hist is not None and hist.cnt:
+            self.mean = hist.mean
+            self.p50 = hist.quantile(0.5)
+            self.p90 = hist.quantile(0.9)
+            self.p99 = hist.quantile(0.99)
+            self.max_latency = hist.max
+
+# ------------------------------------------------------------
+
+class StatName(str, enum.Enum):
+    BY_TYPE           = "by_type"
+    BY_TABLE          = "by_table"
+    BY_TYPE_AND_TABLE = "by_type_and_table"
+    BY_FINGERPRINT    = "by_fingerprint"
+    # capture.span() - not available for snapshots
+    BY_SPAN           = "by_span"
+    # statement is counted against every table it touches (joins, subqueries,
+    # CTEs), so group counts don't sum up to the number of statements
+    BY_TOUCHED_TABLE          = "by_touched_table"
+    BY_TYPE_AND_TOUCHED_TABLE = "by_type_and_touched_table"
+
+# StatName -> function that returns group key for parsed statement
+STAT_KEY_FUNCTIONS: Dict[StatName, Callable[[StatementInfo], str]] = {
+        StatName.BY_TYPE           : lambda info: info.sql_type,
+        StatName.BY_TABLE          : lambda info: info.first_table,
+        StatName.BY_TYPE_AND_TABLE : lambda info: f"{info.sql_type} {info.first_table}",
+        StatName.BY_FINGERPRINT    : lambda info: info.fingerprint,
+        }
+
+# key of statements without any table, e.g. "SELECT 1"
+NO_TABLE = "<no table>"
+
+# StatName -> function that returns all group keys for parsed statement
+STAT_KEYS_FUNCTIONS: Dict[StatName, Callable[[StatementInfo], Tuple[str, ...]]] = {
+        StatName.BY_TOUCHED_TABLE          : lambda info: info.tables or (NO_TABLE,),
+        StatName.BY_TYPE_AND_TOUCHED_TABLE : lambda info: tuple(f"{info.sql_type} {table}"
+                                                                for table in info.tables or (NO_TABLE,)),
+        }
+
+
+def get_stat_keys(name:StatName, info:StatementInfo) -> Tuple[str, ...]:
+    " group keys of the statement - one key except for STAT_KEYS_FUNCTIONS names "
+    keys_fn = STAT_KEYS_FUNCTIONS.get(name)
+    if keys_fn is not None:
+        return keys_fn(info)
+    return (STAT_KEY_FUNCTIONS[name](info),)
+
+# measures one can order stats by (get_stats / get_slowest order_by argument)
+DURATION_FIELDS = ("duration", "server_duration", "client_duration")
+# capture_rows only - get_stats / get_largest order_by argument
+ROWS_FIELDS = ("rowcount", "rows_fetched", "bytes_fetched")
+
+# ------------------------------------------------------------
+
+class DurationAgg:
+    " count, sum, min and max of durations - for one statement or for one group "
+    __slots__ = ("cnt", "cnt_timed", "duration", "server_duration", "client_duration",
+                 "min_duration", "max_duration", "histogram",
+                 "rowcount", "rows_fetched", "bytes_fetched")
+
+    def __init__(self):
+        # cnt - all seen, cnt_timed - the ones with duration already known
+        self.cnt = 0
+        self.cnt_timed = 0
+        self.duration = 0.0
+        self.server_duration = None
+        self.client_duration = None
+        self.min_duration = None
+        self.max_duration = None
+        self.histogram = Histogram()
+        self.rowcount = None
+        self.rows_fetched = None
+        self.bytes_fetched = None
+
+    def add(self, stmt, latency_measure:str="duration"):
+        latency = getattr(stmt, latency_measure)
+        if latency is not None:
+            self.histogram.add(latency)
+        duration = stmt.duration
+        self.cnt_timed += 1
+        self.duration += duration
+        if self.min_duration is None or duration < self.min_duration:
+            self.min_duration = duration
+        if self.max_duration is None or duration > self.max_duration:
+            self.max_duration = duration
+        if stmt.server_duration is not None:
+            self.server_duration = (self.server_duration or 0.0) + stmt.server_duration
+        if stmt.client_duration is not None:
+            self.client_duration = (self.client_duration or 0.0) + stmt.client_duration
+
+    def add_rows(self, rowcount:Optional[int]=None, rows_fetched:Optional[int]=None,
+                 bytes_fetched:Optional[int]=None):
+        if rowcount is not None:
+            self.rowcount = (self.rowcount or 0) + rowcount
+        if rows_fetched is not None:
+            self.rows_fetched = (self.rows_fetched or 0) + rows_fetched
+        if bytes_fetched is not None:
+            self.bytes_fetched = (self.bytes_fetched or 0) + bytes_fetched
+
+    def to_stat(self, key:str, statement=None, sampling:bool=False) -> Stat:
+        """
+        sampling - sampling mode, sets cnt_measured. Durations are of measured
+        statements, scale_stat() estimates the rest after grouping.
+        """
+        return Stat(key, self.cnt, self.duration, statement,
+                    server_duration=self.server_duration, client_duration=self.client_duration,
+                    min_duration=self.min_duration, max_duration=self.max_duration,
+                    cnt_measured=self.cnt_timed if sampling else None,
+                    histogram=self.histogram.copy(),
+                    rowcount=self.rowcount, rows_fetched=self.rows_fetched, bytes_fetched=self.bytes_fetched)
+
+# ------------------------------------------------------------
+
+def merge_stats(stat: Stat, other: Stat):
+    " adds other to stat, statement is ignored "
+    stat.cnt += other.cnt
+    stat.duration += other.duration
+    for name in ("server_duration", "client_duration", "cnt_measured") + ROWS_FIELDS:
+        value = getattr(other, name)
+        if value is not None:
+            setattr(stat, name, (getattr(stat, name) or 0) + value)
+    if other.min_duration is not None and (stat.min_duration is None or other.min_duration < stat.min_duration):
+        stat.min_duration = other.min_duration
+    if other.max_duration is not None and (stat.max_duration is None or other.max_duration > stat.max_duration):
+        stat.max_duration = other.max_duration
+    if other.histogram is not None:
+        if stat.histogram is None:
+            stat.histogram = Histogram()
+        stat.histogram.merge(other.histogram)
+
+# distinct statement strings aggregated as such, the rest by fingerprint
+STATS_MAX_STATEMENTS = 1000
+
+
+def scale_stat(stat: Stat):
+    """
+    sampling mode - durations of measured statements scaled by cnt /
+    cnt_measured of the whole group, so statements never measured (e.g.
+    distinct literal statements) are estimated too. Rows are not scaled -
+    they are known for measured statements only.
+    """
+    if not stat.cnt_measured:
+        return
+    factor = stat.cnt / stat.cnt_measured
+    stat.duration *= factor
+    if stat.server_duration is not None:
+        stat.server_duration *= factor
+    if stat.client_duration is not None:
+        stat.client_duration *= factor
+
+# ------------------------------------------------------------
+
+class StatsAggregator:
+    """
+    Incremental aggregates of all statements seen: per statement string
+    DurationAgg and top-K slowest statements heap per measure.
+    """
+
+    def __init__(self, keep_slowest:int, measures:Tuple[str, ...]=("duration",),
+                 latency_measure:str="duration", max_statements:int=STATS_MAX_STATEMENTS):
+        self.keep_slowest = keep_slowest
+        self.max_statements = max_statements
+        self.measures = measures
+        # measure used for histograms / percentiles
+        self.latency_measure = latency_measure
+        # span (None outside of spans) -> statement -> DurationAgg
+        self.by_span: Dict[Optional[str], Dict[str, DurationAgg]] = {None: {}}
+        # number of statement string keys (all spans)
+        self.nr_statements = 0
+        # fingerprint key -> sample statement
+        self.samples: Dict[str, str] = {}
+        # measure -> min-heap of (value, idx, SqlStatement)
+        self.slowest: Dict[str, List[Tuple[float, int, Any]]] = {measure: [] for measure in measures}
+
+    def add_count(self, statement:str, span:Optional[str]=None):
+        " called when statement arrives "
+        by_statement = self.by_span.get(span)
+        if by_statement is None:
+            by_statement = self.by_span[span] = {}
+        agg = by_statement.get(statement)
+        if agg is None:
+            if self.nr_statements < self.max_statements:
+                self.nr_statements += 1
+                agg = by_statement[statement] = DurationAgg()
+            else:
+                fingerprint = parsing.fingerprint_statement(statement)
+                self.samples.setdefault(fingerprint, statement)
+                agg = by_statement.get(fingerprint)
+                if agg is None:
+                    agg = by_statement[fingerprint] = DurationAgg()
+        agg.cnt += 1
+
+    def _get_agg(self, statement:str, span:Optional[str]) -> DurationAgg:
+        " of the statement already counted by add_count() "
+        by_statement = self.by_span[span]
+        agg = by_statement.get(statement)
+        if agg is None:
+            agg = by_statement[parsing.fingerprint_statement(statement)]
+        return agg
+
+    def add_timed(self, stmt, track_slowest:bool=True):
+        " called when duration of the statement is known "
+        self._get_agg(stmt.statement, stmt.span).add(stmt, self.latency_measure)
+        if not track_slowest:
+            return
+        keep_slowest = self.keep_slowest
+        for measure, heap in self.slowest.items():
+            value = getattr(stmt, measure)
+            if value is None:
+                continue
+            if len(heap) < keep_slowest:
+                heapq.heappush(heap, (value, stmt.idx, stmt))
+            elif value > heap[0][0]:
+                heapq.heapreplace(heap, (value, stmt.idx, stmt))
+
+    def add_rows(self, statement:str, span:Optional[str]=None, rowcount:Optional[int]=None,
+                 rows_fetched:Optional[int]=None, bytes_fetched:Optional[int]=None):
+        " called when rowcount is known and on every fetch "
+        self._get_agg(statement, span).add_rows(rowcount, rows_fetched, bytes_fetched)
+
+    def _iter_aggs(self, span:Optional[str]=None):
+        " (span, statement, DurationAgg) - span None for all spans, NO_SPAN for statements outside of spans "
+        for span_name, by_statement in list(self.by_span.items()):
+            if span is not None and span_name != (None if span == NO_SPAN else span):
+                continue
+            for statement, agg in list(by_statement.items()):
+                yield span_name, statement, agg
+
+    def get_stats(self, name:StatName, top:Optional[int], order_by:str="duration", scale:bool=False,
+                  span:Optional[str]=None) -> List[Stat]:
+        """
+        top - None for all groups
+        scale - sampling mode, durations are scaled per group, see scale_stat()
+        span - statements of this span only (nested spans not included),
+        NO_SPAN for statements outside of spans
+        """
+        groups: Dict[str, Stat] = {}
+        for span_name, statement, agg in self._iter_aggs(span):
+            if name == StatName.BY_SPAN:
+                keys = (span_name if span_name is not None else NO_SPAN,)
+            else:
+                keys = get_stat_keys(name, parsing.parse_statement(statement))
+            for key in keys:
+                stat = agg.to_stat(key, sampling=scale)
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = stat
+                else:
+                    merge_stats(group, stat)
+        for stat in groups.values():
+            if scale:
+                scale_stat(stat)
+            stat.set_percentiles()
+        ordered = sorted(groups.values(),
+                         key=lambda stat: (getattr(stat, order_by) or 0.0, stat.cnt),
+                         reverse=True)
+        return ordered[:top]
+
+    def get_statement_stats(self, sampling:bool=False) -> List[Stat]:
+        """
+        one Stat per distinct statement string (all spans), key is the
+        statement - the sample one for aggregates by fingerprint. Not scaled,
+        sampling sets cnt_measured, see scale_stat().
+        """
+        stats: Dict[str, Stat] = {}
+        for _, key, agg in self._iter_aggs():
+            statement = self.samples.get(key, key)
+            stat = agg.to_stat(statement, sampling=sampling)
+            if statement in stats:
+                merge_stats(stats[statement], stat)
+            else:
+                stats[statement] = stat
+        return list(stats.values())
+
+    def get_slowest(self, top:int, order_by:str="duration") -> List[Any]:
+        " returns SqlStatement list, only keep_slowest are kept "
+        return [stmt for _, _, stmt in heapq.nlargest(top, self.slowest[order_by])]
@@ -0,0 +1,256 @@
+"""
+Queryable statement store - sqlite3 database with one row per retained
+statement, see CaptureSqlStatements(store_path=...) and connection.
+
+With store_path statements are written to the file during the capture, in
+batched transactions (store_batch_size statements each) as soon as their
+duration is known, so the file holds all retained statements even in
+ring-buffer mode and can be analyzed after the process exited:
+
+    store = CaptureStore.open("capture.db")
+    for stmt in store.query(table="users", min_duration=0.1, order_by="duration"):
+        print(stmt.duration, stmt.statement, stmt.parameters)
+
+Statement text is stored once per distinct statement (statement_text
+table), touched tables once per distinct statement (statement_table).
+Parameters are stored as repr truncated to params_max_repr. rowcount /
+rows_fetched are the values known when the statement is written.
+"""
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from .parameters import PARAMS_MAX_REPR_DEFAULT, get_params_repr
+from .tables import normalize_name
+
+STORE_BATCH_SIZE_DEFAULT = 1000
+STORE_SCHEMA_VERSION = 1
+
+# sql_statement keeps the columns it had when it was in memory only
+SCHEMA = """
+create table capture_info(name varchar primary key, value);
+create table statement_text(id integer primary key, statement text not null unique,
+                            fingerprint varchar, sql_type varchar, first_table varchar);
+create table statement_table(table_name varchar not null, text_id int not null references statement_text(id),
+                             primary key (table_name, text_id)) without rowid;
+create table sql_statement(id int primary key, duration float, server_duration float, client_duration float,
+                           first_table varchar, sql_type varchar, fingerprint varchar,
+                           text_id int not null references statement_text(id),
+                           started float, parameters text, error text, span varchar,
+                           rowcount int, rows_fetched int);
+create index ix_sql_statement_sql_type on sql_statement(sql_type);
+create index ix_sql_statement_first_table on sql_statement(first_table);
+create index ix_sql_statement_fingerprint on sql_statement(fingerprint);
+create index ix_sql_statement_duration on sql_statement(duration);
+create index ix_sql_statement_started on sql_statement(started);
+create index ix_sql_statement_text_id on sql_statement(text_id);
+"""
+
+STORE_ORDER_BY = ("id", "duration", "server_duration", "client_duration", "started")
+
+# ------------------------------------------------------------
+
+@dataclass
+class StoredStatement:
+    idx: int
+    statement: str
+    # seconds since the capture started
+    started: float
+    duration: Optional[float]
+    server_duration: Optional[float]
+    client_duration: Optional[float]
+    sql_type: str
+    first_table: str
+    fingerprint: str
+    parameters: Optional[str]
+    error: Optional[str]
+    span: Optional[str]
+    rowcount: Optional[int]
+    rows_fetched: Optional[int]
+
+
+class CaptureStore:
+    """
+    path - sqlite3 database file, must not exist, or ":memory:". Use open()
+    for reading stored capture.
+    """
+
+    def __init__(self, path:str=":memory:", started:Optional[datetime]=None, started_ns:int=0,
+                 batch_size:int=STORE_BATCH_SIZE_DEFAULT, params_max_repr:int=PARAMS_MAX_REPR_DEFAULT,
+                 _existing:bool=False):
+        if batch_size < 1:
+            raise Exception(f"store_batch_size should be positive integer, got: {batch_size}")
+        if not _existing and path != ":memory:" and os.path.exists(path):
+            raise Exception(f"Store file {path} already exists, use CaptureStore.open() to read it")
+        self.path = path
+        self.started_ns = started_ns
+        self.batch_size = batch_size
+        self.params_max_repr = params_max_repr
+        # listeners of many threads write, readers may run meanwhile
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending: List[Tuple] = []
+        # statement -> statement_text.id, texts written so far
+        self._text_ids: Dict[str, int] = {}
+        self._new_texts: List[Tuple] = []
+        self._new_tables: List[Tuple[str, int]] = []
+        if not _existing:
+            self.connection.executescript(SCHEMA)
+            self._set_info(version=STORE_SCHEMA_VERSION,
+                           started=(started or datetime.now()).isoformat(), finished=None, duration=None)
+
+    @classmethod
+    def open(cls, path:str) -> "CaptureStore":
+        " stored capture, e.g. of a process that exited "
+        if not os.path.exists(path):
+            raise Exception(f"Store file {path} not found")
+        store = cls(path, _existing=True)
+        version = store.get_info().get("version")
+        if version != STORE_SCHEMA_VERSION:
+            store.close()
+            raise Exception(f"Store file {path} version {version} is not supported, expected {STORE_SCHEMA_VERSION}")
+        return store
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    # ------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------
+
+    def _set_info(self, **values):
+        with self.connection:
+            self.connection.executemany("insert or replace into capture_info values (?, ?)", values.items())
+
+    def get_info(self) -> Dict[str, Any]:
+        " version, started (iso datetime), finished, duration "
+        return dict(self.connection.execute("select name, value from capture_info").fetchall())
+
+    def _get_text_id(self, statement:str, info) -> int:
+        text_id = self._text_ids.get(statement)
+        if text_id is None:
+            text_id = self._text_ids[statement] = len(self._text_ids) + 1
+            self._new_texts.append((text_id, statement, info.fingerprint, info.sql_type, info.first_table))
+            self._new_tables.extend((table, text_id) for table in info.tables)
+        return text_id
+
+    def add(self, stmt):
+        " stmt - SqlStatement with known duration, written on every batch_size statements "
+        info = stmt.info
+        parameters = get_params_repr(stmt.parameters, self.params_max_repr)
+        with self._lock:
+            self._pending.append((stmt.idx, stmt.duration, stmt.server_duration, stmt.client_duration,
+                                  info.first_table, info.sql_type, info.fingerprint,
+                                  self._get_text_id(stmt.statement, info),
+                                  (stmt.tst_started_ns - self.started_ns) / 1_000_000_000.0,
+                                  parameters, stmt.error, stmt.span, stmt.rowcount, stmt.rows_fetched))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def add_many(self, statements):
+        for stmt in statements:
+            self.add(stmt)
+        self.flush()
+
+    def _flush(self):
+        " call with lock acquired "
+        if not self._pending:
+            return
+        with self.connection:
+            if self._new_texts:
+                self.connection.executemany("insert into statement_text values (?, ?, ?, ?, ?)", self._new_texts)
+                self.connection.executemany("insert or ignore into statement_table values (?, ?)", self._new_tables)
+            self.connection.executemany("insert into sql_statement values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        self._pending)
+        self._new_texts = []
+        self._new_tables = []
+        self._pending = []
+
+    def flush(self):
+        " writes pending statements "
+        with self._lock:
+            self._flush()
+
+    def finish(self, finished:datetime, duration:float):
+        self.flush()
+        self._set_info(finished=finished.isoformat(), duration=duration)
+
+    # ------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------
+
+    @property
+    def started(self) -> datetime:
+        return datetime.fromisoformat(self.get_info()["started"])
+
+    def _to_offset(self, value:Union[datetime, float]) -> float:
+        " datetime -> seconds since the capture started "
+        if isinstance(value, datetime):
+            return (value - self.started) / timedelta(seconds=1)
+        return value
+
+    def _get_where(self, sql_type:Optional[str]=None, table:Optional[str]=None, fingerprint:Optional[str]=None,
+                   min_duration:Optional[float]=None, max_duration:Optional[float]=None,
+                   started_from:Union[datetime, float, None]=None, started_to:Union[datetime, float, None]=None,
+                   span:Optional[str]=None, errors_only:bool=False) -> Tuple[str, List[Any]]:
+        conditions, params = [], []
+        if sql_type is not None:
+            conditions.append("s.sql_type = ?")
+            params.append(sql_type.upper())
+        if table is not None:
+            conditions.append("s.text_id in (select text_id from statement_table where table_name = ?)")
+            params.append(normalize_name(table))
+        if fingerprint is not None:
+            conditions.append("s.fingerprint = ?")
+            params.append(fingerprint)
+        if min_duration is not None:
+            conditions.append("s.duration >= ?")
+            params.append(min_duration)
+        if max_duration is not None:
+            conditions.append("s.duration <= ?")
+            params.append(max_duration)
+        if started_from is not None:
+            conditions.append("s.started >= ?")
+            params.append(self._to_offset(started_from))
+        if started_to is not None:
+            conditions.append("s.started < ?")
+            params.append(self._to_offset(started_to))
+        if span is not None:
+            conditions.append("s.span = ?")
+            params.append(span)
+        if errors_only:
+            conditions.append("s.error is not null")
+        return (" where " + " and ".join(conditions) if conditions else ""), params
+
+    def query(self, order_by:str="id", descending:bool=False, limit:Optional[int]=None,
+              **filters) -> Iterator[StoredStatement]:
+        """
+        statements matching all filters given - sql_type, table (any touched
+        table), fingerprint, min_duration / max_duration (seconds),
+        started_from / started_to (datetime or seconds since the capture
+        started), span, errors_only. Arguments are checked and pending
+        statements written on call, rows are read lazily.
+        """
+        if order_by not in STORE_ORDER_BY:
+            raise Exception(f"Order by {order_by} is not valid, valid are: {STORE_ORDER_BY}")
+        self.flush()
+        where, params = self._get_where(**filters)
+        sql = ("select s.id, t.statement, s.started, s.duration, s.server_duration, s.client_duration, "
+               "s.sql_type, s.first_table, s.fingerprint, s.parameters, s.error, s.span, s.rowcount, s.rows_fetched "
+               f"from sql_statement s join statement_text t on t.id = s.text_id{where} "
+               f"order by s.{order_by}{' desc' if descending else ''}")
+        if limit is not None:
+            sql += " limit ?"
+            params.append(limit)
+        cursor = self.connection.execute(sql, params)
+        return (StoredStatement(*row) for row in cursor)
+
+    def count(self, **filters) -> int:
+        " number of statements matching filters, see query() "
+        self.flush()
+        where, params = self._get_where(**filters)
+        return self.connection.execute(f"select count(*) from sql_statement s{where}", params).fetchone()[0]
@@ -0,0 +1,183 @@
+"""
+Table extraction - all tables a statement touches, target table of DML and
+CTE names, found by a small tokenizer instead of "the first word after FROM".
+
+Handles joins, comma separated FROM lists, subqueries in FROM / WHERE, CTEs
+(WITH .. AS (..), names are not reported as tables), INSERT .. SELECT,
+UPDATE .. FROM, DELETE .. USING and MERGE. FROM inside function calls
+(EXTRACT(.. FROM ..), SUBSTRING, TRIM) and IS DISTINCT FROM are skipped.
+It is not a full SQL parser - the result is good enough for grouping stats.
+
+Called from parsing.parse_statement(), so results are cached per statement
+string.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# ------------------------------------------------------------
+
+@dataclass(frozen=True)
+class TablesInfo:
+    # all tables touched in order of appearance, CTE names excluded
+    tables: Tuple[str, ...]
+    # INSERT / UPDATE / DELETE / MERGE only - table being changed
+    target_table: Optional[str]
+    ctes: Tuple[str, ...]
+
+# ------------------------------------------------------------
+
+_NAME = r'(?:"[^"]*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][\w$#@]*)'
+
+_RE_TOKEN = re.compile(r"""
+      (?P<skip>\s+|--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\d[\w.]*)
+    | (?P<name>{name}(?:\s*\.\s*(?:{name}|\*))*)
+    | (?P<punct>[(),;])
+    | (?P<other>.)
+    """.format(name=_NAME), re.VERBOSE | re.DOTALL)
+
+_RE_QUOTES = re.compile(r'["`\[\]\s]')
+
+# names that are never tables or aliases - enough for the state machine below
+KEYWORDS = frozenset("""
+    ALL AND ANY AS ASC BETWEEN BY CASE CROSS DEFAULT DELETE DESC DISTINCT DO ELSE END EXCEPT
+    EXISTS FETCH FILTER FOR FROM FULL GROUP HAVING IF IN INNER INSERT INTERSECT INTO IS JOIN
+    KEY LATERAL LEFT LIKE ILIKE LIMIT MATERIALIZED MERGE NATURAL NOT NULL OFFSET ON ONLY OR
+    ORDER OUTER OVER PARTITION RECURSIVE REPLACE RETURNING RIGHT SELECT SET SOME TABLE THEN
+    UNION UPDATE USING VALUES WHEN WHERE WINDOW WITH
+    """.split())
+
+# keywords ending FROM list (comma doesn't start the next table then)
+_END_OF_FROM_LIST = frozenset("""
+    WHERE GROUP ORDER HAVING LIMIT OFFSET FETCH UNION INTERSECT EXCEPT ON USING JOIN INNER
+    LEFT RIGHT FULL CROSS NATURAL OUTER WINDOW FOR RETURNING SET VALUES SELECT
+    """.split())
+
+_MAIN_TYPES = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "MERGE")
+# main statement type -> keyword introducing the target table
+_TARGET_KEYWORDS = {"INSERT": "INTO", "REPLACE": "INTO", "MERGE": "INTO", "UPDATE": "UPDATE", "DELETE": "FROM"}
+# UPDATE not introducing a table: ON CONFLICT .. DO UPDATE, ON DUPLICATE KEY UPDATE, FOR [NO KEY] UPDATE
+_NOT_UPDATE_TABLE_AFTER = ("DO", "KEY", "FOR")
+
+
+def tokenize(statement:str) -> List[Tuple[str, str]]:
+    " (kind, text) - kind is name, punct or other; whitespace, comments, literals and numbers dropped "
+    return [(match.lastgroup, match.group())
+            for match in _RE_TOKEN.finditer(statement) if match.lastgroup != "skip"]
+
+
+def normalize_name(name:str) -> str:
+    " quotes removed, upper cased - the same as first_table "
+    return _RE_QUOTES.sub("", name).upper()
+
+
+def extract_tables(statement:str) -> TablesInfo:
+    tokens = tokenize(statement)
+    uppers = [text.upper() if kind == "name" else text for kind, text in tokens]
+    tables: List[str] = []
+    ctes: List[str] = []
+    target_table = None
+    main_type = None
+
+    # per parentheses level: [query level (not function call / column list), FROM list active]
+    levels = [[True, False]]
+    # keyword waiting for the table name, None when no table is expected
+    expect: Optional[str] = None
+    # WITH clause at depth 0 / inside subquery - CTE name expected
+    expect_cte = False
+    cte_depth: Optional[int] = None
+
+    for pos, (kind, text) in enumerate(tokens):
+        upper = uppers[pos]
+        prev = uppers[pos - 1] if pos else None
+        depth = len(levels) - 1
+        level = levels[-1]
+
+        if kind == "punct":
+            if text == "(":
+                # function call or column list when preceded by a plain name
+                is_query = not (prev is not None and tokens[pos - 1][0] == "name"
+                                and prev not in KEYWORDS)
+                levels.append([is_query, False])
+                if expect == "CTE_BODY":
+                    expect = None
+            elif text == ")":
+                if len(levels) > 1:
+                    levels.pop()
+                if expect in ("FROM", "JOIN"):
+                    expect = None
+            elif text == ",":
+                if expect is None and level[1]:
+                    expect = "FROM"
+                elif cte_depth == depth and expect is None:
+                    expect_cte = True
+            else:
+                expect = None
+                level[1] = False
+            continue
+        if kind == "other":
+            continue
+
+        is_keyword = upper in KEYWORDS
+        if expect_cte and not is_keyword:
+            ctes.append(normalize_name(text))
+            expect_cte = False
+            expect = "CTE_BODY"
+            continue
+        if expect_cte and upper == "RECURSIVE":
+            continue
+
+        if expect is not None and expect != "CTE_BODY" and not is_keyword:
+            name = normalize_name(text)
+            next_punct = tokens[pos + 1][1] if pos + 1 < len(tokens) else None
+            if expect in ("FROM", "JOIN", "USING") and next_punct == "(":
+                # table valued function
+                expect = None
+                continue
+            if name not in ctes:
+                if name not in tables:
+                    tables.append(name)
+                if (target_table is None and depth == 0 and main_type is not None
+                        and _TARGET_KEYWORDS.get(main_type) == expect):
+                    target_table = name
+            expect = None
+            continue
+        if expect is not None and upper in ("ONLY", "LATERAL", "IF", "NOT", "EXISTS"):
+            continue
+
+        if not is_keyword:
+            continue
+        expect = None
+        if depth == 0 and main_type is None and upper in _MAIN_TYPES:
+            main_type = upper
+        if upper == "WITH":
+            expect_cte = True
+            cte_depth = depth
+            continue
+        if cte_depth == depth and upper in _MAIN_TYPES:
+            # end of WITH clause
+            cte_depth = None
+        if not level[0]:
+            continue
+        if upper in _END_OF_FROM_LIST:
+            level[1] = False
+
+        if upper == "FROM":
+            if prev == "DISTINCT" and pos > 1 and uppers[pos - 2] in ("IS", "NOT"):
+                continue
+            expect = "FROM"
+            level[1] = True
+        elif upper == "JOIN":
+            expect = "JOIN"
+        elif upper == "INTO":
+            expect = "INTO"
+        elif upper == "TABLE":
+            expect = "TABLE"
+        elif upper == "UPDATE":
+            if prev not in _NOT_UPDATE_TABLE_AFTER:
+                expect = "UPDATE"
+        elif upper == "USING":
+            if pos + 1 < len(tokens) and tokens[pos + 1][1] != "(":
+                expect = "USING"
+
+    return TablesInfo(tables=tuple(tables), target_table=target_table, ctes=tuple(ctes))
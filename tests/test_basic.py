@@ -7,7 +7,7 @@ BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
 sys.path.append(BASE_DIR)
 
 # next one will report if sqlalchemy is not available
-from sqlalchemy_capture_sql import CaptureSqlStatements
+from sqlalchemy_capture_sql import CaptureSqlStatements, TimingMode
 from sqlalchemy import create_engine, text, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -50,6 +50,114 @@ class TestBasic(TestBase):
                 [st.statement for st in capture_stmts.statements],
                 ["select 'In-capture-1'", "select 'In-capture-2'"])
 
+    def test_timing_server(self):
+        with CaptureSqlStatements(self.engine, timing=TimingMode.SERVER) as capture_stmts:
+            self.conn.execute(text("select 'In-capture-1'")).fetchall()
+            self.conn.execute(text("select 'In-capture-2'")).fetchall()
+            with self.assertRaises(Exception):
+                self.conn.execute(text("select * from no_such_table")).fetchall()
+
+        if self.verbose:
+            capture_stmts.pp()
+        self.assertEqual(capture_stmts.count(), 3)
+        for stmt in capture_stmts:
+            self.assertIsNotNone(stmt.server_duration)
+            self.assertIsNotNone(stmt.client_duration)
+            self.assertAlmostEqual(stmt.duration, stmt.server_duration + stmt.client_duration, places=6)
+        self.assertIsNone(capture_stmts.statements[0].error)
+        self.assertIn("no_such_table", capture_stmts.statements[2].error)
+
+        slowest = capture_stmts.get_slowest(top=3, order_by="server_duration")
+        self.assertEqual(
+                [st.server_duration for st in slowest],
+                sorted([st.server_duration for st in capture_stmts], reverse=True))
+        stats = capture_stmts.get_stats("by_type", order_by="client_duration")
+        self.assertEqual(stats[0].cnt, 3)
+        self.assertAlmostEqual(stats[0].server_duration,
+                               sum(st.server_duration for st in capture_stmts), places=6)
+
+        # not available in default mode
+        with CaptureSqlStatements(self.engine) as capture_default:
+            self.conn.execute(text("select 1")).fetchall()
+        self.assertIsNone(capture_default.statements[0].server_duration)
+        with self.assertRaises(Exception):
+            capture_default.get_slowest(order_by="server_duration")
+
+        capture_stmts.pp(print_cmd=lambda *args: None, order_by="server_duration")
+
+    def test_ring_buffer(self):
+        with CaptureSqlStatements(self.engine, max_statements=3) as capture_stmts:
+            for nr in range(10):
+                self.conn.execute(text(f"select {nr}")).fetchall()
+            self.conn.execute(text("select 'last'")).fetchall()
+
+        if self.verbose:
+            capture_stmts.pp()
+        self.assertEqual(capture_stmts.count(), 11)
+        self.assertEqual([st.idx for st in capture_stmts], [9, 10, 11])
+        self.assertEqual(capture_stmts.get_statement_by_row_id(11).statement, "select 'last'")
+        self.assertFalse(capture_stmts.is_retained(8))
+        with self.assertRaises(Exception):
+            capture_stmts.get_statement_by_row_id(8)
+        # aggregates cover dropped statements too
+        self.assertEqual(capture_stmts.get_counts("by_type"), {"SELECT": 11})
+        self.assertEqual(len(capture_stmts.get_slowest(top=11)), 11)
+        capture_stmts.report_slowest()
+        capture_stmts.pp(print_cmd=lambda *args: None)
+
+    def test_keep_slowest(self):
+        with self.assertRaises(Exception):
+            CaptureSqlStatements(self.engine, keep_slowest=0)
+        with CaptureSqlStatements(self.engine, keep_slowest=2) as capture_stmts:
+            for nr in range(5):
+                self.conn.execute(text(f"select {nr}")).fetchall()
+        self.assertEqual(len(capture_stmts.report_slowest().splitlines()), 2)
+        output = []
+        capture_stmts.pp(print_cmd=output.append)
+        self.assertIn("== Slowest (top 2):", output)
+
+    def test_stats_bounded(self):
+        capture_stmts = CaptureSqlStatements(self.engine, max_statements=3)
+        capture_stmts._stats.max_statements = 4
+        with capture_stmts:
+            for nr in range(10):
+                self.conn.execute(text(f"select {nr}")).fetchall()
+                self.conn.execute(text(f"select {nr}, 'x'")).fetchall()
+        # 4 statement strings, the rest by 2 fingerprints
+        self.assertEqual(sum(len(by_statement) for by_statement in capture_stmts._stats.by_span.values()), 6)
+        self.assertEqual(capture_stmts.get_counts("by_fingerprint"), {"SELECT ?": 10, "SELECT ?, ?": 10})
+        self.assertEqual(capture_stmts.get_stats("by_type")[0].cnt, 20)
+        self.assertAlmostEqual(capture_stmts.get_stats("by_type")[0].duration,
+                               sum(stat.duration for stat in capture_stmts.get_stats("by_fingerprint")))
+        snapshot = capture_stmts.to_snapshot()
+        self.assertEqual(snapshot.count, 20)
+        # sample statements of fingerprint aggregates
+        self.assertEqual({entry.statement for entry in snapshot.entries.values()}, {"select 2", "select 2, 'x'"})
+
+    def test_stats_during_capture(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            for nr in range(5):
+                self.conn.execute(text(f"select {nr}")).fetchall()
+            # no finish() needed
+            self.assertEqual(capture_stmts.get_counts("by_type"), {"SELECT": 5})
+            stat = capture_stmts.get_stats("by_type")[0]
+            self.assertLessEqual(stat.min_duration, stat.max_duration)
+            # the last one is still running
+            self.assertEqual(len(capture_stmts.get_slowest(top=10)), 4)
+            capture_stmts.pp(print_cmd=lambda *args: None)
+
+        self.assertEqual(len(capture_stmts.get_slowest(top=10)), 5)
+        stat = capture_stmts.get_stats("by_type")[0]
+        self.assertAlmostEqual(stat.duration, sum(st.duration for st in capture_stmts), places=6)
+        self.assertEqual(stat.max_duration, capture_stmts.get_slowest(top=1)[0].duration)
+
+        # sqlite3 database is created on request
+        cursor = capture_stmts.connection.cursor()
+        cursor.execute("select count(*), sum(duration) from sql_statement")
+        cnt, duration = cursor.fetchone()
+        self.assertEqual(cnt, 5)
+        self.assertAlmostEqual(duration, stat.duration, places=6)
+
 # ------------------------------------------------------------
 
 class User(Base):
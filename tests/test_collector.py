@@ -0,0 +1,116 @@
+# pytest
+import sys, os
+import subprocess
+import tempfile
+import textwrap
+import unittest
+
+# setup path dynamically
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, CaptureCollector
+from sqlalchemy_capture_sql.collector import main
+from sqlalchemy import create_engine, text
+
+
+WORKER_SCRIPT = textwrap.dedent("""
+    import sys
+    from sqlalchemy import create_engine, text
+    from sqlalchemy_capture_sql import CaptureSqlStatements
+
+    spool_dir, name, nr = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    engine = create_engine("sqlite:///:memory:")
+    with engine.connect() as conn:
+        conn.execute(text("create table items (id int, name text)"))
+        with CaptureSqlStatements(engine, spool_dir=spool_dir, spool_name=name):
+            for idx in range(nr):
+                conn.execute(text(f"insert into items values ({idx}, 'x')"))
+                conn.execute(text(f"select * from items where id = {idx}")).fetchall()
+    """)
+
+
+class TestCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.spool_dir = os.path.join(self.tmp_dir.name, "spool")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_workers(self, workers):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([BASE_DIR, os.environ.get("PYTHONPATH", "")]))
+        processes = [subprocess.Popen([sys.executable, "-c", WORKER_SCRIPT, self.spool_dir, name, str(nr)], env=env)
+                     for name, nr in workers]
+        for process in processes:
+            self.assertEqual(process.wait(timeout=60), 0)
+
+    def test_processes_merged(self):
+        self.run_workers([("web-1", 3), ("web-2", 5)])
+        collector = CaptureCollector(self.spool_dir)
+
+        self.assertEqual(len(collector.processes), 2)
+        self.assertEqual(collector.count(), 16)
+        self.assertEqual(collector.get_counts("by_type"), {"INSERT": 8, "SELECT": 8})
+        self.assertEqual(collector.get_counts("by_touched_table"), {"ITEMS": 16})
+
+        process_stats = collector.get_process_stats(order_by="cnt")
+        self.assertEqual([stat.cnt for stat in process_stats], [10, 6])
+        self.assertTrue(process_stats[0].key.startswith("web-2@"))
+        self.assertEqual(collector.get_counts("by_type", process=process_stats[1].key), {"INSERT": 3, "SELECT": 3})
+        with self.assertRaises(Exception):
+            collector.get_stats("by_type", process="unknown")
+
+        slowest = collector.get_slowest(top=3)
+        self.assertEqual(len(slowest), 3)
+        self.assertTrue(all(stat.key in collector.processes for stat in slowest))
+        self.assertGreaterEqual(slowest[0].duration, slowest[-1].duration)
+
+        output = []
+        collector.pp(print_cmd=output.append)
+        report = "\n".join(output)
+        self.assertIn("from 2 process(es)", report)
+        self.assertIn("== By process:", report)
+        self.assertIn("web-1@", report)
+
+        output = []
+        self.assertEqual(main([self.spool_dir, "--clear"], print_cmd=output.append), 0)
+        self.assertIn("== By process:", output)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_in_process(self):
+        engine = create_engine("sqlite:///:memory:")
+        with engine.connect() as conn:
+            capture_stmts = CaptureSqlStatements(engine, spool_dir=self.spool_dir, spool_interval=0.01)
+            conn.execute(text("select 1"))
+            # unfinished capture - the state is written periodically
+            collector = CaptureCollector(self.spool_dir)
+            for _ in range(100):
+                if collector.count():
+                    break
+                capture_stmts._spool_writer._stop.wait(0.01)
+                collector.refresh()
+            self.assertEqual(collector.count(), 1)
+            self.assertFalse(collector.records[0].finished)
+
+            conn.execute(text("select 2"))
+            capture_stmts.finish()
+        collector.refresh()
+        self.assertEqual(collector.count(), 2)
+        self.assertTrue(collector.records[0].finished)
+        self.assertEqual(collector.to_snapshot().count, capture_stmts.to_snapshot().count)
+
+        with self.assertRaises(Exception):
+            CaptureSqlStatements(engine, spool_dir=self.spool_dir, spool_interval=0)
+
+    def test_empty(self):
+        collector = CaptureCollector(self.spool_dir)
+        self.assertEqual(collector.count(), 0)
+        output = []
+        collector.pp(print_cmd=output.append)
+        self.assertIn("No sql statements collected", output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
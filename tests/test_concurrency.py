@@ -0,0 +1,118 @@
+# pytest
+import sys, os
+import asyncio
+import threading
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, TimingMode
+from sqlalchemy import create_engine, text
+
+try:
+    import aiosqlite # noqa: F401
+    import greenlet # noqa: F401
+    from sqlalchemy.ext.asyncio import create_async_engine
+    HAS_ASYNC = True
+except ImportError:
+    HAS_ASYNC = False
+
+
+class TestThreads(unittest.TestCase):
+
+    NR_THREADS = 4
+    NR_STATEMENTS = 25
+
+    def run_threads(self, engine, nr_threads=NR_THREADS, nr_statements=NR_STATEMENTS):
+        def worker(nr):
+            with engine.connect() as conn:
+                for stmt_nr in range(nr_statements):
+                    conn.execute(text(f"select 'thread-{nr}', {stmt_nr}")).fetchall()
+
+        threads = [threading.Thread(target=worker, args=(nr,)) for nr in range(nr_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_threads(self):
+        engine = create_engine('sqlite:///:memory:')
+        for timing in TimingMode:
+            with CaptureSqlStatements(engine, timing=timing) as capture_stmts:
+                self.run_threads(engine)
+
+            total = self.NR_THREADS * self.NR_STATEMENTS
+            self.assertEqual(capture_stmts.count(), total)
+            self.assertEqual([st.idx for st in capture_stmts], list(range(1, total+1)))
+            self.assertEqual(capture_stmts.get_counts("by_type"), {"SELECT": total})
+            for stmt in capture_stmts:
+                self.assertIsNotNone(stmt.duration)
+                if timing == TimingMode.SERVER:
+                    self.assertLessEqual(stmt.server_duration, stmt.duration)
+            # statements of one thread are chained - next one started after previous
+            for nr in range(self.NR_THREADS):
+                thread_stmts = [st for st in capture_stmts if f"'thread-{nr}'" in st.statement]
+                self.assertEqual(len(thread_stmts), self.NR_STATEMENTS)
+                for prev, stmt in zip(thread_stmts, thread_stmts[1:]):
+                    self.assertEqual(prev.tst_next_ns, stmt.tst_started_ns)
+            capture_stmts.pp(print_cmd=lambda *args: None)
+
+    def test_threads_ring_buffer(self):
+        engine = create_engine('sqlite:///:memory:')
+        with CaptureSqlStatements(engine, max_statements=10) as capture_stmts:
+            self.run_threads(engine)
+            self.assertEqual(len(list(capture_stmts)), 10)
+        total = self.NR_THREADS * self.NR_STATEMENTS
+        self.assertEqual(capture_stmts.count(), total)
+        self.assertEqual(len(capture_stmts.statements), 10)
+        self.assertEqual(capture_stmts.statements[-1].idx, total)
+        self.assertEqual(capture_stmts.get_statement_by_row_id(total).idx, total)
+
+    def test_short_lived_threads(self):
+        engine = create_engine('sqlite:///:memory:')
+        for max_statements in (None, 5):
+            with CaptureSqlStatements(engine, max_statements=max_statements) as capture_stmts:
+                for _ in range(10):
+                    self.run_threads(engine, nr_threads=2, nr_statements=3)
+                    # buffers of ended threads are dropped
+                    self.assertLessEqual(len(capture_stmts._buffers), 1 + 2)
+                    # ring-buffer bounds all threads together
+                    self.assertLessEqual(len(capture_stmts.statements), max_statements or 60)
+            idxs = [st.idx for st in capture_stmts]
+            self.assertEqual(len(idxs), max_statements or 60)
+            self.assertEqual(idxs, sorted(idxs))
+            self.assertTrue(all(st.duration is not None for st in capture_stmts))
+
+
+@unittest.skipIf(not HAS_ASYNC, "aiosqlite and greenlet are required")
+class TestAsyncEngine(unittest.TestCase):
+
+    def test_async_tasks(self):
+        nr_tasks, nr_statements = 5, 10
+
+        async def task(engine, nr):
+            async with engine.connect() as conn:
+                for stmt_nr in range(nr_statements):
+                    await conn.execute(text(f"select 'task-{nr}', {stmt_nr}"))
+                    await asyncio.sleep(0)
+
+        async def main():
+            engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+            with CaptureSqlStatements(engine) as capture_stmts:
+                await asyncio.gather(*[task(engine, nr) for nr in range(nr_tasks)])
+            await engine.dispose()
+            return capture_stmts
+
+        capture_stmts = asyncio.run(main())
+        self.assertEqual(capture_stmts.count(), nr_tasks * nr_statements)
+        for nr in range(nr_tasks):
+            task_stmts = [st for st in capture_stmts if f"'task-{nr}'" in st.statement]
+            self.assertEqual(len(task_stmts), nr_statements)
+            for prev, stmt in zip(task_stmts, task_stmts[1:]):
+                self.assertEqual(prev.tst_next_ns, stmt.tst_started_ns)
+
+
+if __name__ == '__main__':
+    unittest.main()
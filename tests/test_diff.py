@@ -0,0 +1,105 @@
+# pytest
+import sys, os
+import tempfile
+import contextlib
+import io
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements
+from sqlalchemy_capture_sql.snapshot import CaptureSnapshot
+from sqlalchemy_capture_sql.diff import diff_captures, main, DiffStatus
+from sqlalchemy import create_engine, text
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+        self.conn.execute(text("create table users (id integer primary key, name varchar)"))
+        self.conn.execute(text("create table orders (id integer primary key, user_id integer)"))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def capture(self, nr_users, with_orders):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            for nr in range(nr_users):
+                self.conn.execute(text("select name from users where id = :id"), {"id": nr}).fetchall()
+            # the same fingerprint, different statement
+            self.conn.execute(text("select name from users where id = 1")).fetchall()
+            if with_orders:
+                self.conn.execute(text("select * from orders where user_id in (1, 2, 3)")).fetchall()
+            else:
+                self.conn.execute(text("update users set name = 'x' where id = :id"), {"id": 1})
+        return capture_stmts
+
+    def test_snapshot(self):
+        capture_stmts = self.capture(3, with_orders=False)
+        snapshot = capture_stmts.to_snapshot()
+        self.assertEqual(snapshot.count, 5)
+        self.assertEqual(sorted(snapshot.entries), ["SELECT NAME FROM USERS WHERE ID = ?",
+                                                    "UPDATE USERS SET NAME = ? WHERE ID = ?"])
+        entry = snapshot.entries["SELECT NAME FROM USERS WHERE ID = ?"]
+        self.assertEqual(entry.stat.cnt, 4)
+        # the most frequent one
+        self.assertEqual(entry.statement, "select name from users where id = ?")
+        self.assertEqual((entry.sql_type, entry.first_table), ("SELECT", "USERS"))
+        self.assertEqual(entry.stat.histogram.cnt, 4)
+
+        self.assertEqual({stat.key: stat.cnt for stat in snapshot.get_stats("by_type")},
+                         capture_stmts.get_counts("by_type"))
+        self.assertEqual({stat.key: stat.cnt for stat in snapshot.get_stats("by_type_and_table")},
+                         capture_stmts.get_counts("by_type_and_table"))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("capture.json", "capture.json.gz"):
+                path = os.path.join(tmpdir, name)
+                capture_stmts.save(path)
+                loaded = CaptureSnapshot.load(path)
+                self.assertEqual(loaded.to_dict(), snapshot.to_dict())
+
+    def test_diff(self):
+        old = self.capture(3, with_orders=False)
+        new = self.capture(5, with_orders=True)
+        capture_diff = diff_captures(old, new, order_by="cnt")
+        self.assertTrue(capture_diff)
+        self.assertEqual(capture_diff.new_keys, ["SELECT * FROM ORDERS WHERE USER_ID IN (?+)"])
+        self.assertEqual(capture_diff.removed_keys, ["UPDATE USERS SET NAME = ? WHERE ID = ?"])
+        first = capture_diff.items[0]
+        self.assertEqual((first.key, first.status, first.cnt_delta),
+                         ("SELECT NAME FROM USERS WHERE ID = ?", DiffStatus.CHANGED, 2))
+        self.assertIn("by_fingerprint: 5 -> 7 statement(s) (+2)", capture_diff.report())
+
+        capture_diff = diff_captures(old, new, name="by_table", order_by="cnt")
+        # the same count delta - order depends on durations
+        self.assertEqual({item.key: item.cnt_delta for item in capture_diff.items},
+                         {"USERS": 1, "ORDERS": 1})
+
+        self.assertFalse(diff_captures(old, old))
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            old_path, new_path = os.path.join(tmpdir, "old.json"), os.path.join(tmpdir, "new.json")
+            self.capture(3, with_orders=False).save(old_path)
+            self.capture(5, with_orders=True).save(new_path)
+            output = []
+            exit_code = main([old_path, new_path, "--by", "by_fingerprint", "by_type", "--check"],
+                             print_cmd=output.append)
+            self.assertEqual(exit_code, 1)
+            self.assertEqual(len(output), 2)
+            self.assertIn("NEW", output[0])
+            self.assertIn("REMOVED", output[0])
+            self.assertTrue(output[1].startswith("by_type: 5 -> 7"))
+            self.assertEqual(main([old_path, old_path, "--check"], print_cmd=output.append), 0)
+            # spans are not in snapshots
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                main([old_path, new_path, "--by", "by_span"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, ParamsPolicy
+from sqlalchemy_capture_sql import explain
+from sqlalchemy_capture_sql.explain import ExplainPlan, _parse_postgresql, _parse_mysql
+from sqlalchemy import create_engine, text
+
+
+class TestExplain(unittest.TestCase):
+
+    def setUp(self):
+        explain.plan_cache_clear()
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+        self.conn.execute(text("create table users (id integer primary key, name varchar, age integer)"))
+        self.conn.execute(text("create index ix_users_age on users (age)"))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def capture(self, **kwargs):
+        with CaptureSqlStatements(self.engine, **kwargs) as capture_stmts:
+            self.conn.execute(text("select * from users where id = :id"), {"id": 1}).fetchall()
+            self.conn.execute(text("select distinct name from users where name like :name"), {"name": "a%"}).fetchall()
+            self.conn.execute(text("select * from users where age > :age"), {"age": 30}).fetchall()
+            self.conn.execute(text("update users set age = :age where id = :id"), {"age": 1, "id": 1})
+        return capture_stmts
+
+    def test_explain_slowest(self):
+        capture_stmts = self.capture()
+        explained = capture_stmts.explain_slowest(self.conn, top=10)
+        # updates are not explained
+        self.assertEqual(len(explained), 3)
+        plans = {stat.statement.fingerprint: stat.plan for stat in explained}
+        self.assertTrue(all(stat.statement.plan is stat.plan for stat in explained))
+
+        plan = plans["SELECT * FROM USERS WHERE ID = ?"]
+        self.assertIsNone(plan.error)
+        self.assertEqual((plan.full_scans, plan.temp_sorts), ([], []))
+        self.assertTrue(plan.lines[0].startswith("SEARCH users"))
+
+        plan = plans["SELECT DISTINCT NAME FROM USERS WHERE NAME LIKE ?"]
+        self.assertEqual(plan.full_scans, ["users"])
+        self.assertEqual(plan.temp_sorts, ["USE TEMP B-TREE FOR DISTINCT"])
+        self.assertEqual(plan.flags, ["FULL SCAN users", "TEMP SORT USE TEMP B-TREE FOR DISTINCT"])
+
+        plan = plans["SELECT * FROM USERS WHERE AGE > ?"]
+        self.assertEqual(plan.full_scans, [])
+
+        output = []
+        capture_stmts.pp(print_cmd=output.append)
+        output = "\n".join(output)
+        self.assertIn("== Plans of the slowest statements", output)
+        self.assertIn("!! FULL SCAN users", output)
+
+    def test_transaction_not_left_open(self):
+        capture_stmts = self.capture()
+        self.conn.commit()
+        self.assertFalse(self.conn.in_transaction())
+        capture_stmts.explain_slowest(self.conn, top=10)
+        self.assertFalse(self.conn.in_transaction())
+        with self.conn.begin():
+            self.conn.execute(text("select 1"))
+
+    def test_cache(self):
+        self.capture().explain_slowest(self.engine, top=1)
+        self.assertEqual(explain.plan_cache_size(), 1)
+        capture_stmts = self.capture()
+        explained = capture_stmts.explain_slowest(self.conn, top=10)
+        self.assertEqual(explain.plan_cache_size(), 3)
+        # not re-explained - the same plan object from the cache
+        explained_again = self.capture().explain_slowest(self.conn, top=10)
+        self.assertEqual({id(stat.plan) for stat in explained}, {id(stat.plan) for stat in explained_again})
+
+    def test_parameters_not_retained(self):
+        capture_stmts = self.capture(params_policy=ParamsPolicy.HASH)
+        explained = capture_stmts.explain_slowest(self.conn)
+        self.assertTrue(all(stat.plan.error for stat in explained))
+        self.assertEqual(explain.plan_cache_size(), 0)
+
+    def test_parse_other_dialects(self):
+        plan = ExplainPlan("", "", "postgresql")
+        _parse_postgresql(plan, [("Sort  (cost=10.1..10.2 rows=3 width=4)",),
+                                 ("  Sort Key: name",),
+                                 ("  ->  Seq Scan on users  (cost=0.00..1.03 rows=3 width=4)",)])
+        self.assertEqual((plan.full_scans, plan.temp_sorts), (["users"], ["Sort"]))
+
+        plan = ExplainPlan("", "", "mysql")
+        _parse_mysql(plan, [{"id": 1, "select_type": "SIMPLE", "table": "users", "type": "ALL",
+                             "key": None, "Extra": "Using where; Using temporary; Using filesort"}])
+        self.assertEqual((plan.full_scans, plan.temp_sorts), (["users"], ["Using temporary", "Using filesort"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+# pytest
+import sys, os
+import gzip
+import json
+import tempfile
+import threading
+import unittest
+
+# setup path dynamically
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, TimingMode
+from sqlalchemy_capture_sql.export import (iter_chrome_trace_events, iter_otlp_spans, CHROME_SQL_TID_OFFSET,
+                                           OTLP_SPAN_KIND_CLIENT, OTLP_STATUS_CODE_ERROR)
+from sqlalchemy import create_engine, text
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+        self.conn.execute(text("create table users (id int, name text)"))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def capture(self, **kwargs):
+        capture_stmts = CaptureSqlStatements(self.engine, **kwargs)
+        self.conn.execute(text("insert into users values (:id, 'x')"), {"id": 1})
+        with capture_stmts.span("load"):
+            for nr in range(3):
+                self.conn.execute(text("select * from users where id = :id"), {"id": nr}).fetchall()
+        try:
+            self.conn.execute(text("select * from missing"))
+        except Exception:
+            pass
+        capture_stmts.finish()
+        return capture_stmts
+
+    def test_chrome_trace(self):
+        capture_stmts = self.capture(timing=TimingMode.SERVER)
+        events = list(iter_chrome_trace_events(capture_stmts))
+        sql_events = [event for event in events if event.get("cat") == "sql"]
+        self.assertEqual(len(sql_events), 5)
+        self.assertEqual([event["ts"] for event in sql_events], sorted(event["ts"] for event in sql_events))
+        # one thread - statements don't overlap
+        self.assertEqual({event["tid"] for event in sql_events}, {CHROME_SQL_TID_OFFSET + 1})
+        stmt = capture_stmts.statements[1]
+        self.assertEqual(sql_events[1]["name"], "SELECT USERS")
+        self.assertEqual(sql_events[1]["args"]["fingerprint"], stmt.fingerprint)
+        self.assertEqual(sql_events[1]["args"]["tables"], "USERS")
+        self.assertEqual(sql_events[1]["args"]["parameters"], "(0,)")
+        self.assertEqual(sql_events[1]["args"]["span"], "load")
+        self.assertAlmostEqual(sql_events[1]["dur"], stmt.server_duration * 1_000_000, places=0)
+        self.assertIn("error", sql_events[-1]["args"])
+
+        span_events = [event for event in events if event.get("cat") == "span"]
+        self.assertEqual([event["name"] for event in span_events], ["load"])
+        self.assertLessEqual(span_events[0]["ts"], sql_events[1]["ts"])
+
+        path = os.path.join(self.tmp_dir.name, "trace.json.gz")
+        self.assertEqual(capture_stmts.save_chrome_trace(path), len(events))
+        with gzip.open(path, "rt") as fin:
+            self.assertEqual(len(json.load(fin)["traceEvents"]), len(events))
+
+    def test_lanes(self):
+        capture_stmts = CaptureSqlStatements(self.engine)
+        barrier = threading.Barrier(2)
+
+        def worker():
+            with self.engine.connect() as conn:
+                barrier.wait()
+                conn.execute(text("select 1")).fetchall()
+                barrier.wait()
+                conn.execute(text("select 2")).fetchall()
+
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        capture_stmts.finish()
+
+        sql_events = [event for event in iter_chrome_trace_events(capture_stmts) if event.get("cat") == "sql"]
+        self.assertEqual(len(sql_events), 4)
+        # overlapping statements go to separate lanes, lanes don't overlap
+        lanes = {}
+        for event in sql_events:
+            lanes.setdefault(event["tid"], []).append((event["ts"], event["ts"] + event["dur"]))
+        self.assertGreater(len(lanes), 1)
+        for intervals in lanes.values():
+            for (_, ended), (started, _) in zip(intervals, intervals[1:]):
+                self.assertLessEqual(ended, started + 0.001)
+
+    def test_otlp(self):
+        capture_stmts = self.capture(timing=TimingMode.SERVER)
+        spans = list(iter_otlp_spans(capture_stmts, trace_id="ab" * 16))
+        self.assertEqual(len(spans), 1 + 1 + 5)
+        root, load_span = spans[0], spans[2]
+        self.assertTrue(all(span["traceId"] == "ab" * 16 for span in spans))
+        self.assertEqual(len({span["spanId"] for span in spans}), len(spans))
+        self.assertEqual(load_span["name"], "load")
+        self.assertEqual(load_span["parentSpanId"], root["spanId"])
+
+        statement_spans = [span for span in spans if span["kind"] == OTLP_SPAN_KIND_CLIENT]
+        self.assertEqual([span["parentSpanId"] for span in statement_spans],
+                         [root["spanId"]] + [load_span["spanId"]] * 3 + [root["spanId"]])
+        attributes = {item["key"]: item["value"] for item in statement_spans[1]["attributes"]}
+        self.assertEqual(attributes["db.system"], {"stringValue": "sqlite"})
+        self.assertEqual(attributes["db.sql.table"], {"stringValue": "USERS"})
+        self.assertEqual(attributes["db.capture.fingerprint"],
+                         {"stringValue": capture_stmts.statements[1].fingerprint})
+        self.assertEqual(attributes["db.capture.idx"], {"intValue": "2"})
+        self.assertIn("db.capture.parameters", attributes)
+        self.assertEqual(statement_spans[-1]["status"]["code"], OTLP_STATUS_CODE_ERROR)
+        self.assertLess(int(statement_spans[0]["startTimeUnixNano"]), int(statement_spans[0]["endTimeUnixNano"]))
+        self.assertLessEqual(int(root["startTimeUnixNano"]), int(statement_spans[0]["startTimeUnixNano"]))
+
+        path = os.path.join(self.tmp_dir.name, "trace.json")
+        self.assertEqual(capture_stmts.save_otlp(path, service_name="tests"), len(spans))
+        with open(path) as fin:
+            data = json.load(fin)
+        self.assertEqual(len(data["resourceSpans"][0]["scopeSpans"][0]["spans"]), len(spans))
+
+    def test_not_finished(self):
+        capture_stmts = CaptureSqlStatements(self.engine)
+        with self.assertRaises(Exception):
+            list(iter_chrome_trace_events(capture_stmts))
+        capture_stmts.finish()
+
+
+if __name__ == "__main__":
+    unittest.main()
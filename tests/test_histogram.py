@@ -0,0 +1,71 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, TimingMode
+from sqlalchemy_capture_sql.histogram import Histogram, get_bucket, get_bucket_bounds
+from sqlalchemy import create_engine, text
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantiles(self):
+        hist = Histogram()
+        # 2000 x 1ms + one 2s outlier
+        for _ in range(2000):
+            hist.add(0.001)
+        hist.add(2.0)
+        self.assertEqual(hist.cnt, 2001)
+        self.assertEqual(hist.max, 2.0)
+        self.assertAlmostEqual(hist.mean, (2.0 + 2.0) / 2001)
+        # bucket upper bound - ~9% relative error
+        self.assertTrue(0.001 <= hist.quantile(0.5) <= 0.001 * 1.1)
+        self.assertTrue(0.001 <= hist.quantile(0.99) <= 0.001 * 1.1)
+        self.assertEqual(hist.quantile(1.0), 2.0)
+        self.assertEqual(len(hist.counts), 2)
+        self.assertIn("#", hist.render())
+
+    def test_buckets_and_merge(self):
+        for value in (0.000_01, 0.123, 5.0):
+            low, high = get_bucket_bounds(get_bucket(value))
+            self.assertTrue(low <= value < high, value)
+        # under / overflow
+        self.assertEqual(get_bucket(0.0), 0)
+        self.assertEqual(get_bucket(10_000_000.0), get_bucket(20_000_000.0))
+
+        hist1, hist2 = Histogram(), Histogram()
+        for nr in range(1, 101):
+            (hist1 if nr % 2 else hist2).add(nr / 1000)
+        merged = hist1.copy()
+        merged.merge(hist2)
+        self.assertEqual(merged.cnt, 100)
+        self.assertEqual(merged.max, 0.1)
+        self.assertTrue(0.09 <= merged.quantile(0.9) <= 0.099)
+        self.assertEqual(hist1.cnt, 50)
+
+    def test_capture_percentiles(self):
+        engine = create_engine('sqlite:///:memory:')
+        with engine.connect() as conn:
+            for timing in TimingMode:
+                with CaptureSqlStatements(engine, timing=timing) as capture_stmts:
+                    for nr in range(50):
+                        conn.execute(text("select :nr"), {"nr": nr}).fetchall()
+                    conn.execute(text("select 1 union all select 2")).fetchall()
+
+                stat = capture_stmts.get_stats("by_type")[0]
+                self.assertEqual(stat.histogram.cnt, 51)
+                self.assertTrue(stat.p50 <= stat.p90 <= stat.p99 <= stat.max_latency <= stat.max_duration)
+                latency_measure = "server_duration" if timing == TimingMode.SERVER else "duration"
+                self.assertEqual(stat.max_latency, max(getattr(st, latency_measure) for st in capture_stmts))
+                self.assertIsNotNone(stat.mean)
+                self.assertIn("#", capture_stmts.report_histograms("by_type"))
+                capture_stmts.report_latency("by_table")
+                capture_stmts.pp(print_cmd=lambda *args: None, histograms=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements
+from sqlalchemy import create_engine, text, Column, Integer, String, ForeignKey
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+
+
+Base = declarative_base()
+
+
+class Author(Base):
+    __tablename__ = 'authors'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    books = relationship("Book", lazy="select")
+
+
+class Book(Base):
+    __tablename__ = 'books'
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String)
+    author_id = Column(Integer, ForeignKey("authors.id"))
+
+
+class TestNPlusOne(unittest.TestCase):
+
+    NR_AUTHORS = 8
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        for nr in range(self.NR_AUTHORS):
+            self.session.add(Author(name=f"author-{nr}", books=[Book(title=f"book-{nr}")]))
+        self.session.commit()
+        self.session.expire_all()
+
+    def tearDown(self):
+        self.session.close()
+
+    def load_titles(self):
+        titles = []
+        for author in self.session.query(Author).all():
+            titles.extend(book.title for book in author.books)
+        return titles
+
+    def test_lazy_load_detected(self):
+        with CaptureSqlStatements(self.engine, capture_call_sites=True) as capture_stmts:
+            self.assertEqual(len(self.load_titles()), self.NR_AUTHORS)
+
+        report = capture_stmts.get_n_plus_one(threshold=5)
+        self.assertEqual(len(report.findings), 1)
+        finding = report.findings[0]
+        self.assertEqual(finding.cnt, self.NR_AUTHORS)
+        self.assertIn("FROM BOOKS", finding.fingerprint)
+        self.assertEqual(finding.call_site.filename, __file__)
+        self.assertEqual(finding.call_site.function, "load_titles")
+        # the authors query has its own call-site
+        authors_call_site = capture_stmts.statements[0].call_site
+        self.assertEqual(authors_call_site.function, "load_titles")
+        self.assertEqual(finding.call_site.lineno, authors_call_site.lineno + 1)
+
+        self.assertFalse(capture_stmts.get_n_plus_one(threshold=self.NR_AUTHORS))
+        self.assertIn("FROM books", capture_stmts.report_n_plus_one())
+        capture_stmts.pp(print_cmd=lambda *args: None, n_plus_one=True)
+
+    def test_without_call_sites(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            self.load_titles()
+            with self.engine.connect() as conn:
+                for nr in range(10):
+                    conn.execute(text(f"select * from books where id = {nr}")).fetchall()
+
+        report = capture_stmts.get_n_plus_one(threshold=5)
+        self.assertEqual(sorted(finding.cnt for finding in report), [self.NR_AUTHORS, 10])
+        self.assertIsNone(report.findings[0].call_site)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements
+from sqlalchemy_capture_sql.orm import FlushReason, TransactionOutcome, NO_FLUSH
+from sqlalchemy import create_engine, text, Column, Integer, String
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'items'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class TestSessionAttribution(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+    def test_transactions_and_flushes(self):
+        with CaptureSqlStatements(self.engine, capture_session=self.Session) as capture_stmts:
+            session = self.Session()
+            session.add(Item(name="autoflushed"))
+            session.query(Item).all()
+            session.add(Item(name="flushed"))
+            session.flush()
+            session.add(Item(name="committed"))
+            session.commit()
+
+            session.add(Item(name="rolled back"))
+            session.flush()
+            session.rollback()
+
+            session.query(Item).count()
+            session.close()
+
+            # not a session statement
+            with self.engine.connect() as conn:
+                conn.execute(text("select 1"))
+
+        self.assertEqual([(stmt.transaction, stmt.flush) for stmt in capture_stmts],
+                         [(1, 1), (1, None), (1, 2), (1, 3), (2, 4), (3, None), (None, None)])
+
+        transactions = capture_stmts.get_transactions()
+        self.assertEqual([(info.idx, info.outcome, info.cnt, info.nr_flushes) for info in transactions],
+                         [(1, TransactionOutcome.COMMIT, 4, 3),
+                          (2, TransactionOutcome.ROLLBACK, 1, 1),
+                          (3, TransactionOutcome.CLOSED, 1, 0)])
+        self.assertIsNotNone(transactions[0].commit_duration)
+        self.assertIsNone(transactions[1].commit_duration)
+        self.assertTrue(all(info.ended_ns is not None for info in transactions))
+        self.assertGreater(transactions[0].statements_duration, 0.0)
+        self.assertEqual(capture_stmts.get_transactions(top=1, order_by="cnt")[0].idx, 1)
+
+        flushes = capture_stmts.get_flushes()
+        self.assertEqual([(flush.reason, flush.transaction, flush.cnt, flush.nr_objects) for flush in flushes],
+                         [(FlushReason.AUTOFLUSH, 1, 1, 1), (FlushReason.EXPLICIT, 1, 1, 1),
+                          (FlushReason.COMMIT, 1, 1, 1), (FlushReason.EXPLICIT, 2, 1, 1)])
+
+        session_stats = capture_stmts.get_session_stats()
+        self.assertEqual((session_stats.transactions, session_stats.committed, session_stats.rolled_back,
+                          session_stats.flushes), (3, 1, 1, 4))
+        self.assertEqual(session_stats.commit_duration.cnt, 1)
+        self.assertEqual(session_stats.transaction_duration.cnt, 3)
+        self.assertEqual({stat.key: stat.cnt for stat in session_stats.statements_by_flush},
+                         {"autoflush": 1, "explicit": 2, "commit": 1, NO_FLUSH: 2})
+
+        output = []
+        capture_stmts.pp(print_cmd=output.append)
+        report = "\n".join(output)
+        self.assertIn("== ORM sessions", report)
+        self.assertIn("longest transactions", report)
+
+        with self.assertRaises(Exception):
+            capture_stmts.get_transactions(order_by="unknown")
+
+    def test_savepoint(self):
+        with CaptureSqlStatements(self.engine, capture_session=True) as capture_stmts:
+            with self.Session() as session:
+                session.add(Item(name="outer"))
+                with session.begin_nested():
+                    session.add(Item(name="inner"))
+                session.add(Item(name="after savepoint"))
+                session.commit()
+
+        transactions = capture_stmts.get_transactions()
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(transactions[0].outcome, TransactionOutcome.COMMIT)
+        self.assertEqual(capture_stmts.count(), transactions[0].cnt)
+
+    def test_other_engine_ignored(self):
+        other_engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(other_engine)
+        with CaptureSqlStatements(self.engine, capture_session=True) as capture_stmts:
+            with sessionmaker(bind=other_engine)() as session:
+                session.add(Item(name="other"))
+                session.commit()
+        self.assertEqual(capture_stmts.get_transactions(), [])
+        self.assertEqual(capture_stmts.get_flushes(), [])
+
+    def test_not_enabled(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            with self.Session() as session:
+                session.add(Item(name="not tracked"))
+                session.commit()
+        self.assertTrue(all(stmt.transaction is None for stmt in capture_stmts))
+        with self.assertRaises(Exception):
+            capture_stmts.get_session_stats()
+
+
+if __name__ == "__main__":
+    unittest.main()
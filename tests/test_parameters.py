@@ -0,0 +1,94 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, ParamsPolicy
+from sqlalchemy_capture_sql.parameters import get_params_repr
+from sqlalchemy import create_engine, text
+
+
+class TestParamsPolicy(unittest.TestCase):
+
+    NR_ROWS = 1000
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+        self.conn.execute(text("create table items (id integer primary key, name varchar)"))
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def capture(self, **kwargs):
+        rows = [{"id": nr, "name": f"item-{nr}"} for nr in range(self.NR_ROWS)]
+        with self.conn.begin() as trans:
+            with CaptureSqlStatements(self.engine, **kwargs) as capture_stmts:
+                self.conn.execute(text("insert into items (id, name) values (:id, :name)"), rows)
+                self.conn.execute(text("select * from items where id = :id"), {"id": 1}).fetchall()
+            trans.rollback()
+        return capture_stmts
+
+    def test_policies(self):
+        capture_stmts = self.capture()
+        bulk, single = capture_stmts.statements
+        self.assertTrue(bulk.executemany)
+        self.assertEqual(bulk.params_rows, self.NR_ROWS)
+        self.assertIsNone(single.params_rows)
+        # reference - original behaviour, sqlite dialect passes positional rows
+        self.assertEqual(len(bulk.parameters), self.NR_ROWS)
+        self.assertEqual(bulk.parameters[0], (0, "item-0"))
+
+        bulk, single = self.capture(params_policy="drop").statements
+        self.assertIsNone(bulk.parameters)
+        self.assertIsNone(single.parameters)
+        self.assertEqual(bulk.params_rows, self.NR_ROWS)
+
+        bulk, single = self.capture(params_policy=ParamsPolicy.FIRST_N, params_max_rows=3).statements
+        self.assertEqual(bulk.parameters, [(0, "item-0"), (1, "item-1"), (2, "item-2")])
+        self.assertEqual(single.parameters, (1,))
+        self.assertEqual(bulk.params_rows, self.NR_ROWS)
+
+        bulk, single = self.capture(params_policy=ParamsPolicy.REPR, params_max_repr=50).statements
+        self.assertIsInstance(bulk.parameters, str)
+        self.assertLessEqual(len(bulk.parameters), 50)
+        self.assertEqual(single.parameters, "(1,)")
+
+        capture1 = self.capture(params_policy=ParamsPolicy.HASH)
+        capture2 = self.capture(params_policy=ParamsPolicy.HASH)
+        self.assertEqual([st.parameters for st in capture1], [st.parameters for st in capture2])
+        self.assertEqual(len(capture1.statements[0].parameters), 16)
+
+        bulk, single = self.capture(params_policy=ParamsPolicy.COPY).statements
+        self.assertEqual(len(bulk.parameters), self.NR_ROWS)
+        self.assertEqual(bulk.parameters[0], (0, "item-0"))
+        self.assertEqual(single.parameters, (1,))
+
+    def test_params_repr(self):
+        self.assertIsNone(get_params_repr(None))
+        self.assertEqual(get_params_repr("x" * 300, max_repr=10), "x" * 10)
+        self.assertEqual(get_params_repr((1, "a")), "(1, 'a')")
+        # only the beginning of a large batch is formatted
+        params_repr = get_params_repr([(nr, "item") for nr in range(self.NR_ROWS)], max_repr=50)
+        self.assertLessEqual(len(params_repr), 50)
+        self.assertTrue(params_repr.startswith("[(0, 'item'), (1, 'item')"))
+
+        capture_stmts = self.capture()
+        stored = list(capture_stmts.get_store().query(sql_type="INSERT"))[0]
+        self.assertEqual(stored.parameters, get_params_repr(capture_stmts.statements[0].parameters))
+
+    def test_report_short(self):
+        for policy in ParamsPolicy:
+            capture_stmts = self.capture(params_policy=policy)
+            bulk_report = capture_stmts.statements[0].report_short()
+            self.assertIn(f"({self.NR_ROWS} rows)", bulk_report)
+            self.assertLess(len(bulk_report), 250)
+            capture_stmts.pp(print_cmd=lambda *args: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
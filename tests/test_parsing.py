@@ -0,0 +1,117 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements
+from sqlalchemy_capture_sql.parsing import parse_statement, fingerprint_statement, parse_cache_info
+from sqlalchemy_capture_sql.tables import extract_tables
+from sqlalchemy_capture_sql.stats import NO_TABLE
+from sqlalchemy import create_engine, text
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(
+                fingerprint_statement("select * from users\n where id = 10 and name='it''s'"),
+                "SELECT * FROM USERS WHERE ID = ? AND NAME=?")
+        self.assertEqual(
+                fingerprint_statement("SELECT a1 FROM t WHERE id IN (?, ?, ?)"),
+                fingerprint_statement("SELECT a1 FROM t WHERE id IN (:p1, :p2)"))
+        self.assertEqual(
+                fingerprint_statement("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)"),
+                "INSERT INTO T (A, B) VALUES (?+)+")
+
+    def test_parse_statement(self):
+        info = parse_statement("SELECT users.id FROM users JOIN addresses ON users.id = addresses.user_id")
+        self.assertEqual(info.sql_type, "SELECT")
+        self.assertEqual(info.first_table, "USERS")
+        self.assertEqual(info.tables, ("USERS", "ADDRESSES"))
+        self.assertEqual(info.stmt_repr, "SELECT FROM users JOIN addresses ON users.id = addresses.user_id")
+
+    def test_extract_tables(self):
+        info = extract_tables("SELECT count(*) AS count_1 FROM (SELECT users.id AS users_id FROM users) AS anon_1")
+        self.assertEqual((info.tables, info.target_table, info.ctes), (("USERS",), None, ()))
+
+        info = extract_tables(
+                "WITH RECURSIVE tree(id, parent) AS (SELECT id, parent FROM nodes WHERE id = 1 "
+                "UNION ALL SELECT n.id, n.parent FROM nodes n JOIN tree t ON n.parent = t.id), "
+                "recent AS (SELECT 1) "
+                "SELECT * FROM tree, recent, \"Orders\" o LEFT OUTER JOIN public.items AS i USING (id) "
+                "WHERE EXTRACT(YEAR FROM o.created) = 2020 AND o.a IS DISTINCT FROM o.b")
+        self.assertEqual(info.tables, ("NODES", "ORDERS", "PUBLIC.ITEMS"))
+        self.assertEqual(info.ctes, ("TREE", "RECENT"))
+        self.assertIsNone(info.target_table)
+
+        # DML target
+        for sql, tables, target_table in (
+                ("INSERT INTO users (name) VALUES (?), (?) ON CONFLICT (id) DO UPDATE SET name = excluded.name",
+                 ("USERS",), "USERS"),
+                ("INSERT INTO archive SELECT * FROM orders WHERE id IN (SELECT order_id FROM bad)",
+                 ("ARCHIVE", "ORDERS", "BAD"), "ARCHIVE"),
+                ("UPDATE accounts SET balance = t.x FROM totals t WHERE accounts.id = t.id",
+                 ("ACCOUNTS", "TOTALS"), "ACCOUNTS"),
+                ("WITH s AS (SELECT id FROM stale) DELETE FROM books USING s WHERE books.id = s.id",
+                 ("STALE", "BOOKS"), "BOOKS"),
+                ("MERGE INTO target t USING source s ON t.id = s.id WHEN MATCHED THEN UPDATE SET v = s.v",
+                 ("TARGET", "SOURCE"), "TARGET"),
+                ):
+            info = extract_tables(sql)
+            self.assertEqual((info.tables, info.target_table), (tables, target_table), sql)
+
+        # table valued functions, FROM in functions, FOR UPDATE, literals
+        info = extract_tables("SELECT * FROM generate_series(1, 10) g, users "
+                              "WHERE substring(name FROM 1 FOR 2) = 'x from y' FOR UPDATE")
+        self.assertEqual(info.tables, ("USERS",))
+        self.assertEqual(extract_tables("select 'In-capture'").tables, ())
+
+        info = parse_statement("SELECT a FROM t1 WHERE NOT EXISTS (SELECT 1 FROM t2 WHERE t2.id = t1.id)")
+        self.assertEqual((info.first_table, info.tables), ("T1", ("T1", "T2")))
+
+    def test_touched_table_stats(self):
+        engine = create_engine('sqlite:///:memory:')
+        with engine.begin() as conn:
+            conn.execute(text("create table users (id int, name varchar)"))
+            conn.execute(text("create table addresses (id int, user_id int)"))
+        with engine.connect() as conn:
+            with CaptureSqlStatements(engine) as capture_stmts:
+                conn.execute(text("select count(*) from (select id from users) as anon_1")).fetchall()
+                conn.execute(text("select users.id from users join addresses "
+                                  "on users.id = addresses.user_id")).fetchall()
+                conn.execute(text("with u as (select id from users) "
+                                  "select * from addresses where user_id in (select id from u)")).fetchall()
+                conn.execute(text("select 1")).fetchall()
+        self.assertEqual(capture_stmts.get_counts("by_table"),
+                         {"(SELECT": 1, "USERS": 1, "<unknown>": 1, "1": 1})
+        self.assertEqual(capture_stmts.get_counts("by_touched_table"),
+                         {"USERS": 3, "ADDRESSES": 2, NO_TABLE: 1})
+        self.assertEqual(capture_stmts.get_counts("by_type_and_touched_table")["WITH USERS"], 1)
+        self.assertEqual(capture_stmts.statements[2].tables, ("USERS", "ADDRESSES"))
+        self.assertEqual(capture_stmts.to_snapshot().get_stats("by_touched_table")[0].key, "USERS")
+        output = []
+        capture_stmts.pp(print_cmd=output.append)
+        self.assertTrue(any(line.startswith("== By touched table") for line in output))
+
+    def test_cache_used_lazily(self):
+        engine = create_engine('sqlite:///:memory:')
+        conn = engine.connect()
+        sql = "select 'cache-test', 1"
+        misses_before = parse_cache_info().misses
+        with CaptureSqlStatements(engine) as capture_stmts:
+            for _ in range(10):
+                conn.execute(text(sql)).fetchall()
+            # nothing parsed during capture
+            self.assertEqual(parse_cache_info().misses, misses_before)
+        self.assertEqual(capture_stmts.get_counts("by_type"), {"SELECT": 10})
+        info = CaptureSqlStatements.parse_cache_info()
+        self.assertEqual(info.misses, misses_before + 1)
+        self.assertGreaterEqual(info.hits, 9)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# pytest
+import sys, os
+import tempfile
+import threading
+import time
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements
+from sqlalchemy_capture_sql.dispatcher import DO_GET, get_dispatcher
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+
+class TestPool(unittest.TestCase):
+
+    NR_THREADS = 4
+    NR_CHECKOUTS = 3
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'pool.db')}",
+                                    poolclass=QueuePool, pool_size=2, max_overflow=0)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def work(self):
+        for _ in range(self.NR_CHECKOUTS):
+            with self.engine.connect() as conn:
+                conn.execute(text("select 1")).fetchall()
+                conn.execute(text("select 2")).fetchall()
+                # keep it checked out - other threads wait
+                time.sleep(0.01)
+
+    def test_pool(self):
+        pool = self.engine.pool
+        with CaptureSqlStatements(self.engine, capture_pool=True) as capture_stmts:
+            self.assertIn("_do_get", pool.__dict__)
+            threads = [threading.Thread(target=self.work) for _ in range(self.NR_THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.engine.dispose()
+
+        pool_stats = capture_stmts.get_pool_stats()
+        nr_checkouts = self.NR_THREADS * self.NR_CHECKOUTS
+        self.assertEqual(pool_stats.checkouts, nr_checkouts)
+        self.assertEqual(pool_stats.checkins, nr_checkouts)
+        self.assertEqual(pool_stats.connections_opened, 2)
+        self.assertEqual(pool_stats.connections_closed, 2)
+        self.assertEqual(pool_stats.max_checked_out, 2)
+        self.assertEqual(pool_stats.statements_per_checkout, {2: nr_checkouts})
+        self.assertEqual(pool_stats.mean_statements_per_checkout, 2.0)
+        self.assertEqual(pool_stats.checkout_wait.cnt, nr_checkouts)
+        # 4 threads, 2 connections - some had to wait
+        self.assertGreater(pool_stats.checkout_wait.max_duration, 0.005)
+        self.assertEqual(pool_stats.connect_time.cnt, 2)
+        self.assertEqual(pool_stats.checkout_duration.cnt, nr_checkouts)
+        self.assertGreater(pool_stats.checkout_duration.min_duration, 0.005)
+        self.assertEqual(pool_stats.connection_lifetime.cnt, 2)
+        self.assertIsNotNone(pool_stats.checkout_wait.p99)
+
+        output = []
+        capture_stmts.pp(print_cmd=output.append)
+        self.assertIn(f"    checkouts {nr_checkouts} (max 2 at once)",
+                      "\n".join(output))
+
+        # shared listeners and pool wrapper stay, the capture is unsubscribed
+        dispatcher = get_dispatcher(self.engine)
+        self.assertEqual(dispatcher.get_nr_subscribers(DO_GET), 0)
+        self.assertEqual(dispatcher.get_nr_subscribers("checkout"), 0)
+        self.work()
+        self.assertEqual(capture_stmts.get_pool_stats().checkouts, nr_checkouts)
+
+    def test_nested(self):
+        with CaptureSqlStatements(self.engine, capture_pool=True) as outer:
+            with CaptureSqlStatements(self.engine, capture_pool=True) as inner:
+                self.work()
+            self.work()
+        for capture_stmts, nr_checkouts in ((outer, 2 * self.NR_CHECKOUTS), (inner, self.NR_CHECKOUTS)):
+            pool_stats = capture_stmts.get_pool_stats()
+            self.assertEqual(pool_stats.checkouts, nr_checkouts)
+            self.assertEqual(pool_stats.checkout_wait.cnt, nr_checkouts)
+
+    def test_not_enabled(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            self.work()
+        with self.assertRaises(Exception):
+            capture_stmts.get_pool_stats()
+
+
+if __name__ == '__main__':
+    unittest.main()
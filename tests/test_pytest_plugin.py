@@ -0,0 +1,142 @@
+# pytest
+import sys, os
+import subprocess
+import tempfile
+import textwrap
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, QueryBudget
+from sqlalchemy_capture_sql.budgets import make_baseline, compare_baseline
+from sqlalchemy import create_engine, text
+
+
+PLUGIN_TESTS = '''
+import os
+import pytest
+from sqlalchemy import create_engine, text
+
+ENGINE = create_engine("sqlite://")
+
+@pytest.fixture
+def sql_capture_engine():
+    return ENGINE
+
+@pytest.fixture
+def conn():
+    with ENGINE.connect() as conn:
+        # set up before capture_sql - not captured
+        conn.execute(text("select 1"))
+        yield conn
+
+def run(conn, n):
+    for nr in range(n):
+        conn.execute(text("select :nr"), {"nr": nr})
+
+@pytest.mark.sql_budget(max_statements=3, by_type={"select": 3})
+def test_within_budget(conn):
+    run(conn, 3)
+
+@pytest.mark.sql_budget(by_type={"select": 2})
+def test_over_budget(conn):
+    run(conn, 4)
+
+def test_fixture(conn, capture_sql):
+    run(conn, 2)
+    assert capture_sql.count() == 2
+
+@pytest.mark.sql_baseline(tolerance=0.5)
+def test_baseline(conn):
+    run(conn, int(os.environ.get("NR_STATEMENTS", "2")))
+'''
+
+
+class TestBudgets(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def capture(self, nr_statements):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            for nr in range(nr_statements):
+                self.conn.execute(text("select :nr"), {"nr": nr}).fetchall()
+            self.conn.execute(text("select 1 where 1 = :nr"), {"nr": 1}).fetchall()
+        return capture_stmts
+
+    def test_budget(self):
+        capture_stmts = self.capture(3)
+        self.assertEqual(QueryBudget(max_statements=4, max_counts={"by_type": {"select": 4}}).check(capture_stmts), [])
+        self.assertEqual(QueryBudget(max_statements=3).check(capture_stmts),
+                         ["4 statement(s) captured, budget is 3"])
+        self.assertEqual(QueryBudget(max_counts={"by_type": {"SELECT": 2, "INSERT": 0}}).check(capture_stmts),
+                         ["by_type SELECT: 4 statement(s), budget is 2"])
+        self.assertEqual(len(QueryBudget(max_duration=0.0).check(capture_stmts)), 1)
+        with self.assertRaises(ValueError):
+            QueryBudget(max_counts={"by_nothing": {}})
+
+    def test_baseline(self):
+        baseline = make_baseline(self.capture(3))
+        self.assertEqual(baseline["count"], 4)
+        self.assertEqual(baseline["fingerprints"], {"SELECT ?": 3, "SELECT ? WHERE ? = ?": 1})
+        self.assertEqual(compare_baseline(baseline, make_baseline(self.capture(2))), [])
+        self.assertEqual(compare_baseline(baseline, make_baseline(self.capture(4))),
+                         ["5 statement(s) captured, baseline is 4",
+                          "statement count grown 3 -> 4: SELECT ?"])
+        self.assertEqual(compare_baseline(baseline, make_baseline(self.capture(4)), tolerance=0.5), [])
+
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            self.conn.execute(text("select 2 where 1 = :nr"), {"nr": 1}).fetchall()
+        self.assertEqual(compare_baseline(baseline, make_baseline(capture_stmts)), [])
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            self.conn.execute(text("select 2 where 1 > :nr"), {"nr": 1}).fetchall()
+        self.assertEqual(compare_baseline(baseline, make_baseline(capture_stmts)),
+                         ["new statement (1x): SELECT ? WHERE ? > ?"])
+
+
+class TestPytestPlugin(unittest.TestCase):
+
+    def run_pytest(self, tmpdir, *args, nr_statements=2):
+        env = dict(os.environ, PYTHONPATH=BASE_DIR, NR_STATEMENTS=str(nr_statements))
+        result = subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "sqlalchemy_capture_sql.pytest_plugin",
+                                 "-p", "no:cacheprovider", "test_plugin.py", *args],
+                                cwd=tmpdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+        return result.stdout
+
+    def test_plugin(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "test_plugin.py"), "w") as fout:
+                fout.write(textwrap.dedent(PLUGIN_TESTS))
+
+            output = self.run_pytest(tmpdir)
+            self.assertIn("1 failed, 3 passed", output)
+            self.assertIn("FAILED test_plugin.py::test_over_budget", output)
+            self.assertIn("by_type SELECT: 4 statement(s), budget is 2", output)
+            # slowest and grouped stats
+            self.assertIn("== Slowest:", output)
+            self.assertIn("== By sql command:", output)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, ".sql_baselines", "test_plugin", "test_baseline.json")))
+
+            # within tolerance
+            output = self.run_pytest(tmpdir, "-k", "baseline", nr_statements=3)
+            self.assertIn("1 passed", output)
+
+            output = self.run_pytest(tmpdir, "-k", "baseline", nr_statements=4)
+            self.assertIn("1 failed", output)
+            self.assertIn("statement count grown 2 -> 4: SELECT ?", output)
+
+            output = self.run_pytest(tmpdir, "-k", "baseline", "--sql-baseline-record", nr_statements=4)
+            self.assertIn("1 passed", output)
+            output = self.run_pytest(tmpdir, "-k", "baseline", nr_statements=4)
+            self.assertIn("1 passed", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
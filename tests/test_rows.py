@@ -0,0 +1,106 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, RowsMode
+from sqlalchemy_capture_sql.rows import get_row_size
+from sqlalchemy import create_engine, text, select, Column, Integer, String
+from sqlalchemy.orm import declarative_base, Session
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'items'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class TestRows(unittest.TestCase):
+
+    NR_ITEMS = 30
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        self.session.add_all([Item(id=nr, name=f"item-{nr:03d}") for nr in range(self.NR_ITEMS)])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def run_statements(self):
+        self.session.query(Item).all()
+        self.session.query(Item).filter(Item.id == 3).first()
+        result = self.session.execute(select(Item.id).where(Item.id < 10))
+        result.fetchone()
+        result.fetchmany(2)
+        result.fetchall()
+        self.session.execute(text("update items set name = 'x' where id < 5"))
+        self.session.rollback()
+
+    def test_rowcount(self):
+        with CaptureSqlStatements(self.engine, capture_rows=RowsMode.ROWCOUNT) as capture_stmts:
+            self.run_statements()
+        update = [stmt for stmt in capture_stmts if stmt.sql_type == "UPDATE"][0]
+        self.assertEqual(update.rowcount, 5)
+        self.assertIsNone(update.rows_fetched)
+        largest = capture_stmts.get_largest()
+        self.assertEqual([stat.rowcount for stat in largest], [5])
+        with self.assertRaises(Exception):
+            capture_stmts.get_largest(order_by="rows_fetched")
+
+    def test_fetched(self):
+        with CaptureSqlStatements(self.engine, capture_rows="fetched_bytes") as capture_stmts:
+            self.run_statements()
+        select_all, select_first, select_ids, update = [stmt for stmt in capture_stmts if stmt.sql_type != "BEGIN"]
+        self.assertEqual(select_all.rows_fetched, self.NR_ITEMS)
+        self.assertEqual(select_all.bytes_fetched, self.NR_ITEMS * (8 + len("item-000")))
+        self.assertEqual(select_first.rows_fetched, 1)
+        self.assertEqual(select_ids.rows_fetched, 10)
+        self.assertEqual(select_ids.bytes_fetched, 10 * 8)
+        self.assertEqual(update.rowcount, 5)
+        self.assertEqual(update.rows_fetched, 0)
+
+        largest = capture_stmts.get_largest(top=2)
+        self.assertEqual([stat.statement for stat in largest], [select_all, select_ids])
+        self.assertEqual(largest[0].key, "SELECT ITEMS")
+        largest = capture_stmts.get_largest(top=1, order_by="rowcount")
+        self.assertEqual(largest[0].statement, update)
+
+        by_table = capture_stmts.get_stats("by_table", order_by="rows_fetched")
+        self.assertEqual((by_table[0].key, by_table[0].rows_fetched, by_table[0].rowcount),
+                         ("ITEMS", self.NR_ITEMS + 1 + 10, 5))
+        by_fingerprint = capture_stmts.get_stats("by_fingerprint", order_by="bytes_fetched")
+        self.assertEqual(by_fingerprint[0].bytes_fetched, select_all.bytes_fetched)
+        # the same in snapshots
+        snapshot = capture_stmts.to_snapshot()
+        self.assertEqual(snapshot.get_stats("by_table")[0].rows_fetched, by_table[0].rows_fetched)
+
+        output = []
+        capture_stmts.pp(print_cmd=output.append)
+        output = "\n".join(output)
+        self.assertIn("== Largest result sets (top 5) - rowcount, rows_fetched, bytes_fetched:", output)
+        self.assertIn("== Rows by table (top 20)", output)
+
+    def test_not_captured(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            self.run_statements()
+        self.assertTrue(all(stmt.rows_fetched is None for stmt in capture_stmts))
+        with self.assertRaises(Exception):
+            capture_stmts.get_largest()
+        with self.assertRaises(Exception):
+            capture_stmts.get_stats("by_table", order_by="rows_fetched")
+
+    def test_row_size(self):
+        self.assertEqual(get_row_size((1, "abc", None, b"xy", 2.5)), 8 + 3 + 2 + 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# pytest
+import sys, os
+import unittest
+
+# setup path dynamically 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, SamplingPolicy, TimingMode
+from sqlalchemy import create_engine, text
+
+
+class TestSampling(unittest.TestCase):
+
+    NR_STATEMENTS = 40
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def run_statements(self, sampling, **kwargs):
+        with CaptureSqlStatements(self.engine, sampling=sampling, **kwargs) as capture_stmts:
+            for nr in range(self.NR_STATEMENTS):
+                self.conn.execute(text("select :nr"), {"nr": nr}).fetchall()
+        return capture_stmts
+
+    def test_every_nth(self):
+        capture_stmts = self.run_statements(SamplingPolicy(every_nth=4))
+        self.assertEqual(capture_stmts.count(), self.NR_STATEMENTS)
+        self.assertEqual(len(capture_stmts.statements), self.NR_STATEMENTS // 4)
+        self.assertEqual([st.idx for st in capture_stmts][:3], [4, 8, 12])
+        self.assertEqual(capture_stmts.get_statement_by_row_id(8).idx, 8)
+        self.assertFalse(capture_stmts.is_retained(9))
+
+        # counts are exact, durations scaled
+        stat = capture_stmts.get_stats("by_type")[0]
+        self.assertEqual(stat.cnt, self.NR_STATEMENTS)
+        self.assertEqual(stat.cnt_measured, self.NR_STATEMENTS // 4)
+        self.assertAlmostEqual(stat.duration, 4 * sum(st.duration for st in capture_stmts), places=6)
+
+        overhead, overhead_per_stmt = capture_stmts.get_overhead()
+        self.assertGreater(overhead, 0)
+        self.assertGreater(overhead_per_stmt, 0)
+        capture_stmts.pp(print_cmd=lambda *args: None)
+
+    def test_literal_statements_scaled(self):
+        with CaptureSqlStatements(self.engine, sampling=SamplingPolicy(every_nth=2)) as capture_stmts:
+            for nr in range(self.NR_STATEMENTS):
+                self.conn.execute(text(f"select {nr}")).fetchall()
+        measured = sum(st.duration for st in capture_stmts)
+        # every statement string is distinct, half of them never measured - scaled per group
+        for name in ("by_type", "by_fingerprint"):
+            stat = capture_stmts.get_stats(name)[0]
+            self.assertEqual((stat.cnt, stat.cnt_measured), (self.NR_STATEMENTS, self.NR_STATEMENTS // 2))
+            self.assertAlmostEqual(stat.duration, 2 * measured, places=6)
+        entry = capture_stmts.to_snapshot().entries["SELECT ?"]
+        self.assertAlmostEqual(entry.stat.duration, 2 * measured, places=6)
+
+    def test_probability_and_rate_limit(self):
+        capture_stmts = self.run_statements(SamplingPolicy(probability=0.0))
+        self.assertEqual(len(capture_stmts.statements), 0)
+        self.assertEqual(capture_stmts.get_counts("by_type"), {"SELECT": self.NR_STATEMENTS})
+        self.assertEqual(capture_stmts.get_stats("by_type")[0].duration, 0.0)
+        capture_stmts.pp(print_cmd=lambda *args: None)
+
+        capture_stmts = self.run_statements(SamplingPolicy(probability=1.0, per_fingerprint_limit=3,
+                                                           per_fingerprint_interval=3600))
+        self.assertEqual(len(capture_stmts.statements), 3)
+
+    def test_keep_slow(self):
+        for timing in TimingMode:
+            # everything is slow
+            capture_stmts = self.run_statements(SamplingPolicy(probability=0.0, keep_slower_than_ms=0),
+                                                timing=timing)
+            self.assertEqual(len(capture_stmts.statements), self.NR_STATEMENTS)
+            self.assertEqual(len(capture_stmts.get_slowest(top=self.NR_STATEMENTS)), self.NR_STATEMENTS)
+
+            # nothing is slow, but all are timed - no scaling
+            capture_stmts = self.run_statements(SamplingPolicy(probability=0.0, keep_slower_than_ms=60_000),
+                                                timing=timing)
+            self.assertEqual(len(capture_stmts.statements), 0)
+            self.assertEqual(capture_stmts.get_slowest(), [])
+            stat = capture_stmts.get_stats("by_type")[0]
+            self.assertEqual(stat.cnt_measured, self.NR_STATEMENTS)
+            self.assertGreater(stat.duration, 0)
+
+    def test_no_overhead_without_sampling(self):
+        capture_stmts = self.run_statements(None)
+        with self.assertRaises(Exception):
+            capture_stmts.get_overhead()
+
+
+if __name__ == '__main__':
+    unittest.main()
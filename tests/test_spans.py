@@ -0,0 +1,158 @@
+# pytest
+import sys, os
+import threading
+import unittest
+
+# setup path dynamically
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements, TimingMode
+from sqlalchemy_capture_sql.dispatcher import get_dispatcher, remove_dispatcher
+from sqlalchemy_capture_sql.spans import NO_SPAN
+from sqlalchemy import create_engine, event, text
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+
+    def tearDown(self):
+        remove_dispatcher(self.engine)
+
+    def test_registered_once(self):
+        listens = []
+        orig_listen = event.listen
+
+        def listen(target, identifier, fn, *args, **kwargs):
+            listens.append(identifier)
+            return orig_listen(target, identifier, fn, *args, **kwargs)
+
+        event.listen = listen
+        try:
+            for _ in range(5):
+                with CaptureSqlStatements(self.engine):
+                    with self.engine.connect() as conn:
+                        conn.execute(text("select 1"))
+        finally:
+            event.listen = orig_listen
+        self.assertEqual(listens, ["before_cursor_execute"])
+        dispatcher = get_dispatcher(self.engine)
+        self.assertEqual(dispatcher.get_nr_subscribers(), 0)
+        self.assertTrue(event.contains(self.engine, "before_cursor_execute", dispatcher.on_before_cursor_execute))
+
+        self.assertTrue(remove_dispatcher(self.engine))
+        self.assertFalse(event.contains(self.engine, "before_cursor_execute", dispatcher.on_before_cursor_execute))
+        self.assertFalse(remove_dispatcher(self.engine))
+
+    def test_nested(self):
+        with self.engine.connect() as conn:
+            with CaptureSqlStatements(self.engine, timing=TimingMode.SERVER) as outer:
+                conn.execute(text("select 1"))
+                with CaptureSqlStatements(self.engine) as inner:
+                    conn.execute(text("select 2"))
+                    self.assertEqual(get_dispatcher(self.engine).get_nr_subscribers(), 2)
+                    self.assertEqual(get_dispatcher(self.engine).get_nr_subscribers("after_cursor_execute"), 1)
+                conn.execute(text("select 3"))
+        self.assertEqual([stmt.statement for stmt in outer], ["select 1", "select 2", "select 3"])
+        self.assertEqual([stmt.statement for stmt in inner], ["select 2"])
+        self.assertTrue(all(stmt.server_duration is not None for stmt in outer))
+        self.assertEqual(get_dispatcher(self.engine).get_nr_subscribers("after_cursor_execute"), 0)
+
+
+class TestSpans(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def execute(self, sql, times=1):
+        for _ in range(times):
+            self.conn.execute(text(sql)).fetchall()
+
+    def test_spans(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            self.execute("select 1")
+            with capture_stmts.span("load users") as span:
+                self.execute("select 2", times=3)
+                with capture_stmts.span("authors"):
+                    self.execute("select 3", times=2)
+                self.execute("select 4")
+            self.execute("select 5")
+
+        self.assertEqual(span.name, "load users")
+        self.assertGreater(span.duration, 0.0)
+        self.assertEqual([span.name for span in capture_stmts.get_spans()], ["load users", "load users/authors"])
+        self.assertEqual(capture_stmts.get_spans()[1].parent, "load users")
+        self.assertEqual([stmt.span for stmt in capture_stmts],
+                         [None, "load users", "load users", "load users",
+                          "load users/authors", "load users/authors", "load users", None])
+        self.assertEqual(capture_stmts.get_counts("by_span"),
+                         {"load users": 4, "load users/authors": 2, NO_SPAN: 2})
+        self.assertAlmostEqual(sum(stat.duration for stat in capture_stmts.get_stats("by_span")),
+                               sum(stat.duration for stat in capture_stmts.get_stats("by_type")))
+        self.assertEqual([(stat.key, stat.cnt) for stat in capture_stmts.get_stats("by_type", span="load users")],
+                         [("SELECT", 4)])
+        self.assertEqual(capture_stmts.get_stats("by_type", span=NO_SPAN)[0].cnt, 2)
+        self.assertEqual(capture_stmts.get_stats("by_type", span="unknown"), [])
+        # snapshots are per fingerprint over all spans
+        self.assertEqual(capture_stmts.to_snapshot().count, 8)
+        with self.assertRaises(Exception):
+            capture_stmts.to_snapshot().get_stats("by_span")
+
+        output = []
+        capture_stmts.pp(print_cmd=output.append)
+        self.assertIn("== By span (top 20):", output)
+        self.assertIn("load users/authors", "\n".join(output))
+
+    def test_span_not_allowed_after_finish(self):
+        capture_stmts = CaptureSqlStatements(self.engine)
+        capture_stmts.finish()
+        with self.assertRaises(Exception):
+            with capture_stmts.span("late"):
+                pass
+        capture_stmts = CaptureSqlStatements(self.engine)
+        with self.assertRaises(Exception):
+            with capture_stmts.span("a/b"):
+                pass
+        capture_stmts.finish()
+
+    def test_threads(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            def worker(nr):
+                with capture_stmts.span(f"worker-{nr}"):
+                    with self.engine.connect() as conn:
+                        for _ in range(nr + 1):
+                            conn.execute(text("select 1")).fetchall()
+
+            with capture_stmts.span("main"):
+                threads = [threading.Thread(target=worker, args=(nr,)) for nr in range(3)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.execute("select 2")
+
+        # threads don't inherit span of the main thread
+        self.assertEqual(capture_stmts.get_counts("by_span"),
+                         {"worker-0": 1, "worker-1": 2, "worker-2": 3, "main": 1})
+
+    def test_n_plus_one_by_span(self):
+        with CaptureSqlStatements(self.engine) as capture_stmts:
+            for name in ("first", "second"):
+                with capture_stmts.span(name):
+                    for nr in range(4):
+                        self.execute(f"select {nr}")
+        report = capture_stmts.get_n_plus_one(threshold=3)
+        self.assertEqual({finding.span: finding.cnt for finding in report}, {"first": 4, "second": 4})
+        self.assertIn("[first]", report.report())
+        report = capture_stmts.get_n_plus_one(threshold=5, by_span=False)
+        self.assertEqual([(finding.span, finding.cnt) for finding in report], [(None, 8)])
+
+
+if __name__ == "__main__":
+    unittest.main()
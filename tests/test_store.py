@@ -0,0 +1,117 @@
+# pytest
+import sys, os
+import tempfile
+import unittest
+
+# setup path dynamically
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(BASE_DIR)
+
+from sqlalchemy_capture_sql import CaptureSqlStatements
+from sqlalchemy_capture_sql.store import CaptureStore
+from sqlalchemy import create_engine, text
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "capture.db")
+        self.engine = create_engine('sqlite:///:memory:')
+        self.conn = self.engine.connect()
+        self.conn.execute(text("create table users (id int, name text)"))
+        self.conn.execute(text("create table orders (id int, user_id int)"))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def capture(self, **kwargs):
+        capture_stmts = CaptureSqlStatements(self.engine, **kwargs)
+        for nr in range(5):
+            self.conn.execute(text("insert into users values (:id, 'x')"), {"id": nr})
+            self.conn.execute(text("select * from users where id = :id"), {"id": nr}).fetchall()
+        self.conn.execute(text("select * from orders o join users u on u.id = o.user_id")).fetchall()
+        capture_stmts.finish()
+        return capture_stmts
+
+    def test_file_store(self):
+        capture_stmts = self.capture(store_path=self.path, store_batch_size=3, max_statements=2)
+        self.assertEqual(len(capture_stmts.statements), 2)
+        del capture_stmts
+
+        store = CaptureStore.open(self.path)
+        self.assertEqual(store.count(), 11)
+        self.assertIsNotNone(store.get_info()["finished"])
+        # statement text is stored once per distinct statement
+        self.assertEqual(store.connection.execute("select count(*) from statement_text").fetchone()[0], 3)
+
+        self.assertEqual(store.count(sql_type="select"), 6)
+        self.assertEqual(store.count(table="orders"), 1)
+        self.assertEqual(store.count(table="users"), 11)
+        self.assertEqual(store.count(sql_type="insert", table="orders"), 0)
+
+        statements = list(store.query(sql_type="INSERT", order_by="duration", descending=True))
+        self.assertEqual(len(statements), 5)
+        self.assertGreaterEqual(statements[0].duration, statements[-1].duration)
+        self.assertEqual({stmt.fingerprint for stmt in statements}, {"INSERT INTO USERS VALUES (?+)"})
+        self.assertEqual("(0,)", [stmt for stmt in statements if stmt.idx == 1][0].parameters)
+
+        slowest = list(store.query(limit=1, order_by="duration", descending=True))[0]
+        self.assertEqual(store.count(min_duration=slowest.duration), 1)
+        self.assertEqual(store.count(max_duration=slowest.duration), 11)
+
+        last = list(store.query(order_by="started", descending=True, limit=1))[0]
+        self.assertEqual(last.idx, 11)
+        self.assertEqual(store.count(started_from=last.started), 1)
+        self.assertEqual(store.count(started_to=last.started), 10)
+        self.assertEqual(store.count(started_to=store.started), 0)
+
+        with self.assertRaises(Exception):
+            store.query(order_by="unknown")
+        store.close()
+
+        with self.assertRaises(Exception):
+            CaptureSqlStatements(self.engine, store_path=self.path)
+        with self.assertRaises(Exception):
+            CaptureStore.open(os.path.join(self.tmp_dir.name, "missing.db"))
+
+    def test_written_during_capture(self):
+        capture_stmts = CaptureSqlStatements(self.engine, store_path=self.path, store_batch_size=2)
+        for nr in range(5):
+            self.conn.execute(text(f"select {nr}")).fetchall()
+        store = CaptureStore.open(self.path)
+        # 4 have duration, 2 batches written
+        self.assertEqual(store.count(), 4)
+        self.assertIsNone(store.get_info()["finished"])
+        capture_stmts.finish()
+        self.assertEqual(store.count(), 5)
+        store.close()
+
+    def test_in_memory(self):
+        capture_stmts = self.capture()
+        self.assertEqual(capture_stmts.get_store().count(table="ORDERS"), 1)
+        cursor = capture_stmts.connection.cursor()
+        cursor.execute("select first_table, count(*) from sql_statement group by first_table order by 1")
+        self.assertEqual(cursor.fetchall(), [("ORDERS", 1), ("USERS", 10)])
+
+    def test_in_memory_during_capture(self):
+        capture_stmts = CaptureSqlStatements(self.engine)
+        for nr in range(3):
+            self.conn.execute(text(f"select {nr}")).fetchall()
+        store = capture_stmts.get_store()
+        # the last one has no duration yet
+        self.assertEqual(store.count(), 2)
+        self.conn.execute(text("select 3")).fetchall()
+        self.assertEqual([stmt.idx for stmt in store.query()], [1, 2, 3])
+        self.conn.execute(text("select 4")).fetchall()
+        self.assertIsNone(store.get_info()["finished"])
+        capture_stmts.finish()
+        self.assertIs(capture_stmts.get_store(), store)
+        self.assertEqual(store.count(), 5)
+        self.assertTrue(all(stmt.duration is not None for stmt in store.query()))
+        self.assertIsNotNone(store.get_info()["finished"])
+
+
+if __name__ == "__main__":
+    unittest.main()